@@ -0,0 +1,325 @@
+"""
+Jaye Hicks
+Obligatory legal disclaimer:
+  You are free to use this source code (this file and all other files
+  referenced in this file) "AS IS" WITHOUT WARRANTY OF ANY KIND, EITHER
+  EXPRESSED OR IMPLIED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+  WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE.
+  THE ENTIRE RISK AS TO THE QUALITY AND PERFORMANCE OF THIS SOURCE CODE
+  IS WITH YOU.  SHOULD THE SOURCE CODE PROVE DEFECTIVE, YOU ASSUME THE
+  COST OF ALL NECESSARY SERVICING, REPAIR OR CORRECTION. See the GNU
+  GENERAL PUBLIC LICENSE Version 3, 29 June 2007 for more details.
+
+This module provides rate limiting and deduplication for send_alerts.
+During an incident every invocation that hits the same error tends to
+publish the same alert.  An alert_limiter lets the first one through,
+suppresses identical (topic, message) alerts for dedup_window seconds,
+caps how many alerts per second reach each topic (token bucket), and
+folds the number suppressed into the next alert that does go out.
+
+Usage:
+  import alert_limiter, send_alerts
+  limiter = alert_limiter.alert_limiter(rate=0.2, burst=5,
+                                        dedup_window=300)   #global
+  a_sm = send_alerts.send_alerts(param, limiter=limiter)
+  for arn, counts in a_sm.results.items():
+    #counts['suppressed'] alerts were held back for each topic arn
+
+  #outside send_alerts: give the limiter back what a failed send used
+  message, ticket = limiter.acquire(arn, message)
+  if((message is not None) and (not publish(arn, message))):
+    limiter.release(ticket)
+
+  #share deduplication across concurrent containers
+  store   = alert_limiter.dynamodb_dedup_store('alert_dedup')
+  limiter = alert_limiter.alert_limiter(dedup_window=300, store=store)
+
+Be aware:
+  1) Create the alert_limiter at module level.  Its state lives in the
+     process, so it carries over between invocations a warm container
+     handles, but not across containers.  Only deduplication can be
+     shared across containers, through a shared dedup store
+
+  2) dynamodb_dedup_store expects a table with a partition key named
+     'fingerprint' of type string.  Enable TTL on the attribute named
+     'expiry' to have stale fingerprints removed
+
+  3) A store that cannot be reached lets the alert through; losing an
+     alert is worse than sending a duplicate
+
+  4) The token bucket is checked before the deduplication claim, so an
+     alert held back by the rate limit does not claim its fingerprint.
+     send_alerts releases the ticket of every alert it fails to publish:
+     the token and claim are given back, and the suppressed counts are
+     carried to the next alert instead
+
+Dependencies:
+  time
+  hashlib
+  threading
+  collections
+  aws_clients  (dynamodb_dedup_store only)
+"""
+import time
+import hashlib
+import threading
+import collections
+
+import aws_clients
+
+
+class local_dedup_store():
+  """
+  In-process deduplication state.  Thread safe, so it can also stand in
+  for a shared store in tests and benchmarks.
+  """
+  def __init__(self, max_keys=4096):
+    """
+    Args:
+      max_keys (int): fingerprints remembered; expired ones, then the
+                      oldest, are forgotten first
+    """
+    self.max_keys = max_keys
+    self.lock     = threading.Lock()
+    self._entries = collections.OrderedDict()   #key -> [expiry, suppressed]
+
+
+  def claim(self, key, window):
+    """
+    Claim the right to send the alert identified by key.
+
+    Args:
+      key    (str):   (topic, message) fingerprint
+      window (float): seconds the claim suppresses duplicates for
+
+    Returns:
+      (True, int)  claimed; int duplicates suppressed since the last claim
+      (False, 0)   a live claim exists; this duplicate was counted
+    """
+    now = time.time()
+    with self.lock:
+      entry = self._entries.get(key)
+      if((entry is not None) and (entry[0] > now)):
+        entry[1] += 1
+        return((False, 0))
+      suppressed = entry[1] if(entry is not None) else 0
+      self._entries[key] = [now + window, 0]
+      self._entries.move_to_end(key)
+      if(len(self._entries) > self.max_keys):
+        for stale in [k for k, (expiry, count) in self._entries.items()
+                      if(expiry <= now)]:
+          del self._entries[stale]
+        while(len(self._entries) > self.max_keys):
+          self._entries.popitem(last=False)
+    return((True, suppressed))
+
+
+  def release(self, key, suppressed=0):
+    """
+    Give back a claim whose alert was not sent.  The next duplicate can
+    claim right away and reports 'suppressed' more duplicates.
+    """
+    with self.lock:
+      entry = self._entries.get(key)
+      if(entry is None):
+        self._entries[key] = [0.0, suppressed]
+      else:
+        entry[0]  = 0.0
+        entry[1] += suppressed
+
+
+class dynamodb_dedup_store():
+  """
+  Deduplication state shared by every container through a DynamoDB
+  table, using a conditional put to claim a fingerprint.
+
+  if(dynamodb_dedup_store.issues):
+    #issue(s) occured reaching the table; alerts were let through
+  """
+  def __init__(self, table_name, dynamo_db_access=None):
+    """
+    Args:
+      table_name (str): table with a string partition key 'fingerprint'
+      dynamo_db_access: opt; DynamoDB service resource (e.g., a stub)
+    """
+    self.table_name       = table_name
+    self.dynamo_db_access = dynamo_db_access
+    self.issues           = []
+
+
+  def _table(self):
+    dynamo_db_access = self.dynamo_db_access
+    if(dynamo_db_access is None):
+      dynamo_db_access = aws_clients.get_resource('dynamodb')
+    return(dynamo_db_access.Table(self.table_name))
+
+
+  def claim(self, key, window):
+    """
+    Same contract as local_dedup_store.claim().  The previous item's
+    'suppressed' count comes back from the conditional put itself
+    (ReturnValues='ALL_OLD'); a failed condition adds 1 to it instead.
+    """
+    from boto3.dynamodb.conditions import Attr
+    now    = int(time.time())
+    expiry = now + max(1, int(window + 0.5))
+    try:
+      table = self._table()
+      try:
+        resp = table.put_item(
+          Item={'fingerprint': key, 'expiry': expiry, 'suppressed': 0},
+          ConditionExpression=(Attr('fingerprint').not_exists() |
+                               Attr('expiry').lte(now)),
+          ReturnValues='ALL_OLD')
+        return((True, int(resp.get('Attributes', {}).get('suppressed', 0))))
+      except Exception as e:
+        code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+        if(code != 'ConditionalCheckFailedException'):
+          raise
+      table.update_item(Key={'fingerprint': key},
+                        UpdateExpression='ADD suppressed :one',
+                        ExpressionAttributeValues={':one': 1})
+      return((False, 0))
+    except Exception as e:
+      self.issues.append('Exception thrown reaching dedup table ' +
+                         self.table_name + '. Exception: ' + str(e))
+      print('Exception thrown reaching dedup table ' + self.table_name +
+            '. Exception: ' + str(e))
+      return((True, 0))
+
+
+  def release(self, key, suppressed=0):
+    """
+    Same contract as local_dedup_store.release()
+    """
+    try:
+      self._table().update_item(
+        Key={'fingerprint': key},
+        UpdateExpression='SET expiry = :now ADD suppressed :count',
+        ExpressionAttributeValues={':now': int(time.time()), 
+                                   ':count': suppressed})
+    except Exception as e:
+      self.issues.append('Exception thrown releasing a claim in dedup ' +
+                         'table ' + self.table_name + '. Exception: ' + 
+                         str(e))
+      print('Exception thrown releasing a claim in dedup table ' + 
+            self.table_name + '. Exception: ' + str(e))
+
+
+class alert_limiter():
+  """
+  Per topic token bucket plus per (topic, message) deduplication.
+  Thread safe; share one object between send_alerts calls.
+  """
+  def __init__(self, rate=None, burst=1, dedup_window=None, store=None):
+    """
+    Args:
+      rate         (float): opt; alerts per second allowed per topic
+      burst        (int):   alerts a topic may receive back to back
+      dedup_window (float): opt; seconds identical alerts are suppressed
+      store:                opt; dedup store shared across containers
+                            (default: a local_dedup_store)
+    """
+    self.rate         = rate
+    self.burst        = burst
+    self.dedup_window = dedup_window
+    self.store        = store if(store is not None) else local_dedup_store()
+    self.lock         = threading.Lock()
+    self._buckets     = {}       #arn -> [tokens, time.monotonic()]
+    self._suppressed  = {}       #arn -> alerts rate limited since last sent
+
+
+  def fingerprint(self, arn, message):
+    return(arn + '|' + hashlib.sha256(message.encode('utf-8')).hexdigest())
+
+
+  def _take_token(self, arn):
+    """
+    Callers must hold self.lock.
+    """
+    now    = time.monotonic()
+    bucket = self._buckets.get(arn)
+    if(bucket is None):
+      bucket = self._buckets[arn] = [float(self.burst), now]
+    bucket[0] = min(float(self.burst),
+                    bucket[0] + (now - bucket[1]) * self.rate)
+    bucket[1] = now
+    if(bucket[0] >= 1.0):
+      bucket[0] -= 1.0
+      return(True)
+    return(False)
+
+
+  def _give_token(self, arn):
+    """
+    Callers must hold self.lock.
+    """
+    bucket = self._buckets.get(arn)
+    if(bucket is not None):
+      bucket[0] = min(float(self.burst), bucket[0] + 1.0)
+
+
+  def acquire(self, arn, message):
+    """
+    Decide whether an alert may be published.  The token bucket is 
+    checked first; only an alert it lets through claims its 
+    deduplication fingerprint.
+
+    Args:
+      arn     (str): topic arn
+      message (str): alert text
+
+    Returns:
+      (None, None) if the alert is suppressed, otherwise (the message to
+      publish, ticket).  The message is the original text, followed by a
+      note on how many alerts were suppressed since the last one sent,
+      if any.  Pass the ticket to release() if the publish fails
+    """
+    with self.lock:
+      if(self.rate and (not self._take_token(arn))):
+        self._suppressed[arn] = self._suppressed.get(arn, 0) + 1
+        return((None, None))
+    key, deduped = None, 0
+    if(self.dedup_window):
+      key = self.fingerprint(arn, message)
+      claimed, deduped = self.store.claim(key, self.dedup_window)
+      if(not claimed):
+        if(self.rate):
+          with self.lock:
+            self._give_token(arn)
+        return((None, None))
+    with self.lock:
+      limited = self._suppressed.pop(arn, 0)
+    ticket     = (arn, key, deduped, limited)
+    suppressed = deduped + limited
+    if(suppressed):
+      message += ('\n\n(' + str(suppressed) + ' similar or rate limited ' +
+                  'alerts were suppressed since the last one sent)')
+    return((message, ticket))
+
+
+  def release(self, ticket):
+    """
+    Give back what acquire() took for an alert that was not sent: its
+    token, its deduplication claim and the suppressed counts it carried
+    """
+    if(ticket is None):
+      return
+    arn, key, deduped, limited = ticket
+    with self.lock:
+      if(self.rate):
+        self._give_token(arn)
+      if(limited):
+        self._suppressed[arn] = self._suppressed.get(arn, 0) + limited
+    if(key is not None):
+      self.store.release(key, deduped)
+
+
+  def check(self, arn, message):
+    """
+    acquire() without the ticket, for callers that never release
+
+    Returns:
+      None if the alert is suppressed, otherwise the message to publish
+    """
+    return(self.acquire(arn, message)[0])
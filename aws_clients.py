@@ -0,0 +1,203 @@
+"""
+Jaye Hicks
+Obligatory legal disclaimer:
+  You are free to use this source code (this file and all other files
+  referenced in this file) "AS IS" WITHOUT WARRANTY OF ANY KIND, EITHER
+  EXPRESSED OR IMPLIED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+  WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE.
+  THE ENTIRE RISK AS TO THE QUALITY AND PERFORMANCE OF THIS SOURCE CODE
+  IS WITH YOU.  SHOULD THE SOURCE CODE PROVE DEFECTIVE, YOU ASSUME THE
+  COST OF ALL NECESSARY SERVICING, REPAIR OR CORRECTION. See the GNU
+  GENERAL PUBLIC LICENSE Version 3, 29 June 2007 for more details.
+
+This module provides a process wide registry of boto3 clients and
+resources shared by sys_log and send_alerts.  Creating a boto3 client
+resolves credentials, loads endpoint data and builds a new HTTP
+connection pool.  The AWS Lambda service reuses warm containers, so the
+registry creates each client / resource once, on first use, and hands
+the same object back on every later call (and every later invocation).
+
+Usage:
+  import aws_clients
+  sns = aws_clients.get_client('sns')
+  dynamo_db_access = aws_clients.get_resource('dynamodb')
+  aws_clients.set_max_pool_connections(25)  #also invalidates
+  aws_clients.invalidate()                  #e.g., after rotating creds
+  aws_clients.prewarm()                     #optional; see note 3
+  resp = await aws_clients.call_async(sns.publish, TargetArn=arn, 
+                                      Message='an alert')
+
+Be aware:
+  1) boto3 clients are thread safe, boto3 resources are not.  Share a
+     resource across threads only for calls that do not mutate it
+     (e.g., batch_write_item())
+     
+  2) call_async() is the async AWS client layer used by the asyncio 
+     APIs of sys_log and send_alerts.  boto3 itself is blocking, so each
+     call runs on a shared thread pool sized to max_pool_connections; 
+     many calls can be awaited concurrently from one event loop
+     
+  3) boto3 / botocore take a large share of a cold start to import.
+     This module imports them on the first get_client() / get_resource()
+     call, so invocations that never reach AWS never pay for them.  
+     prewarm() pays the import and client construction cost up front,
+     e.g., from module level code that runs during Lambda initialization
+
+Dependencies:
+  functools
+  threading
+  boto3     (imported on first use)
+  botocore  (imported on first use)
+  asyncio, concurrent.futures  (imported by call_async())
+"""
+import functools
+import threading
+
+
+_lock                 = threading.Lock()
+_session              = None
+_clients              = {}
+_resources            = {}
+_executor             = None
+_max_pool_connections = 10       #botocore default
+
+
+def set_max_pool_connections(count):
+  """
+  Set the size of the HTTP connection pool used by clients / resources
+  created from now on.  Raise it when publishing or writing from many
+  threads at once.  Existing clients are invalidated so the new size
+  takes effect.
+
+  Args:
+    count (int): maximum number of pooled HTTP connections per client
+  """
+  global _max_pool_connections
+  if((type(count) != int) or (count < 1)):
+    raise ValueError('Invalid max_pool_connections value')
+  _max_pool_connections = count
+  invalidate()
+
+
+def invalidate():
+  """
+  Drop the cached session and every cached client / resource.  The
+  next get_client() / get_resource() call builds fresh ones.
+  """
+  global _session, _executor
+  with _lock:
+    _session = None
+    _clients.clear()
+    _resources.clear()
+    if(_executor is not None):
+      _executor.shutdown(wait=False)
+      _executor = None
+
+
+def _get_session():
+  """
+  Callers must hold _lock.
+  """
+  global _session
+  if(_session is None):
+    import boto3.session
+    _session = boto3.session.Session()
+  return(_session)
+
+
+def _config():
+  from botocore.config import Config
+  return(Config(max_pool_connections=_max_pool_connections))
+
+
+def get_client(service):
+  """
+  Args:
+    service (str): AWS service name (e.g., 'sns')
+
+  Returns:
+    shared boto3 client for the service
+  """
+  client = _clients.get(service)
+  if(client is None):
+    with _lock:
+      client = _clients.get(service)
+      if(client is None):
+        client = _get_session().client(service, config=_config())
+        _clients[service] = client
+  return(client)
+
+
+def get_resource(service):
+  """
+  Args:
+    service (str): AWS service name (e.g., 'dynamodb')
+
+  Returns:
+    shared boto3 service resource for the service
+  """
+  resource = _resources.get(service)
+  if(resource is None):
+    with _lock:
+      resource = _resources.get(service)
+      if(resource is None):
+        resource = _get_session().resource(service, config=_config())
+        _resources[service] = resource
+  return(resource)
+
+
+def prewarm(clients=('sns',), resources=('dynamodb',)):
+  """
+  Import boto3 and build the shared clients / resources now rather than
+  on the first AWS call.  Errors are printed, not raised; the next 
+  get_client() / get_resource() call simply tries again.
+
+  Args:
+    clients   [str]: services to build clients for
+    resources [str]: services to build resources for
+
+  Returns:
+    True  if everything was built
+    False otherwise
+  """
+  results = True
+  for build, services in ((get_client, clients), (get_resource, resources)):
+    for service in services:
+      try:
+        build(service)
+      except Exception as e:
+        results = False
+        print('Could not prewarm ' + service + '. Exception: ' + str(e))
+  return(results)
+
+
+def _get_executor():
+  global _executor
+  executor = _executor
+  if(executor is None):
+    with _lock:
+      if(_executor is None):
+        import concurrent.futures
+        _executor = concurrent.futures.ThreadPoolExecutor(
+          max_workers=_max_pool_connections, thread_name_prefix='aws_clients')
+      executor = _executor
+  return(executor)
+
+
+async def call_async(function, *args, **kwargs):
+  """
+  Await a blocking boto3 call (e.g., client.publish) without blocking
+  the event loop.
+
+  Args:
+    function: callable to run, typically a bound client / resource method
+    args, kwargs: passed through to function
+
+  Returns:
+    whatever function returns; exceptions propagate to the awaiter
+  """
+  import asyncio
+  loop = asyncio.get_running_loop()
+  return(await loop.run_in_executor(_get_executor(), 
+                                    functools.partial(function, *args, 
+                                                      **kwargs)))
@@ -0,0 +1,956 @@
+"""
+Jaye Hicks
+Obligatory legal disclaimer:
+  You are free to use this source code (this file and all other files
+  referenced in this file) "AS IS" WITHOUT WARRANTY OF ANY KIND, EITHER
+  EXPRESSED OR IMPLIED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+  WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE.
+  THE ENTIRE RISK AS TO THE QUALITY AND PERFORMANCE OF THIS SOURCE CODE
+  IS WITH YOU.  SHOULD THE SOURCE CODE PROVE DEFECTIVE, YOU ASSUME THE
+  COST OF ALL NECESSARY SERVICING, REPAIR OR CORRECTION. See the GNU
+  GENERAL PUBLIC LICENSE Version 3, 29 June 2007 for more details.
+
+Python module with simple benchmarks for sys_log and send_alerts.  None
+of the benchmarks talk to AWS; DynamoDB and SNS are replaced by the
+stand-ins in local_aws, with injectable latency and throttling.  Run 
+this module directly from the command line and read the printed 
+results.  --json writes every result to a file so runs can be compared
+over time; --quick shrinks every benchmark for a fast smoke run.  The
+run exits with status 1 if importing sys_log / send_alerts pulls in 
+boto3, botocore or asyncio (see bench_import_time()), or if one of the
+check_*() functions reports a failed check.
+
+  python benchmark.py
+  python benchmark.py --quick --json results.json
+
+Dependencies:
+  io
+  os
+  sys
+  json
+  time
+  platform
+  argparse
+  tempfile
+  subprocess
+  threading
+  asyncio
+  contextlib
+  tracemalloc
+  boto3
+  botocore
+  sys_log
+  log_codec
+  log_reader
+  log_metrics
+  local_aws
+  aws_clients
+  send_alerts
+"""
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import threading
+import asyncio
+import contextlib
+import tracemalloc
+
+import boto3
+from   botocore.stub import Stubber
+
+import sys_log
+import log_codec
+import log_reader
+import log_metrics
+import local_aws
+import aws_clients
+import send_alerts
+
+
+def bench_log_message(count=10000, legacy_calls=2):
+  """
+  Measure the cost of sys_log.log_message() per call.  The legacy cost
+  is measured by sleeping for 1 second per call, which is exactly what
+  log_message() used to do to keep its sort keys unique.
+
+  Args:
+    count        (int): number of messages to log
+    legacy_calls (int): number of legacy (1 second) calls to time
+
+  Returns:
+    {} with per call cost in seconds for the current and legacy paths
+  """
+  sl = sys_log.sys_log('bench', 'info_table', 'errors_table', '', '')
+  start = time.perf_counter()
+  for i in range(count):
+    sl.log_message(str(i), 'INFO', 'benchmark message', '')
+  current = (time.perf_counter() - start) / count
+
+  legacy = 0.0
+  if(legacy_calls):
+    start = time.perf_counter()
+    for i in range(legacy_calls):
+      time.sleep(1)
+    legacy = (time.perf_counter() - start) / legacy_calls
+
+  if(len(sl.info_messages) != count):
+    print('Sort key collision detected: ' + str(len(sl.info_messages)) +
+          ' keys for ' + str(count) + ' messages')
+  return({'current': current, 'legacy': legacy})
+
+
+def bench_log_message_memory(count=1000000):
+  """
+  Latency and allocations of sys_log.log_message() over a large number
+  of calls.  Latency is timed in one pass, allocations are traced with
+  tracemalloc in a second pass (tracing slows every call down).
+
+  Args:
+    count (int): number of messages to log
+
+  Returns:
+    {} with per call latency (s), allocated bytes per buffered record
+    and tracemalloc's peak (bytes)
+  """
+  sl = sys_log.sys_log('bench', 'info_table', 'errors_table', '', '')
+  start = time.perf_counter()
+  for i in range(count):
+    sl.log_message('12', 'INFO', 'benchmark message', '')
+  latency = (time.perf_counter() - start) / count
+  sl.reset()
+
+  tracemalloc.start()
+  before = tracemalloc.get_traced_memory()[0]
+  for i in range(count):
+    sl.log_message('12', 'INFO', 'benchmark message', '')
+  current, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return({'latency': latency, 
+          'bytes_per_record': (current - before) / count,
+          'peak': peak})
+
+
+def bench_spool(count=20000):
+  """
+  Cost of sys_log.log_message() with and without the write-ahead spool
+
+  Args:
+    count (int): number of messages to log
+
+  Returns:
+    {} with per call latency (s) without and with a spool
+  """
+  results = {}
+  with tempfile.TemporaryDirectory() as spool_dir:
+    for name, directory in (('plain', None), ('spooled', spool_dir)):
+      sl = sys_log.sys_log('bench', 'info_table', 'errors_table', '', '',
+                           spool_dir=directory)
+      start = time.perf_counter()
+      for i in range(count):
+        sl.log_message('12', 'INFO', 'benchmark message', '')
+      results[name] = (time.perf_counter() - start) / count
+      if(sl.spool is not None):
+        sl.spool.close()
+  return(results)
+
+
+def _legacy_put_loop(sl, dynamo_db_access):
+  """
+  The per message put_item() loop save_messages_to_db() used before
+  writes were batched.  Kept here only as a point of comparison.
+  """
+  table = dynamo_db_access.Table(sl.errors_table)
+  for key, record in sl.error_messages.items():
+    table.put_item(Item={'date': record.date, 'stamp_mod': key,
+                         'message': record.message})
+  table = dynamo_db_access.Table(sl.info_table)
+  for key, record in sl.info_messages.items():
+    table.put_item(Item={'date': record.date, 'stamp_mod': key,
+                         'message': record.message,
+                         'expiry': record.seconds + sl.TTL})
+
+
+def bench_save_messages(count=200, latency=0.002, unprocessed_rate=0.0):
+  """
+  Compare round trips and wall time of the legacy put_item() loop with
+  the batched save_messages_to_db(), using a local DynamoDB stub that 
+  adds 'latency' seconds to every call.
+
+  Args:
+    count            (int):   number of messages buffered, 1 in 10 ERROR
+    latency          (float): seconds per simulated round trip
+    unprocessed_rate (float): fraction of batched items handed back
+
+  Returns:
+    {} with round trips and wall time for the legacy and batched paths
+  """
+  sl = sys_log.sys_log('bench', 'info_table', 'errors_table', '', '')
+  for i in range(count):
+    sl.log_message(str(i), 'ERROR' if(i % 10 == 0) else 'INFO',
+                   'benchmark message', '')
+
+  legacy_db = local_aws.local_dynamodb(latency=latency)
+  start = time.perf_counter()
+  _legacy_put_loop(sl, legacy_db)
+  legacy_time = time.perf_counter() - start
+
+  batch_db = local_aws.local_dynamodb(latency=latency,
+                                      unprocessed_rate=unprocessed_rate,
+                                      seed=1)
+  start = time.perf_counter()
+  sl.save_messages_to_db(batch_db)
+  batch_time = time.perf_counter() - start
+
+  return({'legacy_round_trips': legacy_db.calls['put_item'],
+          'legacy_time': legacy_time,
+          'batch_round_trips': batch_db.calls['batch_write_item'],
+          'batch_time': batch_time,
+          'flush_report': sl.flush_report})
+
+
+def _fake_aws_environment():
+  """
+  Region and credentials so boto3 can build clients without AWS access
+  """
+  os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+  os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+  os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+
+def bench_client_reuse(rounds=20):
+  """
+  Compare building a new SNS client for every publish (cold, what
+  send_alerts used to do) with the shared client from aws_clients 
+  (warm).  Publishes are answered by a botocore Stubber so no request
+  leaves the process.
+
+  Args:
+    rounds (int): number of simulated invocations
+
+  Returns:
+    {} with average seconds per invocation for the cold and warm paths
+  """
+  _fake_aws_environment()
+  arn      = 'arn:aws:sns:us-east-1:123456789012:MyAlerts'
+  response = {'MessageId': '1'}
+  expected = {'TargetArn': arn, 'Message': 'benchmark'}
+
+  start = time.perf_counter()
+  for i in range(rounds):
+    client = boto3.client('sns')
+    with Stubber(client) as stubber:
+      stubber.add_response('publish', response, expected)
+      client.publish(TargetArn=arn, Message='benchmark')
+  cold = (time.perf_counter() - start) / rounds
+
+  aws_clients.invalidate()
+  client = aws_clients.get_client('sns')      #first (cold) build not timed
+  with Stubber(client) as stubber:
+    for i in range(rounds):
+      stubber.add_response('publish', response, expected)
+    start = time.perf_counter()
+    for i in range(rounds):
+      aws_clients.get_client('sns').publish(TargetArn=arn, 
+                                            Message='benchmark')
+    warm = (time.perf_counter() - start) / rounds
+  aws_clients.invalidate()
+  return({'cold': cold, 'warm': warm})
+
+
+def bench_async(count=200, topics=5, latency=0.01):
+  """
+  Compare the blocking and asyncio APIs of sys_log and send_alerts 
+  against local stand-ins for DynamoDB and SNS.
+
+  Args:
+    count   (int):   number of messages buffered, 1 in 10 ERROR
+    topics  (int):   number of SNS topics alerted
+    latency (float): seconds per simulated round trip
+
+  Returns:
+    {} with wall time of the blocking and async flush / alert paths
+  """
+  sl = sys_log.sys_log('bench', 'info_table', 'errors_table', '', '')
+  for i in range(count):
+    sl.log_message(str(i), 'ERROR' if(i % 10 == 0) else 'INFO',
+                   'benchmark message', '')
+  params = [{'channel': 'sns', 'message': 'benchmark alert',
+             'topic_arns': ['arn:aws:sns:us-east-1:123456789012:Topic' + 
+                            str(i) for i in range(topics)]}]
+  aws_clients.invalidate()
+  aws_clients._clients['sns'] = local_aws.local_sns(latency=latency)
+  results = {}
+
+  start = time.perf_counter()
+  sl.save_messages_to_db(local_aws.local_dynamodb(latency=latency))
+  send_alerts.send_alerts(params)
+  results['blocking'] = time.perf_counter() - start
+
+  async def run_async():
+    db = local_aws.local_dynamodb(latency=latency)
+    await asyncio.gather(sl.save_messages_to_db_async(db),
+                         send_alerts.send_alerts.create_async(params))
+  start = time.perf_counter()
+  asyncio.run(run_async())
+  results['async'] = time.perf_counter() - start
+  aws_clients.invalidate()
+  return(results)
+
+
+def check_async(count=50, latency=0.001, publish_timeout=0.05):
+  """
+  Check, against local stand-ins for DynamoDB and SNS, what the asyncio
+  APIs of sys_log and send_alerts leave behind: the items written, 
+  flush_report, alert results and issues, a publish that times out and
+  a flush that fails.
+
+  Args:
+    count           (int):   number of messages logged, 1 in 10 ERROR
+    latency         (float): seconds per simulated round trip
+    publish_timeout (float): seconds allowed per publish; one topic's 
+                             publish takes ten times as long
+
+  Returns:
+    [str] description of every failed check (empty if all passed)
+  """
+  failures = []
+  def check(passed, description):
+    if(not passed):
+      failures.append(description)
+
+  prefix = 'arn:aws:sns:us-east-1:123456789012:'
+  ok, slow, bad = prefix + 'Ok', prefix + 'Slow', prefix + 'Bad'
+  params = [{'channel': 'sns', 'message': 'check alert', 
+             'topic_arns': [ok, slow, bad]}]
+  db  = local_aws.local_dynamodb(latency=latency)
+  sns = local_aws.local_sns(latency=latency, failing=[bad],
+                            topic_latency={slow: publish_timeout * 10})
+  aws_clients.invalidate()
+  aws_clients._clients['sns'] = sns
+  sl = sys_log.sys_log('check', 'info_table', 'errors_table', '', '')
+  broken = sys_log.sys_log('check', 'info_table', 'errors_table', '', '')
+
+  async def run_async():
+    for i in range(count):
+      level = 'ERROR' if(i % 10 == 0) else 'INFO'
+      await sl.log_message_async(str(i), level, 'check message ' + str(i),
+                                 '')
+      await broken.log_message_async(str(i), level, 'check message', '')
+    saved  = await sl.save_messages_to_db_async(db)
+    failed = await broken.save_messages_to_db_async(object())
+    alerts = await send_alerts.send_alerts.create_async(
+               params, publish_timeout=publish_timeout)
+    return(saved, failed, alerts)
+  try:
+    saved, failed, alerts = asyncio.run(run_async())
+  finally:
+    aws_clients.invalidate()
+
+  errors = (count + 9) // 10
+  check(saved, 'save_messages_to_db_async() returned False')
+  check(not sl.run_issues, 'sys_log issues: ' + str(sl.run_issues))
+  check(sl.flush_report == {'errors_table': {'written': errors, 
+                                             'failed': 0},
+                            'info_table':   {'written': count - errors, 
+                                             'failed': 0}},
+        'flush_report: ' + str(sl.flush_report))
+  written = {}
+  for table in ('errors_table', 'info_table'):
+    for item in db.tables.get(table, {}).values():
+      item = log_codec.decode_item(item)
+      written[item['locator']] = (table, item['level'], item['message'])
+  expected = {}
+  for i in range(count):
+    level = 'ERROR' if(i % 10 == 0) else 'INFO'
+    expected[str(i)] = ('errors_table' if(level == 'ERROR') else 
+                        'info_table', level, level + ': (' + str(i) + 
+                        ') check message ' + str(i))
+  check(written == expected, 'items written do not match those logged')
+  check(failed is False, 
+        'save_messages_to_db_async() did not report a failed flush')
+  check(broken.flush_report == {'errors_table': {'written': 0, 
+                                                 'failed': errors},
+                                'info_table':   {'written': 0, 
+                                                 'failed': count - errors}},
+        'flush_report of failed flush: ' + str(broken.flush_report))
+  check(broken.run_issues, 'failed flush left no sys_log issue')
+
+  check(alerts.results.get(ok) == {'sent': 1, 'failed': 0, 
+                                   'suppressed': 0},
+        'results of ' + ok + ': ' + str(alerts.results.get(ok)))
+  for arn in (slow, bad):
+    check(alerts.results.get(arn) == {'sent': 0, 'failed': 1, 
+                                      'suppressed': 0},
+          'results of ' + arn + ': ' + str(alerts.results.get(arn)))
+  check(len(alerts.issues) == 2, 'send_alerts issues: ' + 
+        str(alerts.issues))
+  check(any(('timed out' in issue) and issue.endswith(slow) 
+            for issue in alerts.issues), 'no timeout issue for ' + slow)
+  check(any(issue.endswith(bad) and ('timed out' not in issue)
+            for issue in alerts.issues), 'no publish issue for ' + bad)
+  check(sns.published == [(ok, 'check alert')],
+        'published: ' + str(sns.published))
+  return(failures)
+
+
+def check_spool(count=1000, max_bytes=4000):
+  """
+  Check that the write-ahead spool stays within spool_max_bytes when 
+  every DynamoDB write fails, so nothing is ever acknowledged, and that
+  the newest messages are still replayed from it.
+
+  Args:
+    count     (int): number of messages logged
+    max_bytes (int): spool_max_bytes; far less than count messages need
+
+  Returns:
+    [str] description of every failed check (empty if all passed)
+  """
+  failures = []
+  def check(passed, description):
+    if(not passed):
+      failures.append(description)
+
+  with tempfile.TemporaryDirectory() as spool_dir:
+    sl = sys_log.sys_log('check', 'info_table', 'errors_table', '', '',
+                         spool_dir=spool_dir, spool_max_bytes=max_bytes)
+    sl.MAX_BATCH_RETRIES = 0                      #fail without backing off
+    largest = 0
+    for i in range(count):
+      sl.log_message(str(i), 'INFO', 'check message ' + str(i), '')
+      if(i % 100 == 99):
+        check(not sl.save_messages_to_db(object()), 
+              'save_messages_to_db() did not report a failed flush')
+        largest = max(largest, os.path.getsize(sl.spool.path))
+    check(largest <= max_bytes, 'spool grew to ' + str(largest) + 
+          ' bytes; spool_max_bytes is ' + str(max_bytes))
+    check(sl.spool.dropped > 0, 'spool dropped no entries')
+    kept = count - sl.spool.dropped
+    sl.spool.close()
+
+    replayed = sys_log.sys_log('check', 'info_table', 'errors_table', '', 
+                               '', spool_dir=spool_dir, 
+                               spool_max_bytes=max_bytes)
+    locators = sorted(int(record.locator) for record 
+                      in replayed.info_messages.values())
+    check(len(locators) == kept, 'replayed ' + str(len(locators)) + 
+          ' messages; the spool kept ' + str(kept))
+    check(locators == list(range(count - len(locators), count)),
+          'replayed messages are not the newest ones')
+    replayed.spool.close()
+  return(failures)
+
+
+def check_reader():
+  """
+  Check log_reader.query()'s module, level and locator filters, alone 
+  and together, against a local stand-in for DynamoDB.  The table also
+  holds items with legacy '<secs>+<module>' sort keys.
+
+  Returns:
+    [str] description of every failed check (empty if all passed)
+  """
+  failures = []
+  db       = local_aws.local_dynamodb()
+  day      = '2021-04-10'
+  expected = []                         #(module, level, locator) per item
+  for number, module in enumerate(('orders', 'orders_v2') * 30):
+    level   = ('INFO', 'WARN', 'ERROR')[number % 3]
+    locator = ('x', 'y', 'xy')[number // 3 % 3]
+    if(number % 4 == 0):
+      stamp_mod = str(1618000000 + number) + '+' + module
+    else:
+      stamp_mod = (str(1618000000 + number) + '+' + module + '+000001.' + 
+                   str(number).zfill(10) + '.check')
+    db._store('errors_table', {'date': day, 'stamp_mod': stamp_mod, 
+                               'message': level + ': (' + locator + 
+                                          ') check message'})
+    expected.append((module, level, locator))
+  reader = log_reader.log_reader('info_table', 'errors_table', -6, db)
+  for filters in ({'locator': 'x'}, {'locator': 'xy'}, 
+                  {'levels': ['ERROR', 'WARN']}, {'module': 'orders'},
+                  {'locator': 'y', 'levels': ['INFO']},
+                  {'module': 'orders', 'locator': 'x', 
+                   'levels': ['ERROR']}):
+    wanted = sum(1 for module, level, locator in expected
+                 if((filters.get('module', module) == module) and
+                    (level in filters.get('levels', [level])) and
+                    (filters.get('locator', locator) == locator)))
+    found  = len(list(reader.query(day, day, tables=('errors',), 
+                                   **filters)))
+    if(found != wanted):
+      failures.append('query(' + str(filters) + ') returned ' + str(found) +
+                      ' items, not ' + str(wanted))
+  if(reader.issues):
+    failures.append('log_reader issues: ' + str(reader.issues))
+  return(failures)
+
+
+def check_metrics(count=2000):
+  """
+  Check that every histogram log_metrics.emit() prints stays within 
+  EMF's limit of 100 values per metric, and keeps the count and sum of
+  what was observed, when far more distinct values are observed.
+
+  Args:
+    count (int): observations, spread over several orders of magnitude
+
+  Returns:
+    [str] description of every failed check (empty if all passed)
+  """
+  failures = []
+  metrics  = log_metrics.log_metrics('check')
+  observed = {}
+  for i in range(count):
+    for name, value in (('latency', 0.5 * 1.01 ** i), 
+                        ('spread', (i * 7919) % 100003 / 10)):
+      metrics.observe(name, value)
+      observed.setdefault(name, []).append(float('%.2g' % value))
+  with contextlib.redirect_stdout(io.StringIO()):
+    lines = metrics.emit()
+  document = json.loads(lines[0])
+  for name, values in observed.items():
+    histogram = document[name]
+    if(len(set(values)) <= 100):
+      failures.append(name + ': only ' + str(len(set(values))) + 
+                      ' distinct values observed')
+    if(len(histogram['Values']) > 100):
+      failures.append(name + ': ' + str(len(histogram['Values'])) +
+                      ' values emitted')
+    if(sum(histogram['Counts']) != len(values)):
+      failures.append(name + ': counts add up to ' + 
+                      str(sum(histogram['Counts'])) + ', not ' + 
+                      str(len(values)))
+    total = sum(value * count for value, count 
+                in zip(histogram['Values'], histogram['Counts']))
+    if(abs(total - sum(values)) > 1e-6 * sum(values)):
+      failures.append(name + ': sum is ' + str(total) + ', not ' + 
+                      str(sum(values)))
+  return(failures)
+
+
+def _stats(values):
+  """
+  Returns:
+    {} with count, mean, p50, p95 and max of a list of numbers
+  """
+  values = sorted(values)
+  if(not values):
+    return({'count': 0, 'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'max': 0.0})
+  return({'count': len(values),
+          'mean':  sum(values) / len(values),
+          'p50':   values[(len(values) - 1) // 2],
+          'p95':   values[min(len(values) - 1, int(len(values) * 0.95))],
+          'max':   values[-1]})
+
+
+def bench_throughput(count=50000):
+  """
+  Messages per second sys_log.log_message() sustains from one thread, 
+  with and without metrics (see log_metrics).
+
+  Args:
+    count (int): number of messages to log per run
+
+  Returns:
+    {} with messages per second for the plain and metrics runs
+  """
+  results = {}
+  for name, metrics in (('plain', None), ('metrics', True)):
+    sl = sys_log.sys_log('bench', 'info_table', 'errors_table', '', '',
+                         metrics=metrics)
+    start = time.perf_counter()
+    for i in range(count):
+      sl.log_message('12', 'INFO', 'benchmark message', '')
+    results[name] = count / (time.perf_counter() - start)
+  return(results)
+
+
+def bench_flush_scaling(counts=(100, 500, 1000, 5000), latency=0.002,
+                        throttle_rate=0.0):
+  """
+  Wall time of save_messages_to_db() against the number of buffered 
+  messages.
+
+  Args:
+    counts        [int]: buffered message counts to time, 1 in 10 ERROR
+    latency       (float): seconds per simulated round trip
+    throttle_rate (float): fraction of BatchWriteItem calls throttled
+
+  Returns:
+    [{}] per count: wall time, round trips, throttled calls and the 
+    flush report
+  """
+  results = []
+  for count in counts:
+    sl = sys_log.sys_log('bench', 'info_table', 'errors_table', '', '')
+    for i in range(count):
+      sl.log_message(str(i), 'ERROR' if(i % 10 == 0) else 'INFO',
+                     'benchmark message', '')
+    db = local_aws.local_dynamodb(latency=latency, seed=1,
+                                  throttle_rate=throttle_rate)
+    start = time.perf_counter()
+    sl.save_messages_to_db(db)
+    results.append({'messages':     count,
+                    'time':         time.perf_counter() - start,
+                    'round_trips':  db.calls['batch_write_item'],
+                    'throttled':    db.throttled,
+                    'flush_report': sl.flush_report})
+  return(results)
+
+
+def bench_fan_out(topic_counts=(1, 5, 20, 50), latency=0.02,
+                  throttle_rate=0.0):
+  """
+  Latency of send_alerts publishing one message to many SNS topics, 
+  one after another and concurrently.
+
+  Args:
+    topic_counts  [int]:   numbers of topics to alert
+    latency       (float): seconds per simulated publish
+    throttle_rate (float): fraction of publishes throttled
+
+  Returns:
+    [{}] per topic count: sequential and concurrent wall time and the
+    number of failed publishes
+  """
+  results = []
+  for topics in topic_counts:
+    params = [{'channel': 'sns', 'message': 'benchmark alert',
+               'topic_arns': ['arn:aws:sns:us-east-1:123456789012:Topic' + 
+                              str(i) for i in range(topics)]}]
+    result = {'topics': topics}
+    for name, concurrent in (('sequential', False), ('concurrent', True)):
+      aws_clients.invalidate()
+      aws_clients._clients['sns'] = local_aws.local_sns(
+        latency=latency, throttle_rate=throttle_rate, seed=1)
+      start = time.perf_counter()
+      alert = send_alerts.send_alerts(params, concurrent=concurrent, 
+                                      max_workers=16)
+      result[name] = time.perf_counter() - start
+      result[name + '_failed'] = sum(counts['failed'] for counts 
+                                     in alert.results.values())
+    results.append(result)
+  aws_clients.invalidate()
+  return(results)
+
+
+def bench_invocations(containers=8, invocations=25, messages=20, 
+                      latency=0.002, cold_start=0.05, throttle_rate=0.0):
+  """
+  Simulate many concurrent AWS Lambda invocations.  Each container is a
+  thread running invocations one after another; its first invocation 
+  is cold (cold_start seconds of simulated runtime start up, a new 
+  sys_log object) and the rest are warm (the global sys_log object is 
+  reset() and reused).  Every invocation logs 'messages' messages, 
+  flushes them and, when one of them is an ERROR, sends an alert.  All
+  containers share one DynamoDB and one SNS stand-in.
+
+  Args:
+    containers    (int):   concurrently running containers
+    invocations   (int):   invocations per container
+    messages      (int):   messages logged per invocation
+    latency       (float): seconds per simulated round trip
+    cold_start    (float): seconds added to each cold invocation
+    throttle_rate (float): fraction of DynamoDB / SNS calls throttled
+
+  Returns:
+    {} with cold and warm invocation duration statistics (s), 
+    invocations per second and the number of failed invocations
+  """
+  db  = local_aws.local_dynamodb(latency=latency, seed=1,
+                                 throttle_rate=throttle_rate)
+  aws_clients.invalidate()
+  aws_clients._clients['sns'] = local_aws.local_sns(
+    latency=latency, throttle_rate=throttle_rate, seed=1)
+  params = [{'channel': 'sns', 'message': 'benchmark alert',
+             'topic_arns': ['arn:aws:sns:us-east-1:123456789012:Alerts']}]
+  durations = {'cold': [], 'warm': []}
+  failures  = []
+  lock      = threading.Lock()
+
+  def container(number):
+    sl = None
+    for invocation in range(invocations):
+      start = time.perf_counter()
+      if(sl is None):
+        time.sleep(cold_start)
+        sl   = sys_log.sys_log('bench' + str(number), 'info_table', 
+                               'errors_table', '', '')
+        kind = 'cold'
+      else:
+        sl.reset()
+        kind = 'warm'
+      for i in range(messages):
+        sl.log_message(str(i), 'ERROR' if(i == messages - 1) else 'INFO',
+                       'benchmark message', '')
+      ok = sl.save_messages_to_db(db)
+      if(sl.error_messages):
+        ok = (not send_alerts.send_alerts(params).issues) and ok
+      with lock:
+        durations[kind].append(time.perf_counter() - start)
+        if(not ok):
+          failures.append(number)
+
+  threads = [threading.Thread(target=container, args=(number,))
+             for number in range(containers)]
+  start = time.perf_counter()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  wall = time.perf_counter() - start
+  aws_clients.invalidate()
+  return({'cold': _stats(durations['cold']),
+          'warm': _stats(durations['warm']),
+          'invocations_per_second': containers * invocations / wall,
+          'failed_invocations': len(failures)})
+
+
+def _traceback_text(size):
+  """
+  Exception-like text of about 'size' characters, for payload benchmarks
+  """
+  lines, length, i = [], 0, 0
+  while(length < size):
+    line = ('  File "/var/task/handler_' + str(i % 7) + '.py", line ' + 
+            str(100 + i * 13 % 900) + ', in process_record_' + 
+            str(i % 11) + '\n    result = transform(record[' + str(i) + 
+            '], context)\n')
+    lines.append(line)
+    length += len(line)
+    i += 1
+  return(''.join(lines)[:size])
+
+
+def bench_compression(sizes=(256, 1024, 4096, 16384, 65536, 262144, 
+                             524288), threshold=1024):
+  """
+  Item size and write capacity units (WCU, 1 per started KB of item) 
+  consumed per message, for plain and compressed items, against the 
+  message payload size.  Payloads over DynamoDB's 400 KB limit are 
+  truncated (see log_codec).
+
+  Args:
+    sizes     [int]: message payload sizes in characters
+    threshold (int): compress_threshold given to sys_log
+
+  Returns:
+    [{}] per size: bytes and WCU of the plain and compressed items, 
+    whether either was truncated, and encode time (s) of the compressed
+  """
+  results = []
+  plain      = sys_log.sys_log('bench', 'info_table', 'errors_table', '', '')
+  compressed = sys_log.sys_log('bench', 'info_table', 'errors_table', '', '',
+                               compress_threshold=threshold)
+  for size in sizes:
+    text   = _traceback_text(size)
+    record = plain.log_record('2026-10-17', 'ERROR', '12', text, 
+                              int(time.time()))
+    result = {'payload': size}
+    for name, sl in (('plain', plain), ('compressed', compressed)):
+      start = time.perf_counter()
+      item  = sl._item('1792220000+bench+000000.0000000001.abcd1234', 
+                       record, True)
+      elapsed = time.perf_counter() - start
+      item_bytes = log_codec.item_size(item)
+      result[name + '_bytes']     = item_bytes
+      result[name + '_wcu']       = -(-item_bytes // 1024)
+      result[name + '_truncated'] = 'truncated' in item
+    result['encode_time'] = elapsed
+    results.append(result)
+  return(results)
+
+
+HEAVY_IMPORTS = ('boto3', 'botocore', 'asyncio')
+
+
+def bench_import_time(modules=('sys_log', 'send_alerts'), rounds=5):
+  """
+  Import time of each module in a fresh interpreter, measured with
+  'python -X importtime', and a guard against cold start regressions: 
+  any of HEAVY_IMPORTS loaded by merely importing the modules is 
+  reported.
+
+  Args:
+    modules [str]: modules imported together, in this order
+    rounds  (int): interpreters started; the fastest run is kept
+
+  Returns:
+    {} with cumulative microseconds per module and the heavy modules
+    that were imported
+  """
+  directory = os.path.dirname(os.path.abspath(__file__))
+  best      = None
+  heavy     = set()
+  for i in range(rounds):
+    run = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                          'import ' + ', '.join(modules)],
+                         cwd=directory, capture_output=True, text=True)
+    times = {}
+    for line in run.stderr.splitlines():
+      if(not line.startswith('import time:') or ('|' not in line)):
+        continue
+      fields = line[len('import time:'):].split('|')
+      name   = fields[2].strip()
+      if(name.split('.')[0] in HEAVY_IMPORTS):
+        heavy.add(name.split('.')[0])
+      if(name in modules):
+        times[name] = int(fields[1])
+    if((best is None) or (sum(times.values()) < sum(best.values()))):
+      best = times
+  return({'import_us': best, 'heavy_imports': sorted(heavy)})
+
+
+def run_all(quick=False):
+  """
+  Run every benchmark.
+
+  Args:
+    quick (bool): much smaller sizes, for a fast smoke run
+
+  Returns:
+    {benchmark name: results}
+  """
+  scale = 10 if(quick) else 1
+  results = {}
+  results['import_time'] = bench_import_time(rounds=1 if(quick) else 5)
+  results['log_message'] = bench_log_message(10000 // scale,
+                                             0 if(quick) else 2)
+  results['log_message_memory'] = bench_log_message_memory(
+                                    1000000 // (scale * 10))
+  results['throughput'] = bench_throughput(50000 // scale)
+  results['spool'] = bench_spool(20000 // scale)
+  results['save_messages'] = bench_save_messages()
+  results['flush_scaling'] = bench_flush_scaling(
+    (100, 500) if(quick) else (100, 500, 1000, 5000))
+  results['flush_scaling_throttled'] = bench_flush_scaling(
+    (100, 500) if(quick) else (100, 500, 1000, 5000), throttle_rate=0.2)
+  results['compression'] = bench_compression()
+  results['fan_out'] = bench_fan_out((1, 5) if(quick) else (1, 5, 20, 50))
+  results['client_reuse'] = bench_client_reuse(20 // scale)
+  results['async'] = bench_async()
+  results['invocations'] = bench_invocations(
+    containers=4 if(quick) else 8, invocations=5 if(quick) else 25)
+  results['invocations_throttled'] = bench_invocations(
+    containers=4 if(quick) else 8, invocations=5 if(quick) else 25,
+    throttle_rate=0.1)
+  results['checks'] = {'async': check_async(), 'spool': check_spool(),
+                       'reader': check_reader(),
+                       'metrics': check_metrics()}
+  return(results)
+
+
+def _print_results(results):
+  result = results['import_time']
+  print('import time: ' + ', '.join(name + ' ' + 
+                                    format(us / 1000, '.1f') + ' ms' 
+                                    for name, us 
+                                    in result['import_us'].items()))
+  if(result['heavy_imports']):
+    print('import guard FAILED; imported: ' + 
+          ', '.join(result['heavy_imports']))
+  result = results['log_message']
+  print('log_message() per call: ' +
+        format(result['current'] * 1000000, '.1f') + ' us')
+  if(result['legacy']):
+    print('legacy log_message() per call: ' +
+          format(result['legacy'], '.3f') + ' s')
+
+  result = results['log_message_memory']
+  print('log_message() memory: ' +
+        format(result['latency'] * 1000000, '.1f') + ' us per call, ' +
+        format(result['bytes_per_record'], '.0f') + ' bytes per record')
+
+  result = results['throughput']
+  print('log_message() throughput without / with metrics: ' +
+        format(result['plain'], ',.0f') + ' / ' +
+        format(result['metrics'], ',.0f') + ' messages per second')
+
+  result = results['spool']
+  print('log_message() without / with spool: ' +
+        format(result['plain'] * 1000000, '.1f') + ' / ' +
+        format(result['spooled'] * 1000000, '.1f') + ' us per call')
+
+  result = results['save_messages']
+  print('put_item loop: ' + str(result['legacy_round_trips']) +
+        ' round trips, ' + format(result['legacy_time'], '.3f') + ' s')
+  print('BatchWriteItem: ' + str(result['batch_round_trips']) +
+        ' round trips, ' + format(result['batch_time'], '.3f') + ' s')
+  print('flush report: ' + str(result['flush_report']))
+
+  for name in ('flush_scaling', 'flush_scaling_throttled'):
+    for result in results[name]:
+      print(name + ': ' + str(result['messages']) + ' messages, ' +
+            str(result['round_trips']) + ' round trips, ' +
+            format(result['time'], '.3f') + ' s')
+
+  for result in results['compression']:
+    print('payload ' + str(result['payload']) + ' chars, plain / ' +
+          'compressed: ' + str(result['plain_wcu']) + ' / ' + 
+          str(result['compressed_wcu']) + ' WCU' + 
+          (' (truncated)' if(result['plain_truncated']) else ''))
+
+  for result in results['fan_out']:
+    print('fan out to ' + str(result['topics']) + ' topics, sequential / ' +
+          'concurrent: ' + format(result['sequential'], '.3f') + ' / ' +
+          format(result['concurrent'], '.3f') + ' s')
+
+  result = results['client_reuse']
+  print('new SNS client per publish: ' +
+        format(result['cold'] * 1000, '.2f') + ' ms')
+  print('shared SNS client per publish: ' +
+        format(result['warm'] * 1000, '.2f') + ' ms')
+
+  result = results['async']
+  print('blocking flush + alerts: ' + format(result['blocking'], '.3f') + 
+        ' s')
+  print('async flush + alerts: ' + format(result['async'], '.3f') + ' s')
+
+  for name in ('invocations', 'invocations_throttled'):
+    result = results[name]
+    print(name + ': cold p50 / p95 ' + 
+          format(result['cold']['p50'] * 1000, '.1f') + ' / ' +
+          format(result['cold']['p95'] * 1000, '.1f') + ' ms, warm p50 / ' +
+          'p95 ' + format(result['warm']['p50'] * 1000, '.1f') + ' / ' +
+          format(result['warm']['p95'] * 1000, '.1f') + ' ms, ' +
+          format(result['invocations_per_second'], '.0f') + 
+          ' invocations per second, ' + str(result['failed_invocations']) +
+          ' failed')
+
+  for name, failures in results['checks'].items():
+    if(failures):
+      for failure in failures:
+        print(name + ' check FAILED: ' + failure)
+    else:
+      print(name + ' checks: passed')
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='sys_log / send_alerts ' +
+                                               'benchmarks')
+  parser.add_argument('--json', help='write results to this file')
+  parser.add_argument('--quick', action='store_true', 
+                      help='smaller sizes for a fast smoke run')
+  args = parser.parse_args()
+
+  results = run_all(args.quick)
+  _print_results(results)
+  if(args.json):
+    with open(args.json, 'w') as results_file:
+      json.dump({'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', 
+                                            time.gmtime()),
+                 'python':    platform.python_version(),
+                 'platform':  platform.platform(),
+                 'quick':     args.quick,
+                 'results':   results}, results_file, indent=2)
+    print('results written to ' + args.json)
+  if(results['import_time']['heavy_imports'] or 
+     any(results['checks'].values())):
+    sys.exit(1)
@@ -0,0 +1,476 @@
+"""
+Jaye Hicks
+Obligatory legal disclaimer:
+  You are free to use this source code (this file and all other files
+  referenced in this file) "AS IS" WITHOUT WARRANTY OF ANY KIND, EITHER
+  EXPRESSED OR IMPLIED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+  WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE.
+  THE ENTIRE RISK AS TO THE QUALITY AND PERFORMANCE OF THIS SOURCE CODE
+  IS WITH YOU.  SHOULD THE SOURCE CODE PROVE DEFECTIVE, YOU ASSUME THE
+  COST OF ALL NECESSARY SERVICING, REPAIR OR CORRECTION. See the GNU
+  GENERAL PUBLIC LICENSE Version 3, 29 June 2007 for more details.
+
+This module provides small, in-memory stand-ins for the parts of the
+boto3 DynamoDB resource that sys_log (and alert_limiter) uses, the 
+boto3 SNS client that send_alerts uses, the CloudWatch Logs client 
+that log_sinks.cloudwatch_logs_sink uses and the S3 client that
+log_export.s3_destination uses.  They let you exercise and benchmark sys_log and 
+send_alerts without an AWS account or network access.  Latency and
+throttling are injectable, so load can be simulated as well.
+
+Usage:
+  import local_aws
+  db = local_aws.local_dynamodb(latency=0.005)
+  sl.save_messages_to_db(db)
+  print(db.calls, db.tables['errors_table'])
+  
+  db = local_aws.local_dynamodb(latency=0.005, throttle_rate=0.1)
+  sns = local_aws.local_sns(latency=0.05)
+  aws_clients._clients['sns'] = sns         #hand it to send_alerts
+  print(sns.published)
+  
+  logs = local_aws.local_logs(latency=0.02)
+  sink = log_sinks.cloudwatch_logs_sink('/app/sys_log', logs_client=logs)
+  print(logs.events)
+  
+  s3   = local_aws.local_s3()
+  dest = log_export.s3_destination('archive', s3_client=s3)
+  print(s3.objects)
+
+Dependencies:
+  io
+  time
+  random
+  threading
+"""
+import io
+import time
+import random
+import threading
+
+
+class throttling_error(Exception):
+  """
+  Raised by the stand-ins in place of the ClientError boto3 raises when
+  a request is throttled.  The message starts with the AWS error code.
+  """
+  pass
+
+
+class conditional_check_failed(Exception):
+  """
+  Raised by local_table.put_item() when its ConditionExpression is not
+  met.  Carries the same 'response' shape as a boto3 ClientError.
+  """
+  def __init__(self, message):
+    super().__init__(message)
+    self.response = {'Error': {'Code': 'ConditionalCheckFailedException',
+                               'Message': message}}
+
+
+class local_table():
+  """
+  Stand-in for a boto3 DynamoDB Table resource.
+  """
+  def __init__(self, owner, name):
+    """
+    Args:
+      owner (local_dynamodb): stand-in service resource owning the table
+      name  (str):            table name
+    """
+    self.owner = owner
+    self.name  = name
+
+
+  def put_item(self, Item, ConditionExpression=None, ReturnValues=None,
+               **kwargs):
+    """
+    Store a single item, keyed by the table's key attributes (see 
+    local_dynamodb 'keys').  A ConditionExpression is evaluated against
+    the item being replaced; ReturnValues='ALL_OLD' returns that item.
+    """
+    self.owner._round_trip('put_item')
+    key = self.owner._key(self.name, Item)
+    with self.owner.lock:
+      table = self.owner.tables.setdefault(self.name, {})
+      old   = table.get(key)
+      if((ConditionExpression is not None) and
+         (not _matches(old if(old is not None) else {}, 
+                       ConditionExpression))):
+        raise conditional_check_failed('The conditional request failed')
+      table[key] = dict(Item)
+    resp = {'ResponseMetadata': {'HTTPStatusCode': 200}}
+    if((ReturnValues == 'ALL_OLD') and (old is not None)):
+      resp['Attributes'] = dict(old)
+    return(resp)
+
+
+  def update_item(self, Key, UpdateExpression, ExpressionAttributeValues,
+                  **kwargs):
+    """
+    Only 'SET <attribute> = <:value>' and 'ADD <attribute> <:value>' 
+    clauses, one attribute each, are supported.
+    """
+    self.owner._round_trip('update_item')
+    words   = UpdateExpression.replace('=', ' ').split()
+    actions = []
+    while(words):
+      if((len(words) < 3) or (words[0].upper() not in ('SET', 'ADD'))):
+        raise ValueError('Unsupported update expression: ' + 
+                         UpdateExpression)
+      actions.append((words[0].upper(), words[1], words[2]))
+      words = words[3:]
+    key = self.owner._key(self.name, Key)
+    with self.owner.lock:
+      item = self.owner.tables.setdefault(self.name, {}).setdefault(
+               key, dict(Key))
+      for action, name, value in actions:
+        if(action == 'SET'):
+          item[name] = ExpressionAttributeValues[value]
+        else:
+          item[name] = item.get(name, 0) + ExpressionAttributeValues[value]
+    return({'ResponseMetadata': {'HTTPStatusCode': 200}})
+
+
+  def query(self, KeyConditionExpression, FilterExpression=None,
+            ExclusiveStartKey=None, Limit=None, **kwargs):
+    """
+    Same request / response shape as the boto3 Table method.  Items are
+    returned in stamp_mod order, at most page_size (or Limit) per call;
+    like DynamoDB, the limit is applied before the filter.
+    """
+    self.owner._round_trip('query')
+    with self.owner.lock:
+      items = list(self.owner.tables.get(self.name, {}).values())
+    items = sorted((item for item in items
+                    if(_matches(item, KeyConditionExpression))),
+                   key=lambda item: item['stamp_mod'])
+    if(ExclusiveStartKey):
+      items = [item for item in items
+               if(item['stamp_mod'] > ExclusiveStartKey['stamp_mod'])]
+    limit = Limit if(Limit) else self.owner.page_size
+    page  = items[:limit]
+    resp  = {'Items': [dict(item) for item in page
+                       if((FilterExpression is None) or
+                          _matches(item, FilterExpression))],
+             'ResponseMetadata': {'HTTPStatusCode': 200}}
+    if(len(items) > limit):
+      resp['LastEvaluatedKey'] = {'date': page[-1]['date'],
+                                  'stamp_mod': page[-1]['stamp_mod']}
+    return(resp)
+
+
+def _matches(item, condition):
+  """
+  Evaluate a boto3.dynamodb.conditions condition against an item.  Only
+  the operators used by this repository are supported.
+  """
+  expression = condition.get_expression()
+  operator   = expression['operator']
+  values     = expression['values']
+  if(operator == 'AND'):
+    return(_matches(item, values[0]) and _matches(item, values[1]))
+  if(operator == 'OR'):
+    return(_matches(item, values[0]) or _matches(item, values[1]))
+  if(operator == 'NOT'):
+    return(not _matches(item, values[0]))
+  value = item.get(values[0].name)
+  if(operator == 'attribute_exists'):
+    return(values[0].name in item)
+  if(operator == 'attribute_not_exists'):
+    return(values[0].name not in item)
+  if(value is None):
+    return(False)
+  if(operator == '='):
+    return(value == values[1])
+  if(operator == '<'):
+    return(value < values[1])
+  if(operator == '<='):
+    return(value <= values[1])
+  if(operator == '>'):
+    return(value > values[1])
+  if(operator == '>='):
+    return(value >= values[1])
+  if(operator == 'BETWEEN'):
+    return(values[1] <= value <= values[2])
+  if(operator == 'begins_with'):
+    return(value.startswith(values[1]))
+  if(operator == 'contains'):
+    return(values[1] in value)
+  raise ValueError('Unsupported condition operator: ' + operator)
+
+
+class local_dynamodb():
+  """
+  Stand-in for the boto3 DynamoDB service resource.  Every call sleeps
+  for 'latency' seconds to imitate a network round trip.  A fraction of
+  the items sent to batch_write_item() can be handed back as
+  UnprocessedItems, and a fraction of whole calls can raise 
+  throttling_error, to imitate throttling.
+
+  if(local_dynamodb.calls['batch_write_item'] > 1):
+    #items were grouped into more than one request
+  """
+  def __init__(self, latency=0.0, unprocessed_rate=0.0, seed=None,
+               page_size=100, throttle_rate=0.0, keys=None):
+    """
+    Args:
+      latency          (float): seconds added to every call
+      unprocessed_rate (float): 0.0 - 1.0 fraction of batched items that
+                                are returned as UnprocessedItems
+      seed             (int):   seed for the unprocessed item selection
+      page_size        (int):   items examined per query() call
+      throttle_rate    (float): 0.0 - 1.0 fraction of calls that raise
+                                throttling_error
+      keys {str: (str)}:        key attribute names per table; tables not
+                                listed use ('date', 'stamp_mod')
+    """
+    self.latency          = latency
+    self.unprocessed_rate = unprocessed_rate
+    self.random           = random.Random(seed)
+    self.tables           = {}
+    self.calls            = {'put_item': 0, 'batch_write_item': 0, 
+                             'query': 0, 'update_item': 0}
+    self.keys             = keys if(keys) else {}
+    self.page_size        = page_size
+    self.throttle_rate    = throttle_rate
+    self.throttled        = 0
+    self.lock             = threading.Lock()
+
+
+  def _round_trip(self, operation):
+    with self.lock:
+      self.calls[operation] = self.calls.get(operation, 0) + 1
+      throttle = (self.throttle_rate and 
+                  (self.random.random() < self.throttle_rate))
+      if(throttle):
+        self.throttled += 1
+    if(self.latency):
+      time.sleep(self.latency)
+    if(throttle):
+      raise throttling_error('ProvisionedThroughputExceededException: ' +
+                             'simulated throttling of ' + operation)
+
+
+  def _key(self, table, item):
+    return(tuple(item[name] for name 
+                 in self.keys.get(table, ('date', 'stamp_mod'))))
+
+
+  def _store(self, table, item):
+    key = self._key(table, item)
+    with self.lock:
+      self.tables.setdefault(table, {})[key] = dict(item)
+
+
+  def Table(self, name):
+    return(local_table(self, name))
+
+
+  def batch_write_item(self, RequestItems):
+    """
+    Same request / response shape as the boto3 resource method.  At
+    most 25 put requests are accepted per call.
+    """
+    self._round_trip('batch_write_item')
+    count = sum(len(requests) for requests in RequestItems.values())
+    if(count > 25):
+      raise ValueError('Too many items requested for the BatchWriteItem call')
+
+    unprocessed = {}
+    for table, requests in RequestItems.items():
+      for request in requests:
+        if(self.random.random() < self.unprocessed_rate):
+          unprocessed.setdefault(table, []).append(request)
+        else:
+          self._store(table, request['PutRequest']['Item'])
+    return({'UnprocessedItems': unprocessed,
+            'ResponseMetadata': {'HTTPStatusCode': 200}})
+
+
+class local_sns():
+  """
+  Stand-in for the boto3 SNS client.  Every publish sleeps for the 
+  topic's latency; publishing to a topic listed in 'failing' raises, as
+  does a throttle_rate fraction of all publishes.
+  """
+  def __init__(self, latency=0.0, topic_latency=None, failing=None,
+               throttle_rate=0.0, seed=None, entry_failure_rate=0.0):
+    """
+    Args:
+      latency       (float):        seconds added to every publish
+      topic_latency {str: float}:   per topic arn latency overrides
+      failing       [str]:          topic arns whose publish raises
+      throttle_rate (float):        0.0 - 1.0 fraction of publishes that
+                                    raise throttling_error
+      seed          (int):          seed for the throttled selection
+      entry_failure_rate (float):   0.0 - 1.0 fraction of publish_batch()
+                                    entries reported as Failed
+    """
+    self.latency       = latency
+    self.topic_latency = topic_latency if(topic_latency) else {}
+    self.failing       = set(failing) if(failing) else set()
+    self.published     = []
+    self.calls         = {'publish': 0, 'publish_batch': 0}
+    self.entry_failure_rate = entry_failure_rate
+    self.throttle_rate = throttle_rate
+    self.throttled     = 0
+    self.random        = random.Random(seed)
+    self.lock          = threading.Lock()
+
+
+  def publish(self, TargetArn, Message, **kwargs):
+    with self.lock:
+      self.calls['publish'] += 1
+      throttle = (self.throttle_rate and 
+                  (self.random.random() < self.throttle_rate))
+      if(throttle):
+        self.throttled += 1
+    latency = self.topic_latency.get(TargetArn, self.latency)
+    if(latency):
+      time.sleep(latency)
+    if(throttle):
+      raise throttling_error('Throttling: simulated throttling of publish')
+    if(TargetArn in self.failing):
+      raise RuntimeError('Simulated publish failure for ' + TargetArn)
+    with self.lock:
+      self.published.append((TargetArn, Message))
+    return({'MessageId': str(len(self.published)),
+            'ResponseMetadata': {'HTTPStatusCode': 200}})
+
+
+  def publish_batch(self, TopicArn, PublishBatchRequestEntries, **kwargs):
+    """
+    Same request / response shape as the boto3 client method.  At most
+    10 entries are accepted per call.
+    """
+    with self.lock:
+      self.calls['publish_batch'] += 1
+      throttle = (self.throttle_rate and 
+                  (self.random.random() < self.throttle_rate))
+      if(throttle):
+        self.throttled += 1
+    if(len(PublishBatchRequestEntries) > 10):
+      raise ValueError('TooManyEntriesInBatchRequest')
+    latency = self.topic_latency.get(TopicArn, self.latency)
+    if(latency):
+      time.sleep(latency)
+    if(throttle):
+      raise throttling_error('Throttling: simulated throttling of ' +
+                             'publish_batch')
+    if(TopicArn in self.failing):
+      raise RuntimeError('Simulated publish failure for ' + TopicArn)
+    resp = {'Successful': [], 'Failed': [],
+            'ResponseMetadata': {'HTTPStatusCode': 200}}
+    with self.lock:
+      for entry in PublishBatchRequestEntries:
+        if(self.random.random() < self.entry_failure_rate):
+          resp['Failed'].append({'Id': entry['Id'], 'Code': 'InternalError',
+                                 'Message': 'Simulated entry failure',
+                                 'SenderFault': False})
+        else:
+          self.published.append((TopicArn, entry['Message']))
+          resp['Successful'].append({'Id': entry['Id'], 
+                                     'MessageId': str(len(self.published))})
+    return(resp)
+
+
+class local_logs():
+  """
+  Stand-in for the boto3 CloudWatch Logs client.  put_log_events() 
+  enforces the PutLogEvents batch limits (10,000 events, 1,048,576 
+  bytes counting 26 bytes per event, chronological order, 24 hours).
+  """
+  def __init__(self, latency=0.0, throttle_rate=0.0, seed=None):
+    """
+    Args:
+      latency       (float): seconds added to every call
+      throttle_rate (float): 0.0 - 1.0 fraction of put_log_events() calls
+                             that raise throttling_error
+      seed          (int):   seed for the throttled selection
+    """
+    self.latency       = latency
+    self.throttle_rate = throttle_rate
+    self.throttled     = 0
+    self.events        = {}       #(group, stream) -> [event]
+    self.calls         = {'create_log_stream': 0, 'put_log_events': 0}
+    self.random        = random.Random(seed)
+    self.lock          = threading.Lock()
+
+
+  def create_log_stream(self, logGroupName, logStreamName, **kwargs):
+    with self.lock:
+      self.calls['create_log_stream'] += 1
+      if((logGroupName, logStreamName) in self.events):
+        error = RuntimeError('ResourceAlreadyExistsException: ' + 
+                             logStreamName)
+        error.response = {'Error': {
+                            'Code': 'ResourceAlreadyExistsException'}}
+        raise error
+      self.events[(logGroupName, logStreamName)] = []
+    return({})
+
+
+  def put_log_events(self, logGroupName, logStreamName, logEvents, 
+                     **kwargs):
+    with self.lock:
+      self.calls['put_log_events'] += 1
+      throttle = (self.throttle_rate and 
+                  (self.random.random() < self.throttle_rate))
+      if(throttle):
+        self.throttled += 1
+    if(self.latency):
+      time.sleep(self.latency)
+    if(throttle):
+      raise throttling_error('ThrottlingException: simulated throttling ' +
+                             'of put_log_events')
+    stamps = [event['timestamp'] for event in logEvents]
+    if((not logEvents) or (len(logEvents) > 10000) or
+       (sum(len(event['message'].encode('utf-8')) + 26 
+            for event in logEvents) > 1048576)):
+      raise ValueError('InvalidParameterException: batch size')
+    if((stamps != sorted(stamps)) or (stamps[-1] - stamps[0] >= 86400000)):
+      raise ValueError('InvalidParameterException: event order / span')
+    with self.lock:
+      if((logGroupName, logStreamName) not in self.events):
+        raise RuntimeError('ResourceNotFoundException: ' + logStreamName)
+      self.events[(logGroupName, logStreamName)].extend(logEvents)
+    return({'nextSequenceToken': str(self.calls['put_log_events'])})
+
+
+class local_s3():
+  """
+  Stand-in for the boto3 S3 client: put_object() / get_object() only.
+  """
+  def __init__(self, latency=0.0):
+    """
+    Args:
+      latency (float): seconds added to every call
+    """
+    self.latency = latency
+    self.objects = {}         #(bucket, key) -> bytes
+    self.calls   = {'put_object': 0, 'get_object': 0}
+    self.lock    = threading.Lock()
+
+
+  def put_object(self, Bucket, Key, Body, **kwargs):
+    data = Body.read() if(hasattr(Body, 'read')) else bytes(Body)
+    if(self.latency):
+      time.sleep(self.latency)
+    with self.lock:
+      self.calls['put_object'] += 1
+      self.objects[(Bucket, Key)] = data
+    return({'ETag': str(hash(data))})
+
+
+  def get_object(self, Bucket, Key, **kwargs):
+    if(self.latency):
+      time.sleep(self.latency)
+    with self.lock:
+      self.calls['get_object'] += 1
+      data = self.objects.get((Bucket, Key))
+    if(data is None):
+      error = RuntimeError('NoSuchKey: ' + Key)
+      error.response = {'Error': {'Code': 'NoSuchKey'}}
+      raise error
+    return({'Body': io.BytesIO(data)})
\ No newline at end of file
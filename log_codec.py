@@ -0,0 +1,144 @@
+"""
+Jaye Hicks
+Obligatory legal disclaimer:
+  You are free to use this source code (this file and all other files
+  referenced in this file) "AS IS" WITHOUT WARRANTY OF ANY KIND, EITHER
+  EXPRESSED OR IMPLIED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+  WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE.
+  THE ENTIRE RISK AS TO THE QUALITY AND PERFORMANCE OF THIS SOURCE CODE
+  IS WITH YOU.  SHOULD THE SOURCE CODE PROVE DEFECTIVE, YOU ASSUME THE
+  COST OF ALL NECESSARY SERVICING, REPAIR OR CORRECTION. See the GNU
+  GENERAL PUBLIC LICENSE Version 3, 29 June 2007 for more details.
+
+This module provides the message codec shared by sys_log (writing) and
+log_reader (reading).  DynamoDB bills writes per 1 KB of item size and
+rejects items over 400 KB, so a large message body (e.g., exception
+text) is compressed into a Binary attribute, and whatever is still too
+large is truncated.
+
+Item layout of an encoded message:
+  'message'   (S): '<LEVEL>: (<locator>) ', so level / locator filters
+                   on 'message' keep working
+  'body'      (B): the whole message, compressed
+  'enc'       (S): codec used for 'body' ('zlib' or 'zstd')
+  'truncated' (N): only on truncated items; original size in bytes
+
+Usage:
+  import log_codec
+  log_codec.encode_message(item, 'ERROR: (3) ', threshold=1024)
+  item = log_codec.decode_item(item)      #item['message'] is whole again
+
+Dependencies:
+  zlib
+  zstandard  (optional; only for codec 'zstd')
+"""
+import zlib
+
+
+MAX_ITEM_BYTES = 409600              #DynamoDB item size limit
+CODECS         = ('zlib', 'zstd')
+
+
+def available(codec):
+  """
+  Returns:
+    True if the codec can be used in this environment
+  """
+  if(codec == 'zlib'):
+    return(True)
+  if(codec == 'zstd'):
+    try:
+      import zstandard
+      return(True)
+    except ImportError:
+      return(False)
+  return(False)
+
+
+def compress(data, codec='zlib'):
+  if(codec == 'zstd'):
+    import zstandard
+    return(zstandard.ZstdCompressor().compress(data))
+  return(zlib.compress(data, 6))
+
+
+def decompress(data, codec='zlib'):
+  if(codec == 'zstd'):
+    import zstandard
+    return(zstandard.ZstdDecompressor().decompress(data))
+  return(zlib.decompress(data))
+
+
+def item_size(item):
+  """
+  Approximate DynamoDB size of an item: attribute names plus values
+  (UTF-8 strings, raw binary, about 1 byte per 2 digits of a number).
+  """
+  size = 0
+  for name, value in item.items():
+    size += len(name)
+    if(isinstance(value, str)):
+      size += len(value.encode('utf-8'))
+    elif(isinstance(value, (bytes, bytearray))):
+      size += len(value)
+    else:
+      size += len(str(value)) // 2 + 2
+  return(size)
+
+
+def encode_message(item, header, threshold=None, codec='zlib',
+                   max_bytes=MAX_ITEM_BYTES):
+  """
+  Compress and / or truncate item['message'] in place.
+
+  Args:
+    item      ({}):  DynamoDB item with a 'message' attribute
+    header    (str): start of the message kept readable when compressed
+    threshold (int): opt; compress messages larger than this many bytes
+    codec     (str): 'zlib' or 'zstd'
+    max_bytes (int): item size limit; larger messages are truncated
+
+  Returns:
+    the item
+  """
+  message = item['message']
+  data    = message.encode('utf-8')
+  if((threshold is not None) and (len(data) > threshold)):
+    body = compress(data, codec)
+    if(len(body) + len(header) + 16 < len(data)):
+      item['message'] = header
+      item['body']    = body
+      item['enc']     = codec
+
+  excess = item_size(item) - max_bytes
+  if(excess > 0):
+    item['truncated'] = len(data)
+    excess += len(str(len(data))) // 2 + 2 + len('truncated')
+    if('body' in item):
+      text = message
+      for attempt in range(8):
+        allowed = len(item['body']) - excess
+        text    = text[:max(0, int(len(text) * allowed / len(item['body'])
+                                   * 0.95))]
+        item['body'] = compress(text.encode('utf-8'), codec)
+        excess = item_size(item) - max_bytes
+        if(excess <= 0):
+          break
+    else:
+      item['message'] = data[:max(0, len(data) - excess)].decode('utf-8',
+                                                                 'ignore')
+  return(item)
+
+
+def decode_item(item):
+  """
+  Undo encode_message(): put the whole message back in item['message']
+  and remove 'body' / 'enc'.  Items that were never encoded are returned
+  unchanged.
+  """
+  if('enc' in item):
+    body = item.pop('body')
+    body = getattr(body, 'value', body)         #boto3 Binary
+    item['message'] = decompress(bytes(body), item.pop('enc')).decode(
+                        'utf-8', 'replace')
+  return(item)
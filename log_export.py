@@ -0,0 +1,432 @@
+"""
+Jaye Hicks
+Obligatory legal disclaimer:
+  You are free to use this source code (this file and all other files
+  referenced in this file) "AS IS" WITHOUT WARRANTY OF ANY KIND, EITHER
+  EXPRESSED OR IMPLIED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+  WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE.
+  THE ENTIRE RISK AS TO THE QUALITY AND PERFORMANCE OF THIS SOURCE CODE
+  IS WITH YOU.  SHOULD THE SOURCE CODE PROVE DEFECTIVE, YOU ASSUME THE
+  COST OF ALL NECESSARY SERVICING, REPAIR OR CORRECTION. See the GNU
+  GENERAL PUBLIC LICENSE Version 3, 29 June 2007 for more details.
+
+This module archives a sys_log table before TTL ('expiry') removes its
+items.  Every closed day (i.e., 'date' partition, with all of its
+shards) is read with parallel Queries through log_reader, streamed into
+gzip compressed NDJSON (or Parquet) files, and written to a local
+directory or an S3 bucket:
+
+  <prefix><table>/date=YYYY-MM-DD/part-00000.ndjson.gz
+
+A checkpoint (<prefix><table>/_checkpoint.json) lists the days already
+exported, so each run only reads the days that are not, and a run that
+was interrupted resumes with the first day it did not finish.
+
+Usage:
+  import log_export
+  dest     = log_export.local_destination('/data/sys_log_archive')
+  #dest    = log_export.s3_destination('my-archive-bucket')
+  exporter = log_export.log_exporter('info_table', dest, -6)
+  report   = exporter.export()           #every closed, unexported day
+  print(report)                          #{'days', 'items', 'files', ...}
+  if(exporter.issues):
+    #issue(s) occured; the days affected are exported by the next run
+
+Be aware:
+  1) Only closed days (the same notion log_reader uses for caching)
+     are exported; a day still receiving messages is left for a later
+     run.  Run the exporter well inside the ttl given to sys_log
+
+  2) Memory stays bounded: each day is streamed, a few pages ahead per
+     partition, into temporary files on disk that are cut every
+     rows_per_file items.  max_workers days are exported at a time
+
+  3) A day is checkpointed only after all of its files were written.
+     Re-exporting a day (e.g., after a crash) overwrites its files
+
+  4) file_format 'parquet' needs pyarrow installed.  Attributes without
+     a column of their own are kept, as JSON, in the 'extra' column
+
+Dependencies:
+  io
+  os
+  json
+  gzip
+  shutil
+  decimal
+  tempfile
+  threading
+  concurrent.futures
+  datetime
+  log_reader
+  aws_clients  (s3_destination only)
+  pyarrow      (optional; only for file_format 'parquet')
+"""
+import io
+import os
+import json
+import gzip
+import shutil
+import decimal
+import tempfile
+import threading
+import concurrent.futures
+from   datetime import datetime, timedelta, timezone
+
+import log_reader
+import aws_clients
+
+
+FORMATS = {'ndjson': '.ndjson.gz', 'parquet': '.parquet'}
+TEXT_COLUMNS   = ('date', 'stamp_mod', 'message', 'level', 'module', 
+                  'locator', 'exception_type')
+NUMBER_COLUMNS = ('expiry', 'count', 'first_seen', 'last_seen', 'truncated')
+COLUMNS        = TEXT_COLUMNS + NUMBER_COLUMNS
+
+
+def _json_value(value):
+  """
+  json.dumps() default for values boto3 returns (e.g., Decimal)
+  """
+  if(isinstance(value, decimal.Decimal)):
+    return(int(value) if(value == value.to_integral_value())
+           else float(value))
+  if(isinstance(value, (set, frozenset))):
+    return(sorted(value))
+  if(isinstance(value, (bytes, bytearray))):
+    return(value.decode('utf-8', 'replace'))
+  return(str(value))
+
+
+class local_destination():
+  """
+  Writes exported files below a local directory.
+  """
+  def __init__(self, root):
+    """
+    Args:
+      root (str): directory; created if missing
+    """
+    self.root = root
+
+
+  def _path(self, key):
+    return(os.path.join(self.root, *key.split('/')))
+
+
+  def put(self, key, data_file):
+    """
+    Store the contents of a binary file object under key, atomically
+    """
+    path = self._path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as out:
+      shutil.copyfileobj(data_file, out)
+    os.replace(path + '.tmp', path)
+
+
+  def get(self, key):
+    """
+    Returns:
+      bytes stored under key, or None if there are none
+    """
+    try:
+      with open(self._path(key), 'rb') as data_file:
+        return(data_file.read())
+    except FileNotFoundError:
+      return(None)
+
+
+class s3_destination():
+  """
+  Writes exported files to an S3 (or S3 compatible) bucket.
+  """
+  def __init__(self, bucket, s3_client=None):
+    """
+    Args:
+      bucket (str): existing bucket
+      s3_client:    opt; S3 client (e.g., a stub, or one created with an
+                    endpoint_url for an S3 compatible store)
+    """
+    self.bucket    = bucket
+    self.s3_client = s3_client
+
+
+  def _client(self):
+    if(self.s3_client is None):
+      self.s3_client = aws_clients.get_client('s3')
+    return(self.s3_client)
+
+
+  def put(self, key, data_file):
+    self._client().put_object(Bucket=self.bucket, Key=key, Body=data_file)
+
+
+  def get(self, key):
+    try:
+      return(self._client().get_object(Bucket=self.bucket,
+                                       Key=key)['Body'].read())
+    except Exception as e:
+      code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+      if(code in ('NoSuchKey', '404')):
+        return(None)
+      raise
+
+
+class _ndjson_part():
+  """
+  One gzip compressed NDJSON file being written to a temporary file
+  """
+  def __init__(self):
+    self.rows = 0
+    self.file = tempfile.TemporaryFile()
+    self.gzip = gzip.GzipFile(fileobj=self.file, mode='wb',
+                              compresslevel=6)
+
+
+  def write(self, item):
+    self.gzip.write((json.dumps(item, default=_json_value,
+                                separators=(',', ':')) +
+                     '\n').encode('utf-8'))
+    self.rows += 1
+
+
+  def close(self):
+    """
+    Returns:
+      the temporary file, positioned at its start
+    """
+    self.gzip.close()
+    self.file.seek(0)
+    return(self.file)
+
+
+class _parquet_part():
+  """
+  One Parquet file being written to a temporary file, row_group_size
+  rows at a time
+  """
+  def __init__(self, row_group_size):
+    import pyarrow
+    import pyarrow.parquet
+    self.pyarrow = pyarrow
+    self.rows    = 0
+    self.file    = tempfile.TemporaryFile()
+    self.schema  = pyarrow.schema(
+      [(name, pyarrow.string()) for name in TEXT_COLUMNS] +
+      [(name, pyarrow.int64()) for name in NUMBER_COLUMNS] +
+      [('extra', pyarrow.string())])
+    self.writer  = pyarrow.parquet.ParquetWriter(self.file, self.schema,
+                                                 compression='zstd')
+    self.row_group_size = row_group_size
+    self._pending = []
+
+
+  def write(self, item):
+    row   = {name: item.get(name) for name in COLUMNS}
+    for name in NUMBER_COLUMNS:
+      if(row[name] is not None):
+        row[name] = int(row[name])
+    extra = {name: value for name, value in item.items()
+             if(name not in COLUMNS)}
+    row['extra'] = (json.dumps(extra, default=_json_value) if(extra)
+                    else None)
+    self._pending.append(row)
+    self.rows += 1
+    if(len(self._pending) >= self.row_group_size):
+      self._flush()
+
+
+  def _flush(self):
+    if(self._pending):
+      self.writer.write_table(self.pyarrow.Table.from_pylist(
+                                self._pending, schema=self.schema))
+      self._pending = []
+
+
+  def close(self):
+    self._flush()
+    self.writer.close()
+    self.file.seek(0)
+    return(self.file)
+
+
+class log_exporter():
+  """
+  Incremental, checkpointed archive export of one sys_log table.
+
+  if(log_exporter.issues):
+    #issue(s) occured; days not checkpointed are retried on the next run
+  """
+  def __init__(self, table, destination, tz_offset=6, prefix='sys_log/',
+               file_format='ndjson', ttl=155520000, max_workers=4,
+               rows_per_file=250000, row_group_size=10000,
+               prefetch_pages=4, shards=None, dynamo_db_access=None):
+    """
+    Args:
+      table       (str): sys_log table to export (e.g., the info table)
+      destination:       local_destination or s3_destination
+      tz_offset   (int): same time zone offset given to sys_log
+      prefix      (str): key prefix of everything written
+      file_format (str): 'ndjson' (gzip) or 'parquet'
+      ttl         (int): same ttl given to sys_log; bounds how far back
+                         a first export looks
+      max_workers (int): days exported at the same time
+      rows_per_file (int): items per file before a new part is started
+      row_group_size (int): Parquet rows buffered per row group
+      prefetch_pages (int): pages buffered ahead per partition
+      shards      (int): opt; same shards value given to sys_log
+      dynamo_db_access:  opt; DynamoDB service resource (e.g., a stub)
+    """
+    if(file_format not in FORMATS):
+      raise ValueError('file_format must be one of ' + str(list(FORMATS)))
+    self.table            = table
+    self.destination      = destination
+    self.TZ_OFFSET        = tz_offset
+    self.prefix           = prefix
+    self.file_format      = file_format
+    self.ttl              = ttl
+    self.max_workers      = max_workers
+    self.rows_per_file    = rows_per_file
+    self.row_group_size   = row_group_size
+    self.prefetch_pages   = prefetch_pages
+    self.shards           = shards
+    self.dynamo_db_access = dynamo_db_access
+    self.issues           = []
+    self.lock             = threading.Lock()
+    self.checkpoint_key   = prefix + table + '/_checkpoint.json'
+
+
+  def _reader(self):
+    return(log_reader.log_reader(self.table, self.table, self.TZ_OFFSET,
+                                 self.dynamo_db_access,
+                                 max_workers=(self.shards or 0) + 1,
+                                 prefetch_pages=self.prefetch_pages,
+                                 shards=self.shards))
+
+
+  def load_checkpoint(self):
+    """
+    Returns:
+      {'days': {'YYYY-MM-DD': {'items', 'files', 'exported_at'}}}
+    """
+    data = self.destination.get(self.checkpoint_key)
+    if(data is None):
+      return({'days': {}})
+    return(json.loads(data.decode('utf-8')))
+
+
+  def _save_checkpoint(self, checkpoint):
+    """
+    Callers must hold self.lock.
+    """
+    data = json.dumps(checkpoint, sort_keys=True, indent=1).encode('utf-8')
+    self.destination.put(self.checkpoint_key, io.BytesIO(data))
+
+
+  def _part(self):
+    if(self.file_format == 'parquet'):
+      return(_parquet_part(self.row_group_size))
+    return(_ndjson_part())
+
+
+  def _put_part(self, day, number, part, files):
+    key = (self.prefix + self.table + '/date=' + day + '/part-' +
+           str(number).zfill(5) + FORMATS[self.file_format])
+    data_file = part.close()
+    try:
+      self.destination.put(key, data_file)
+    finally:
+      data_file.close()
+    files.append(key)
+
+
+  def export_day(self, day):
+    """
+    Stream one day's items (all shards) into files.
+
+    Returns:
+      {'items': int, 'files': [str]}
+
+    Raises:
+      RuntimeError if the table could not be read completely
+    """
+    reader = self._reader()
+    files, items, part = [], 0, None
+    try:
+      for item in reader.query(day, day, tables=('info',)):
+        if(part is None):
+          part = self._part()
+        part.write(item)
+        items += 1
+        if(part.rows >= self.rows_per_file):
+          self._put_part(day, len(files), part, files)
+          part = None
+      if(part is not None):
+        self._put_part(day, len(files), part, files)
+        part = None
+    finally:
+      if(part is not None):
+        part.file.close()
+    if(reader.issues):
+      raise RuntimeError('; '.join(reader.issues))
+    return({'items': items, 'files': files})
+
+
+  def pending_days(self, start_date=None, end_date=None):
+    """
+    Returns:
+      ['YYYY-MM-DD'] closed days in the range that are not checkpointed;
+      start_date defaults to ttl seconds ago, end_date to the last
+      closed day
+    """
+    today  = self._reader()._today()
+    last   = today - timedelta(days=2)
+    first  = today - timedelta(seconds=self.ttl)
+    if(end_date is not None):
+      last = min(last, datetime.strptime(str(end_date)[:10],
+                                         '%Y-%m-%d').date())
+    if(start_date is not None):
+      first = datetime.strptime(str(start_date)[:10], '%Y-%m-%d').date()
+    done = self.load_checkpoint()['days']
+    days = []
+    while(first <= last):
+      if(first.isoformat() not in done):
+        days.append(first.isoformat())
+      first += timedelta(days=1)
+    return(days)
+
+
+  def export(self, start_date=None, end_date=None):
+    """
+    Export every pending day (see pending_days()), max_workers days at
+    a time, checkpointing each day as soon as it is done.
+
+    Returns:
+      {'days': int, 'items': int, 'files': int, 'failed_days': [str]}
+    """
+    report     = {'days': 0, 'items': 0, 'files': 0, 'failed_days': []}
+    days       = self.pending_days(start_date, end_date)
+    checkpoint = self.load_checkpoint()
+    with concurrent.futures.ThreadPoolExecutor(
+           max_workers=max(1, self.max_workers)) as executor:
+      futures = {executor.submit(self.export_day, day): day for day in days}
+      for future in concurrent.futures.as_completed(futures):
+        day = futures[future]
+        try:
+          result = future.result()
+          with self.lock:
+            result['exported_at'] = datetime.now(timezone.utc).isoformat()
+            checkpoint['days'][day] = result
+            self._save_checkpoint(checkpoint)
+          report['days']  += 1
+          report['items'] += result['items']
+          report['files'] += len(result['files'])
+        except Exception as e:
+          report['failed_days'].append(day)
+          self.issues.append('Exception thrown exporting ' + day +
+                             '. Exception: ' + str(e))
+          print('Exception thrown exporting ' + day + '. Exception: ' +
+                str(e))
+    report['failed_days'].sort()
+    return(report)
@@ -0,0 +1,146 @@
+"""
+Jaye Hicks
+Obligatory legal disclaimer:
+  You are free to use this source code (this file and all other files
+  referenced in this file) "AS IS" WITHOUT WARRANTY OF ANY KIND, EITHER
+  EXPRESSED OR IMPLIED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+  WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE.
+  THE ENTIRE RISK AS TO THE QUALITY AND PERFORMANCE OF THIS SOURCE CODE
+  IS WITH YOU.  SHOULD THE SOURCE CODE PROVE DEFECTIVE, YOU ASSUME THE
+  COST OF ALL NECESSARY SERVICING, REPAIR OR CORRECTION. See the GNU
+  GENERAL PUBLIC LICENSE Version 3, 29 June 2007 for more details.
+
+This module defines the optional global secondary index (GSI) on a
+sys_log table that finds one module's messages of one level without
+reading every 'date' partition:
+
+  partition key  'module_level'  (S)  '<module>#<LEVEL>', e.g. 'orders#ERROR'
+  sort key       'stamp_mod'     (S)  same sort key as the table
+
+sys_log writes 'module_level' on the items of its indexed_tables, and
+log_reader.query_index() queries the index.
+
+Usage:
+  import log_index
+  log_index.provision_index('errors_table')          #once; idempotent
+
+  #or, when creating the table
+  client.create_table(...,
+    AttributeDefinitions=[...] + log_index.attribute_definitions(),
+    GlobalSecondaryIndexes=[log_index.gsi_definition()])
+
+Be aware:
+  1) The index is sparse: only items carrying 'module_level' are in it.
+     Items written before it was turned on are only found by log_reader
+     .query()
+
+  2) Every write to an indexed table is also a write to the index.  That
+     is why sys_log only indexes the (low volume) errors table by default
+
+  3) A projection of 'ALL' lets queries return whole items.  'KEYS_ONLY'
+     or a list of attributes makes the index smaller and cheaper to
+     write; queries then return just the projected attributes
+
+Dependencies:
+  time
+  aws_clients  (provision_index only)
+"""
+import time
+
+import aws_clients
+
+
+INDEX_NAME    = 'module_level-stamp_mod-index'
+PARTITION_KEY = 'module_level'
+SORT_KEY      = 'stamp_mod'
+
+
+def index_key(module, level):
+  """
+  Returns:
+    'module_level' partition key value for a module and level
+  """
+  return(module + '#' + level.upper())
+
+
+def attribute_definitions():
+  return([{'AttributeName': PARTITION_KEY, 'AttributeType': 'S'},
+          {'AttributeName': SORT_KEY,      'AttributeType': 'S'}])
+
+
+def gsi_definition(index_name=INDEX_NAME, projection='ALL',
+                   read_capacity=None, write_capacity=None):
+  """
+  Args:
+    index_name (str):      index name
+    projection (str / []): 'ALL', 'KEYS_ONLY' or [attribute names]
+    read_capacity, write_capacity (int): opt; for provisioned tables
+
+  Returns:
+    {} an entry of create_table()'s GlobalSecondaryIndexes, or the
+    'Create' value of update_table()'s GlobalSecondaryIndexUpdates
+  """
+  if(isinstance(projection, (list, tuple))):
+    projection = {'ProjectionType': 'INCLUDE',
+                  'NonKeyAttributes': list(projection)}
+  else:
+    projection = {'ProjectionType': projection}
+  definition = {'IndexName':  index_name,
+                'KeySchema':  [{'AttributeName': PARTITION_KEY,
+                                'KeyType': 'HASH'},
+                               {'AttributeName': SORT_KEY,
+                                'KeyType': 'RANGE'}],
+                'Projection': projection}
+  if(read_capacity and write_capacity):
+    definition['ProvisionedThroughput'] = {
+      'ReadCapacityUnits': read_capacity, 'WriteCapacityUnits': write_capacity}
+  return(definition)
+
+
+def provision_index(table_name, dynamo_db_client=None, index_name=INDEX_NAME,
+                    projection='ALL', wait=True, timeout=900, poll=15):
+  """
+  Add the index to an existing table, unless it is there already.  A
+  provisioned table's index gets the table's own capacity.
+
+  Args:
+    table_name (str):      sys_log table (e.g., the errors table)
+    dynamo_db_client:      opt; DynamoDB client (e.g., a stub)
+    index_name (str):      index name
+    projection (str / []): see gsi_definition()
+    wait       (bool):     wait for the index (and its backfill) to be
+                           ACTIVE
+    timeout, poll (float): seconds to wait in all / between checks
+
+  Returns:
+    str  the index status ('CREATING', 'ACTIVE', ...)
+  """
+  client = dynamo_db_client
+  if(client is None):
+    client = aws_clients.get_client('dynamodb')
+  table = client.describe_table(TableName=table_name)['Table']
+  status = None
+  for index in table.get('GlobalSecondaryIndexes', []):
+    if(index['IndexName'] == index_name):
+      status = index['IndexStatus']
+  if(status is None):
+    capacity = {}
+    if(table.get('BillingModeSummary', {}).get('BillingMode') !=
+       'PAY_PER_REQUEST'):
+      throughput = table.get('ProvisionedThroughput', {})
+      capacity   = {'read_capacity':  throughput.get('ReadCapacityUnits'),
+                    'write_capacity': throughput.get('WriteCapacityUnits')}
+    client.update_table(
+      TableName=table_name, AttributeDefinitions=attribute_definitions(),
+      GlobalSecondaryIndexUpdates=[{'Create': gsi_definition(
+                                      index_name, projection, **capacity)}])
+    status = 'CREATING'
+  started = time.monotonic()
+  while(wait and (status != 'ACTIVE') and
+        (time.monotonic() - started < timeout)):
+    time.sleep(poll)
+    table = client.describe_table(TableName=table_name)['Table']
+    for index in table.get('GlobalSecondaryIndexes', []):
+      if(index['IndexName'] == index_name):
+        status = index['IndexStatus']
+  return(status)
@@ -0,0 +1,203 @@
+"""
+Jaye Hicks
+Obligatory legal disclaimer:
+  You are free to use this source code (this file and all other files
+  referenced in this file) "AS IS" WITHOUT WARRANTY OF ANY KIND, EITHER
+  EXPRESSED OR IMPLIED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+  WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE.
+  THE ENTIRE RISK AS TO THE QUALITY AND PERFORMANCE OF THIS SOURCE CODE
+  IS WITH YOU.  SHOULD THE SOURCE CODE PROVE DEFECTIVE, YOU ASSUME THE
+  COST OF ALL NECESSARY SERVICING, REPAIR OR CORRECTION. See the GNU
+  GENERAL PUBLIC LICENSE Version 3, 29 June 2007 for more details.
+
+This module provides the counters and timing histograms sys_log and
+send_alerts record about themselves.  emit() prints them as CloudWatch
+Embedded Metric Format (EMF) JSON lines; in an AWS Lambda function
+CloudWatch Logs turns those lines into CloudWatch metrics without any
+API calls.  snapshot() returns the same numbers as a dict.
+
+Usage:
+  import log_metrics
+  metrics = log_metrics.log_metrics('MyApp', {'Module': 'example'})
+  metrics.increment('items_written', 25)
+  metrics.observe('flush_duration', 12.5, 'Milliseconds')
+  metrics.observe('sns_publish_latency', 40.1, 'Milliseconds',
+                  {'TopicArn': arn})
+  print(metrics.snapshot())
+  metrics.emit()                       #prints EMF lines, then resets
+
+Be aware:
+  1) Histogram values are rounded to 2 significant digits so that the
+     number of distinct values per metric stays small.  EMF allows 100
+     per metric; when there are more, emit() merges the closest values
+     (count weighted, so count and sum are kept) until 100 are left
+
+Dependencies:
+  json
+  time
+  threading
+"""
+import json
+import time
+import threading
+
+
+class log_metrics():
+  """
+  Thread safe counters, gauges and histograms with EMF output.
+  """
+  MAX_VALUES = 100          #EMF limit on values per metric
+
+
+  def __init__(self, namespace='sys_log', dimensions=None):
+    """
+    Args:
+      namespace  (str):      CloudWatch metrics namespace
+      dimensions {str: str}: dimensions added to every metric
+    """
+    self.namespace  = namespace
+    self.dimensions = dict(dimensions) if(dimensions) else {}
+    self.lock       = threading.Lock()
+    self._reset()
+
+
+  def _reset(self):
+    self._counters   = {}     #(name, dims) -> [value, unit]
+    self._gauges     = {}     #(name, dims) -> [value, unit]
+    self._histograms = {}     #(name, dims) -> [{value: count}, unit]
+
+
+  def _key(self, name, dimensions):
+    if(not dimensions):
+      return((name, ()))
+    return((name, tuple(sorted(dimensions.items()))))
+
+
+  def increment(self, name, value=1, unit='Count', dimensions=None):
+    key = self._key(name, dimensions)
+    with self.lock:
+      counter = self._counters.get(key)
+      if(counter is None):
+        self._counters[key] = [value, unit]
+      else:
+        counter[0] += value
+
+
+  def gauge(self, name, value, unit='Count', dimensions=None):
+    with self.lock:
+      self._gauges[self._key(name, dimensions)] = [value, unit]
+
+
+  def observe(self, name, value, unit='Milliseconds', dimensions=None):
+    key   = self._key(name, dimensions)
+    value = float('%.2g' % value)
+    with self.lock:
+      histogram = self._histograms.get(key)
+      if(histogram is None):
+        histogram = self._histograms[key] = [{}, unit]
+      histogram[0][value] = histogram[0].get(value, 0) + 1
+
+
+  def _merged(self, values):
+    """
+    Merge the closest (relative to their size) of a histogram's values
+    until at most MAX_VALUES are left.  A merged value is the count 
+    weighted mean of the two it replaces.
+
+    Args:
+      values {value: count}: histogram
+
+    Returns:
+      ([value], [count]) in value order
+    """
+    points = [[value, count] for value, count in sorted(values.items())]
+    while(len(points) > self.MAX_VALUES):
+      nearest, gap = 0, None
+      for i in range(len(points) - 1):
+        low, high = points[i][0], points[i + 1][0]
+        distance  = (high - low) / max(abs(low), abs(high), 1e-12)
+        if((gap is None) or (distance < gap)):
+          nearest, gap = i, distance
+      (low, low_count), (high, high_count) = points[nearest:nearest + 2]
+      count = low_count + high_count
+      points[nearest:nearest + 2] = [[(low * low_count + high * high_count)
+                                      / count, count]]
+    return([value for value, count in points],
+           [count for value, count in points])
+
+
+  def snapshot(self):
+    """
+    Returns:
+      {'counters': {name: value}, 'gauges': {name: value},
+       'histograms': {name: {'count', 'sum', 'min', 'max', 'values'}}}
+      Names of metrics recorded with extra dimensions are suffixed with
+      '|dimension=value'.
+    """
+    def label(key):
+      name, dims = key
+      return(name + ''.join('|' + k + '=' + str(v) for k, v in dims))
+
+    with self.lock:
+      results = {'counters':   {label(key): counter[0] for key, counter
+                                in self._counters.items()},
+                 'gauges':     {label(key): gauge[0] for key, gauge
+                                in self._gauges.items()},
+                 'histograms': {}}
+      for key, (values, unit) in self._histograms.items():
+        results['histograms'][label(key)] = {
+          'count':  sum(values.values()),
+          'sum':    sum(value * count for value, count in values.items()),
+          'min':    min(values),
+          'max':    max(values),
+          'values': dict(values)}
+    return(results)
+
+
+  def emit(self, reset=True):
+    """
+    Print every metric recorded since the last emit() as EMF JSON, one
+    line per distinct set of dimensions.  Histograms with more than
+    MAX_VALUES values are merged down to MAX_VALUES (see _merged()).
+
+    Returns:
+      [str] the lines printed
+    """
+    with self.lock:
+      groups = {}
+      for source in (self._counters, self._gauges):
+        for (name, dims), (value, unit) in source.items():
+          groups.setdefault(dims, []).append((name, unit, value))
+      histograms = list(self._histograms.items())
+      if(reset):
+        self._reset()
+      else:
+        histograms = [(key, (dict(values), unit))
+                      for key, (values, unit) in histograms]
+    for (name, dims), (values, unit) in histograms:
+      if(len(values) > self.MAX_VALUES):
+        points, counts = self._merged(values)
+      else:
+        points, counts = list(values.keys()), list(values.values())
+      groups.setdefault(dims, []).append(
+        (name, unit, {'Values': points, 'Counts': counts}))
+
+    lines = []
+    timestamp = int(time.time() * 1000)
+    for dims, metrics in groups.items():
+      document = dict(self.dimensions)
+      document.update(dims)
+      document['_aws'] = {
+        'Timestamp': timestamp,
+        'CloudWatchMetrics': [{
+          'Namespace':  self.namespace,
+          'Dimensions': [sorted(set(self.dimensions) | set(k for k, v
+                                                           in dims))],
+          'Metrics':    [{'Name': name, 'Unit': unit}
+                         for name, unit, value in metrics]}]}
+      for name, unit, value in metrics:
+        document[name] = value
+      line = json.dumps(document, separators=(',', ':'))
+      print(line)
+      lines.append(line)
+    return(lines)
@@ -0,0 +1,478 @@
+"""
+Jaye Hicks
+Obligatory legal disclaimer:
+  You are free to use this source code (this file and all other files
+  referenced in this file) "AS IS" WITHOUT WARRANTY OF ANY KIND, EITHER
+  EXPRESSED OR IMPLIED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+  WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE.
+  THE ENTIRE RISK AS TO THE QUALITY AND PERFORMANCE OF THIS SOURCE CODE
+  IS WITH YOU.  SHOULD THE SOURCE CODE PROVE DEFECTIVE, YOU ASSUME THE
+  COST OF ALL NECESSARY SERVICING, REPAIR OR CORRECTION. See the GNU
+  GENERAL PUBLIC LICENSE Version 3, 29 June 2007 for more details.
+
+This module provides a reader for the DynamoDB tables written by
+sys_log.  Instead of scanning a table, it runs one Query per 'date'
+partition key, in parallel, and streams the results back to the caller
+as they arrive, partition by partition, in date / stamp_mod order.
+
+Usage:
+  import log_reader
+  lr = log_reader.log_reader('info_table', 'errors_table', -6)
+  for item in lr.query('2026-10-01', '2026-10-07', module='example',
+                       levels=['ERROR', 'ALARM']):
+    print(item['stamp_mod'], item['message'])
+  week_ago = int(time.time()) - 7 * 86400
+  for item in lr.query_index('example', ['ERROR'], start=week_ago):
+    print(item['stamp_mod'], item['message'])
+  if(lr.issues):
+    #issue(s) occured while querying
+
+Be aware:
+  1) Module, level and locator filters are DynamoDB filter expressions.
+     They cut down what is returned, not the read capacity consumed;
+     only the date and the time range (start / end) narrow the Query
+     itself
+
+  2) Results for a partition whose day has closed never change.  When
+     caching is turned on they are kept in memory (and, optionally, in
+     cache_dir) and reused by later queries with the same filters
+     
+  3) Pass the same 'shards' value given to sys_log to read sharded
+     tables.  Unsharded partitions are always read as well, so tables
+     written before (or without) sharding stay readable
+     
+  4) Messages sys_log stored compressed are decoded before they are
+     yielded (see log_codec); level and locator filters still apply 
+     because the readable '<LEVEL>: (<locator>) ' header is kept
+     
+  5) query_index() reads the optional module_level index (see 
+     log_index) instead of every partition of every day.  It only finds
+     items sys_log wrote with that index key
+     
+  6) Traceback items sys_log writes when capturing tracebacks (sort key
+     'traceback#<fingerprint>') are not yielded by query(); fetch one
+     with traceback(fingerprint, day)
+
+Dependencies:
+  os
+  heapq
+  queue
+  pickle
+  hashlib
+  threading
+  concurrent.futures
+  datetime
+  boto3
+  aws_clients
+  log_codec
+  log_index
+"""
+import os
+import heapq
+import queue
+import pickle
+import hashlib
+import threading
+import concurrent.futures
+from   datetime import datetime, timedelta
+
+from   boto3.dynamodb.conditions import Key, Attr
+
+import aws_clients
+import log_codec
+import log_index
+
+
+class log_reader():
+  """
+  Parallel, streaming Query access to sys_log's info and errors tables.
+
+  if(log_reader.issues):
+    #issue(s) occured while querying
+  """
+  _DONE  = object()         #end of partition marker placed on a queue
+  LEVELS = ('INFO', 'WARN', 'ALARM', 'ERROR')     #sys_log message levels
+
+
+  def __init__(self, info_table, errors_table, tz_offset=6,
+               dynamo_db_access=None, max_workers=8, prefetch_pages=4,
+               cache=False, cache_dir=None, max_cached_partitions=256,
+               shards=None):
+    """
+    Args:
+      info_table   (str):  DynamoDB table name holding info messages
+      errors_table (str):  DynamoDB table name holding error messages
+      tz_offset    (int):  same time zone offset given to sys_log
+      dynamo_db_access:    opt; DynamoDB service resource (e.g., a stub)
+      max_workers  (int):  partitions queried at the same time
+      prefetch_pages (int): pages buffered ahead per partition
+      cache        (bool): cache results for partitions of closed days
+      cache_dir    (str):  opt; also keep cached partitions on disk
+      max_cached_partitions (int): cap on partitions cached in memory
+      shards       (int):  opt; same shards value given to sys_log
+    """
+    self.tables           = {'info': info_table, 'errors': errors_table}
+    self.TZ_OFFSET        = tz_offset
+    self.dynamo_db_access = dynamo_db_access
+    self.max_workers      = max_workers
+    self.prefetch_pages   = prefetch_pages
+    self.cache            = cache or bool(cache_dir)
+    self.cache_dir        = cache_dir
+    self.max_cached_partitions = max_cached_partitions
+    self.shards           = shards
+    self.issues           = []
+    self._cache           = {}
+    self._cache_lock      = threading.Lock()
+
+
+  def _today(self):
+    """
+    Local calendar day, computed the same way sys_log computes it
+    """
+    now = datetime.now()
+    if(self.TZ_OFFSET >= 0):
+      return((now - timedelta(hours=self.TZ_OFFSET)).date())
+    return((now + timedelta(hours=self.TZ_OFFSET)).date())
+
+
+  def _days(self, start_date, end_date):
+    """
+    Returns:
+      ['YYYY-MM-DD'] every day from start_date to end_date, inclusive
+    """
+    first = datetime.strptime(str(start_date)[:10], '%Y-%m-%d').date()
+    last  = datetime.strptime(str(end_date)[:10], '%Y-%m-%d').date()
+    days  = []
+    while(first <= last):
+      days.append(first.isoformat())
+      first += timedelta(days=1)
+    return(days)
+
+
+  def _partitions(self, day):
+    """
+    Returns:
+      ['date' partition key values] holding a day's messages; the plain 
+      'YYYY-MM-DD' key plus, when sharded, 'YYYY-MM-DD#00' ... '#NN'
+    """
+    partitions = [day]
+    if(self.shards):
+      partitions += [day + '#' + str(shard).zfill(2) 
+                     for shard in range(self.shards)]
+    return(partitions)
+
+
+  def _stamp_range(self, start, end):
+    """
+    Returns:
+      key condition on stamp_mod for epoch seconds start to end, 
+      inclusive
+    """
+    low  = str(int(start)) if(start is not None) else '0'
+    high = (str(int(end)) if(end is not None) else '9' * 10) + '+\uffff'
+    return(Key('stamp_mod').between(low, high))
+
+
+  def _query_args(self, day, start, end, module, levels, locator):
+    """
+    Build the Query arguments for one partition.
+
+    Args:
+      day (str):        'date' partition key value
+      start, end (int): opt; epoch seconds bounding stamp_mod
+      module (str):     opt; module name
+      levels [str]:     opt; message levels (e.g., ['ERROR'])
+      locator (str):    opt; locator
+    """
+    key = Key('date').eq(day)
+    if((start is not None) or (end is not None)):
+      key = key & self._stamp_range(start, end)
+    args = {'KeyConditionExpression': key}
+
+    filters = None
+    if(module):
+      #also matches legacy '<secs>+<module>' keys (and longer module
+      #names); _read_partition() keeps only exact module matches
+      filters = Attr('stamp_mod').contains('+' + module)
+    if(levels):
+      level_filter = None
+      for level in levels:
+        condition = Attr('message').begins_with(level.upper() + ': (')
+        level_filter = (condition if(level_filter is None)
+                        else level_filter | condition)
+      filters = level_filter if(filters is None) else filters & level_filter
+    if(locator):
+      #the message header is '<LEVEL>: (<locator>) ' whatever the level
+      locator_filter = None
+      for level in self.LEVELS:
+        condition = Attr('message').begins_with(level + ': (' + locator + 
+                                                ')')
+        locator_filter = (condition if(locator_filter is None)
+                          else locator_filter | condition)
+      filters = (locator_filter if(filters is None) 
+                 else filters & locator_filter)
+    if(filters is not None):
+      args['FilterExpression'] = filters
+    return(args)
+
+
+  def _cache_key(self, table, day, args_signature):
+    return(hashlib.sha1((table + '|' + day + '|' +
+                         args_signature).encode('utf-8')).hexdigest())
+
+
+  def _cache_get(self, key):
+    with self._cache_lock:
+      items = self._cache.get(key)
+    if((items is None) and self.cache_dir):
+      path = os.path.join(self.cache_dir, key + '.pickle')
+      if(os.path.exists(path)):
+        try:
+          with open(path, 'rb') as cache_file:
+            items = pickle.load(cache_file)
+        except Exception as e:
+          print('Could not read cached partition. ' + str(e))
+    return(items)
+
+
+  def _cache_put(self, key, items):
+    with self._cache_lock:
+      if(len(self._cache) >= self.max_cached_partitions):
+        self._cache.pop(next(iter(self._cache)))
+      self._cache[key] = items
+    if(self.cache_dir):
+      try:
+        path = os.path.join(self.cache_dir, key + '.pickle')
+        with open(path + '.tmp', 'wb') as cache_file:
+          pickle.dump(items, cache_file)
+        os.replace(path + '.tmp', path)
+      except Exception as e:
+        print('Could not write cached partition. ' + str(e))
+
+
+  def _read_partition(self, table_name, args, out, stop, cache_key,
+                      module=None):
+    """
+    Page through one partition, putting each page on 'out' as soon as
+    it arrives.  Runs on a worker thread.  With module given, only
+    items whose stamp_mod names exactly that module are kept; the
+    module filter expression (see _query_args()) cannot tell
+    '<secs>+<module>' keys written before the microsecond field was
+    added from those of other modules with longer names.
+    """
+    items = [] if(cache_key is not None) else None
+    try:
+      dynamo_db_access = self.dynamo_db_access
+      if(dynamo_db_access is None):
+        dynamo_db_access = aws_clients.get_resource('dynamodb')
+      table = dynamo_db_access.Table(table_name)
+      args  = dict(args)
+      while(not stop.is_set()):
+        resp = table.query(**args)
+        page = [log_codec.decode_item(item) 
+                for item in resp.get('Items', [])
+                if((not item['stamp_mod'].startswith('traceback#')) and
+                   ((module is None) or
+                    (item['stamp_mod'].split('+')[1:2] == [module])))]
+        if(items is not None):
+          items.extend(page)
+        if(page):
+          out.put(page)
+        if('LastEvaluatedKey' not in resp):
+          break
+        args['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+      else:
+        items = None                          #abandoned; do not cache
+      if(items is not None):
+        self._cache_put(cache_key, items)
+    except Exception as e:
+      self.issues.append('Exception thrown querying ' + table_name +
+                         '. Exception: ' + str(e))
+      print('Exception thrown querying ' + table_name + '. Exception: ' +
+            str(e))
+    finally:
+      out.put(self._DONE)
+
+
+  def query(self, start_date, end_date, module=None, levels=None,
+            locator=None, start=None, end=None, tables=('errors', 'info')):
+    """
+    Stream every item in the date range that matches the filters.
+    Partitions are queried in parallel (max_workers at a time) and a
+    few pages ahead; items are yielded table by table, day by day and,
+    within a day, in stamp_mod order.
+
+    Args:
+      start_date (str):  'YYYY-MM-DD' first day (partition), inclusive
+      end_date   (str):  'YYYY-MM-DD' last day (partition), inclusive
+      module     (str):  opt; only messages from this module
+      levels     [str]:  opt; only messages with these levels
+      locator    (str):  opt; only messages from this locator
+      start, end (int):  opt; epoch seconds narrowing stamp_mod
+      tables  [str]:     'errors' and / or 'info'
+
+    When the tables are sharded, the shard partitions of a day (and the
+    day's unsharded partition) are queried together and merged back
+    into a single stamp_mod ordered stream.
+
+    Returns:
+      generator of DynamoDB items ({})
+    """
+    today  = self._today()
+    groups = []                        #one group per table and day
+    for name in tables:
+      for day in self._days(start_date, end_date):
+        closed = (self.cache and 
+                  (datetime.strptime(day, '%Y-%m-%d').date() + 
+                   timedelta(days=1) < today))
+        group  = []
+        for partition in self._partitions(day):
+          args = self._query_args(partition, start, end, module, levels, 
+                                  locator)
+          cache_key = None
+          if(closed):
+            cache_key = self._cache_key(self.tables[name], partition,
+                                        repr((start, end, module,
+                                              levels and sorted(levels),
+                                              locator)))
+          group.append((self.tables[name], args, cache_key))
+        groups.append(group)
+        
+    #every partition of a day must be able to run at the same time for
+    #the merge below to make progress
+    stop     = threading.Event()
+    executor = concurrent.futures.ThreadPoolExecutor(
+                 max_workers=max(1, self.max_workers, 
+                                 max(len(group) for group in groups) 
+                                 if(groups) else 1))
+    outs     = []
+    try:
+      merged = []
+      for group in groups:
+        sources = []
+        for table_name, args, cache_key in group:
+          cached = (self._cache_get(cache_key) if(cache_key is not None)
+                    else None)
+          if(cached is not None):
+            sources.append(iter(cached))
+          else:
+            out = queue.Queue(maxsize=self.prefetch_pages)
+            executor.submit(self._read_partition, table_name, args, out, 
+                            stop, cache_key, module)
+            outs.append(out)
+            sources.append(self._drain_queue(out))
+        if(len(sources) == 1):
+          merged.append(sources[0])
+        else:
+          merged.append(heapq.merge(*sources, 
+                                    key=lambda item: item['stamp_mod']))
+      for source in merged:
+        for item in source:
+          yield(item)
+    finally:
+      self._abandon(stop, outs, executor)
+
+
+  def query_index(self, module, levels=('ALARM', 'ERROR'), start=None,
+                  end=None, locator=None, tables=('errors',),
+                  index_name=log_index.INDEX_NAME):
+    """
+    Stream a module's items of the given levels from the module_level
+    index (see log_index).  One Query per level runs in parallel and
+    the results are merged; items are yielded table by table, in 
+    stamp_mod order.
+
+    Args:
+      module     (str):  module name
+      levels     [str]:  message levels
+      start, end (int):  opt; epoch seconds narrowing stamp_mod
+      locator    (str):  opt; only messages from this locator
+      tables     [str]:  'errors' and / or 'info'
+      index_name (str):  index name
+
+    Returns:
+      generator of DynamoDB items ({})
+    """
+    stop     = threading.Event()
+    executor = concurrent.futures.ThreadPoolExecutor(
+                 max_workers=max(1, self.max_workers, len(levels)))
+    outs     = []
+    try:
+      for name in tables:
+        sources = []
+        for level in levels:
+          args = {'IndexName': index_name,
+                  'KeyConditionExpression': 
+                    Key(log_index.PARTITION_KEY).eq(
+                      log_index.index_key(module, level)) &
+                    self._stamp_range(start, end)}
+          if(locator):
+            args['FilterExpression'] = Attr('locator').eq(locator)
+          out = queue.Queue(maxsize=self.prefetch_pages)
+          executor.submit(self._read_partition, self.tables[name], args, 
+                          out, stop, None)
+          outs.append(out)
+          sources.append(self._drain_queue(out))
+        for item in heapq.merge(*sources, 
+                                key=lambda item: item['stamp_mod']):
+          yield(item)
+    finally:
+      self._abandon(stop, outs, executor)
+
+
+  def traceback(self, fingerprint, day, table='errors'):
+    """
+    Fetch the traceback sys_log stored for a fingerprint on a day.
+
+    Args:
+      fingerprint (str): a record's 'fingerprint' attribute
+      day         (str): 'YYYY-MM-DD'; the record's 'date' (a shard 
+                         suffix is ignored)
+      table       (str): 'errors' or 'info'; sys_log's traceback_table
+
+    Returns:
+      the traceback item ({}; the rendered traceback is in 'message'),
+      or None
+    """
+    try:
+      dynamo_db_access = self.dynamo_db_access
+      if(dynamo_db_access is None):
+        dynamo_db_access = aws_clients.get_resource('dynamodb')
+      resp = dynamo_db_access.Table(self.tables[table]).query(
+               KeyConditionExpression=Key('date').eq(str(day)[:10]) &
+                 Key('stamp_mod').eq('traceback#' + fingerprint))
+      for item in resp.get('Items', []):
+        return(log_codec.decode_item(item))
+    except Exception as e:
+      self.issues.append('Exception thrown fetching traceback ' + 
+                         fingerprint + '. Exception: ' + str(e))
+      print('Exception thrown fetching traceback ' + fingerprint + 
+            '. Exception: ' + str(e))
+    return(None)
+
+
+  def _abandon(self, stop, outs, executor):
+    """
+    Stop the workers of a query the caller stopped reading, or that 
+    ended
+    """
+    stop.set()
+    for out in outs:                         #unblock abandoned producers
+      while(True):
+        try:
+          out.get_nowait()
+        except queue.Empty:
+          break
+    executor.shutdown(wait=False, cancel_futures=True)
+      
+      
+  def _drain_queue(self, out):
+    """
+    Yield the items of every page a _read_partition() worker puts on 
+    'out', until the end of partition marker.
+    """
+    page = out.get()
+    while(page is not self._DONE):
+      for item in page:
+        yield(item)
+      page = out.get()
@@ -0,0 +1,274 @@
+"""
+Jaye Hicks
+Obligatory legal disclaimer:
+  You are free to use this source code (this file and all other files
+  referenced in this file) "AS IS" WITHOUT WARRANTY OF ANY KIND, EITHER
+  EXPRESSED OR IMPLIED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+  WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE.
+  THE ENTIRE RISK AS TO THE QUALITY AND PERFORMANCE OF THIS SOURCE CODE
+  IS WITH YOU.  SHOULD THE SOURCE CODE PROVE DEFECTIVE, YOU ASSUME THE
+  COST OF ALL NECESSARY SERVICING, REPAIR OR CORRECTION. See the GNU
+  GENERAL PUBLIC LICENSE Version 3, 29 June 2007 for more details.
+
+This module provides sinks: destinations, besides sys_log's DynamoDB
+tables, that buffered system log messages are written to at flush time.
+Each sink takes only the levels it is given, and batches, limits and
+retries its writes on its own.  sys_log runs every sink in parallel
+with its DynamoDB write.
+
+  cloudwatch_logs_sink  CloudWatch Logs, batched PutLogEvents calls
+  ndjson_sink           local file, one JSON object per line; also a
+                        fast, offline way to see what sys_log writes
+
+Every record reaches a sink as a dict (an entry):
+  {'date', 'stamp_mod', 'module', 'level', 'locator', 'message',
+   'timestamp'}  plus 'exception_type' when an exception was logged,
+  and 'count', 'first_seen' and 'last_seen' for coalesced records
+
+Usage:
+  import log_sinks, sys_log
+  sinks = [log_sinks.cloudwatch_logs_sink('/app/sys_log',
+                                          levels=['ALARM', 'ERROR']),
+           log_sinks.ndjson_sink('/tmp/sys_log.ndjson')]
+  sl = sys_log.sys_log('my_module', 'info_table', 'errors_table', -6,
+                       155520000, sinks=sinks, dynamodb_levels=['ERROR'])
+  sl.save_messages_to_db()
+  print(sl.sink_reports)      #{sink name: {'written': n, 'failed': n}}
+
+  class my_sink(log_sinks.log_sink):     #a new destination
+    def _send(self, batch):
+      #write the entries in batch; raise to have the batch retried
+
+Dependencies:
+  os
+  json
+  time
+  random
+  threading
+  aws_clients  (cloudwatch_logs_sink only)
+"""
+import os
+import json
+import time
+import random
+import threading
+
+import aws_clients
+
+
+class log_sink():
+  """
+  Base class of every sink: level routing, batching and retries.  A
+  subclass implements _send(batch) and, when its service limits batches
+  differently, overrides the class limits below.
+
+  if(log_sink.issues):
+    #issue(s) occured writing to the sink
+  """
+  name = 'sink'
+
+
+  def __init__(self, levels=None, batch_size=500, max_batch_bytes=1048576,
+               max_retries=3, backoff_base=0.1, backoff_cap=2.0):
+    """
+    Args:
+      levels          [str]: opt; levels this sink takes (default all)
+      batch_size      (int): entries per _send() call
+      max_batch_bytes (int): approximate bytes per _send() call
+      max_retries     (int): retries of a failed batch
+      backoff_base, backoff_cap (float): jittered exponential backoff
+    """
+    self.levels          = (frozenset(level.upper() for level in levels)
+                            if(levels) else None)
+    self.batch_size      = batch_size
+    self.max_batch_bytes = max_batch_bytes
+    self.max_retries     = max_retries
+    self.backoff_base    = backoff_base
+    self.backoff_cap     = backoff_cap
+    self.issues          = []
+
+
+  def accepts(self, level):
+    return((self.levels is None) or (level in self.levels))
+
+
+  def _entry_size(self, entry):
+    return(len(json.dumps(entry, separators=(',', ':'))))
+
+
+  def _starts_batch(self, batch, entry):
+    """
+    True if entry must not join batch (beyond the count / size limits)
+    """
+    return(False)
+
+
+  def _batches(self, entries):
+    batch, size = [], 0
+    for entry in entries:
+      length = self._entry_size(entry)
+      if(batch and ((len(batch) >= self.batch_size) or
+                    (size + length > self.max_batch_bytes) or
+                    self._starts_batch(batch, entry))):
+        yield(batch)
+        batch, size = [], 0
+      batch.append(entry)
+      size += length
+    if(batch):
+      yield(batch)
+
+
+  def _send(self, batch):
+    raise NotImplementedError(self.name + ' sink has no _send()')
+
+
+  def write(self, entries, failed=None):
+    """
+    Write entries in batches, retrying a failed batch max_retries times
+    with jittered exponential backoff.
+
+    Args:
+      entries [{}]:  entries (see module docstring), oldest first
+      failed  [str]: opt; receives the stamp_mod of entries not written
+
+    Returns:
+      {'written': int, 'failed': int}
+    """
+    report = {'written': 0, 'failed': 0}
+    for batch in self._batches(entries):
+      for attempt in range(self.max_retries + 1):
+        try:
+          self._send(batch)
+          report['written'] += len(batch)
+          break
+        except Exception as e:
+          if(attempt >= self.max_retries):
+            report['failed'] += len(batch)
+            if(failed is not None):
+              failed.extend(entry['stamp_mod'] for entry in batch)
+            self.issues.append('Exception thrown writing to ' + self.name +
+                               ' sink. Exception: ' + str(e))
+            print('Exception thrown writing to ' + self.name +
+                  ' sink. Exception: ' + str(e))
+          else:
+            time.sleep(random.uniform(0, min(self.backoff_cap,
+                                             self.backoff_base *
+                                             (2 ** attempt))))
+    return(report)
+
+
+class ndjson_sink(log_sink):
+  """
+  Appends entries to a local file, one JSON object per line.
+  """
+  name = 'ndjson'
+
+
+  def __init__(self, path, levels=None, fsync=False, **kwargs):
+    """
+    Args:
+      path   (str):  file, created if missing
+      levels [str]:  opt; levels this sink takes (default all)
+      fsync  (bool): fsync() after every batch
+      kwargs:        log_sink batching / retry settings
+    """
+    super().__init__(levels, **kwargs)
+    self.path  = path
+    self.fsync = fsync
+    self.lock  = threading.Lock()
+
+
+  def _send(self, batch):
+    data = ''.join(json.dumps(entry, separators=(',', ':')) + '\n'
+                   for entry in batch)
+    with self.lock:
+      with open(self.path, 'a', encoding='utf-8') as sink_file:
+        sink_file.write(data)
+        if(self.fsync):
+          sink_file.flush()
+          os.fsync(sink_file.fileno())
+
+
+class cloudwatch_logs_sink(log_sink):
+  """
+  Writes entries, as JSON, to a CloudWatch Logs stream with batched
+  PutLogEvents calls.  The stream is created on first use.
+  """
+  name            = 'cloudwatch_logs'
+  EVENT_OVERHEAD  = 26                   #bytes PutLogEvents adds per event
+  MAX_SPAN        = 86400000             #ms one batch may span
+
+
+  def __init__(self, log_group, log_stream=None, levels=None,
+               logs_client=None, **kwargs):
+    """
+    Args:
+      log_group   (str): existing CloudWatch Logs log group
+      log_stream  (str): opt; stream name (default: unique per process)
+      levels      [str]: opt; levels this sink takes (default all)
+      logs_client:       opt; CloudWatch Logs client (e.g., a stub)
+      kwargs:            log_sink batching / retry settings; batches are
+                         capped at PutLogEvents' 10,000 events / 1 MB
+    """
+    kwargs['batch_size']      = min(kwargs.get('batch_size', 10000), 10000)
+    kwargs['max_batch_bytes'] = min(kwargs.get('max_batch_bytes', 1048576),
+                                    1048576)
+    super().__init__(levels, **kwargs)
+    self.log_group   = log_group
+    self.log_stream  = (log_stream if(log_stream) else
+                        'sys_log-' + os.urandom(4).hex())
+    self.logs_client = logs_client
+    self._created    = False
+
+
+  def _timestamp(self, entry):
+    """
+    Milliseconds since the epoch, from the stamp_mod sort key
+    """
+    fields = entry['stamp_mod'].split('+')
+    try:
+      return(int(fields[0]) * 1000 + int(fields[2][:6]) // 1000)
+    except (IndexError, ValueError):
+      return(int(entry['timestamp']) * 1000)
+
+
+  def _entry_size(self, entry):
+    return(len(json.dumps(entry, separators=(',', ':')).encode('utf-8')) +
+           self.EVENT_OVERHEAD)
+
+
+  def _starts_batch(self, batch, entry):
+    return(self._timestamp(entry) - self._timestamp(batch[0]) >=
+           self.MAX_SPAN)
+
+
+  def _batches(self, entries):
+    return(super()._batches(sorted(entries, key=self._timestamp)))
+
+
+  def _client(self):
+    if(self.logs_client is None):
+      self.logs_client = aws_clients.get_client('logs')
+    return(self.logs_client)
+
+
+  def _send(self, batch):
+    client = self._client()
+    if(not self._created):
+      try:
+        client.create_log_stream(logGroupName=self.log_group,
+                                 logStreamName=self.log_stream)
+      except Exception as e:
+        code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+        if(code != 'ResourceAlreadyExistsException'):
+          raise
+      self._created = True
+    resp = client.put_log_events(
+      logGroupName=self.log_group, logStreamName=self.log_stream,
+      logEvents=[{'timestamp': self._timestamp(entry),
+                  'message': json.dumps(entry, separators=(',', ':'))}
+                 for entry in batch])
+    rejected = resp.get('rejectedLogEventsInfo')
+    if(rejected):
+      self.issues.append('CloudWatch Logs rejected events: ' + str(rejected))
+      print('CloudWatch Logs rejected events: ' + str(rejected))
@@ -0,0 +1,236 @@
+"""
+Jaye Hicks
+Obligatory legal disclaimer:
+  You are free to use this source code (this file and all other files
+  referenced in this file) "AS IS" WITHOUT WARRANTY OF ANY KIND, EITHER
+  EXPRESSED OR IMPLIED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+  WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE.
+  THE ENTIRE RISK AS TO THE QUALITY AND PERFORMANCE OF THIS SOURCE CODE
+  IS WITH YOU.  SHOULD THE SOURCE CODE PROVE DEFECTIVE, YOU ASSUME THE
+  COST OF ALL NECESSARY SERVICING, REPAIR OR CORRECTION. See the GNU
+  GENERAL PUBLIC LICENSE Version 3, 29 June 2007 for more details.
+
+This module provides an append-only, write-ahead spool file used by
+sys_log to survive AWS Lambda timeouts and crashes.  Every buffered
+system log message is appended to the spool before it is written to
+DynamoDB; once DynamoDB has accepted it, an acknowledgement is appended.
+The AWS Lambda service keeps /tmp when it reuses a container, so the
+next sys_log object (or the next sys_log.reset()) replays every entry
+that was never acknowledged.
+
+File layout: a sequence of length-prefixed frames, each a 1 byte frame
+type, a 4 byte big-endian payload length and the payload.
+  'E' frame: one entry, JSON encoded
+  'K' frame: acknowledged keys, newline separated
+A torn frame at the end of the file (e.g., the process was killed
+mid-write) is ignored.
+
+Usage:
+  import log_spool
+  spool = log_spool.log_spool('/tmp/sys_log_my_module.spool')
+  spool.append({'k': 'key1', ...})
+  spool.ack(['key1'])
+  for entry in spool.pending():
+    #entries appended but never acknowledged
+
+Be aware:
+  1) Appends go straight to the operating system with os.write(), so
+     they survive the Python process being killed.  fsync() is batched
+     (every fsync_every appends or fsync_interval seconds), so a crash
+     of the whole machine can lose the most recent appends
+
+  2) The spool is bounded.  When an append or an acknowledgement takes
+     it past max_bytes it is compacted (acknowledged entries removed);
+     if it is still too big the oldest unacknowledged entries are 
+     dropped and counted in log_spool.dropped.  During a long outage,
+     when nothing is acknowledged, the spool therefore keeps the newest
+     entries only
+
+Dependencies:
+  os
+  json
+  time
+  struct
+  threading
+"""
+import os
+import json
+import time
+import struct
+import threading
+
+
+class log_spool():
+  """
+  Append-only, length-prefixed write-ahead spool file.
+
+  if(log_spool.issues):
+    #issue(s) occured opening, writing or compacting the spool
+  """
+  ENTRY  = b'E'
+  ACK    = b'K'
+  HEADER = struct.Struct('>cI')
+
+
+  def __init__(self, path, max_bytes=8388608, fsync_every=64,
+               fsync_interval=1.0):
+    """
+    Args:
+      path           (str):   spool file, created if missing
+      max_bytes      (int):   size that triggers compaction; the file
+                              never stays larger
+      fsync_every    (int):   appends between fsync() calls
+      fsync_interval (float): max seconds between fsync() calls
+    """
+    self.path           = path
+    self.max_bytes      = max_bytes
+    self.fsync_every    = fsync_every
+    self.fsync_interval = fsync_interval
+    self.issues         = []
+    self.dropped        = 0
+    self.lock           = threading.Lock()
+    self._unsynced      = 0
+    self._last_sync     = time.monotonic()
+    self._fd            = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND,
+                                  0o600)
+    self.size           = os.fstat(self._fd).st_size
+
+
+  def _write_frame(self, frame_type, payload):
+    """
+    Callers must hold self.lock.
+    """
+    frame = self.HEADER.pack(frame_type, len(payload)) + payload
+    os.write(self._fd, frame)
+    self.size      += len(frame)
+    self._unsynced += 1
+    now = time.monotonic()
+    if((self._unsynced >= self.fsync_every) or
+       (now - self._last_sync >= self.fsync_interval)):
+      os.fsync(self._fd)
+      self._unsynced  = 0
+      self._last_sync = now
+
+
+  def append(self, entry):
+    """
+    Compacts the spool when it has grown past max_bytes.
+
+    Args:
+      entry ({}): JSON serializable; must carry its key under 'k'
+    """
+    payload = json.dumps(entry, separators=(',', ':')).encode('utf-8')
+    with self.lock:
+      self._write_frame(self.ENTRY, payload)
+      if(self.size > self.max_bytes):
+        self._compact()
+
+
+  def ack(self, keys):
+    """
+    Record that the entries with these keys were delivered (or were
+    deliberately discarded) and must not be replayed.  Compacts the
+    spool when it has grown past max_bytes.
+
+    Args:
+      keys [str]: entry keys
+    """
+    if(keys):
+      payload = '\n'.join(keys).encode('utf-8')
+      with self.lock:
+        self._write_frame(self.ACK, payload)
+        if(self.size > self.max_bytes):
+          self._compact()
+
+
+  def sync(self):
+    """
+    fsync() anything appended since the last fsync()
+    """
+    with self.lock:
+      if(self._unsynced):
+        os.fsync(self._fd)
+        self._unsynced  = 0
+        self._last_sync = time.monotonic()
+
+
+  def _read(self):
+    """
+    Returns:
+      [{}] unacknowledged entries, oldest first
+    """
+    with open(self.path, 'rb') as spool_file:
+      data = spool_file.read()
+    entries = {}
+    offset  = 0
+    while(offset + self.HEADER.size <= len(data)):
+      frame_type, length = self.HEADER.unpack_from(data, offset)
+      start = offset + self.HEADER.size
+      if(start + length > len(data)):
+        break                                       #torn final frame
+      payload = data[start:start + length]
+      offset  = start + length
+      try:
+        if(frame_type == self.ENTRY):
+          entry = json.loads(payload.decode('utf-8'))
+          entries[entry['k']] = entry
+        elif(frame_type == self.ACK):
+          for key in payload.decode('utf-8').split('\n'):
+            entries.pop(key, None)
+      except Exception as e:
+        self.issues.append('Skipped unreadable spool frame. ' + str(e))
+        print('Skipped unreadable spool frame. ' + str(e))
+    return(list(entries.values()))
+
+
+  def pending(self):
+    """
+    Returns:
+      [{}] entries appended but never acknowledged, oldest first
+    """
+    with self.lock:
+      return(self._read())
+
+
+  def _compact(self):
+    """
+    Rewrite the spool with only the unacknowledged entries.  If that is
+    still more than half of max_bytes the oldest entries are dropped.
+    Callers must hold self.lock.
+    """
+    try:
+      entries = self._read()
+      frames  = []
+      for entry in entries:
+        payload = json.dumps(entry, separators=(',', ':')).encode('utf-8')
+        frames.append(self.HEADER.pack(self.ENTRY, len(payload)) + payload)
+      total = sum(len(frame) for frame in frames)
+      while(frames and (total > self.max_bytes // 2)):
+        total -= len(frames.pop(0))
+        self.dropped += 1
+      temp = self.path + '.compact'
+      with open(temp, 'wb') as spool_file:
+        spool_file.write(b''.join(frames))
+        spool_file.flush()
+        os.fsync(spool_file.fileno())
+      os.replace(temp, self.path)
+      os.close(self._fd)
+      self._fd        = os.open(self.path, os.O_RDWR | os.O_APPEND)
+      self.size       = total
+      self._unsynced  = 0
+    except Exception as e:
+      self.issues.append('Exception thrown compacting spool. ' + str(e))
+      print('Exception thrown compacting spool. ' + str(e))
+
+
+  def compact(self):
+    with self.lock:
+      self._compact()
+
+
+  def close(self):
+    with self.lock:
+      if(self._fd is not None):
+        os.fsync(self._fd)
+        os.close(self._fd)
+        self._fd = None
@@ -29,15 +29,39 @@ Be aware:
    provided proper configuration
 
 2) Processing a high volume of closely-timed alert messages was not 
-   a design goal of send_alerts()
+   a design goal of send_alerts().  Pass concurrent=True to publish all
+   (message, topic) pairs at once through a bounded pool of worker 
+   threads; total latency is then close to the slowest single publish
 
 3) Post creation, a send_alerts() object offers a list of strings that
    will be empty if no issues were encountered.  If initiatization or
    message submission encountered any issues, they will be captured in
    this list.
 
+4) Pass a log_metrics object as 'metrics' to record the latency of 
+   every publish, per topic arn.  Give it the sys_log object's metrics
+   (sys_log.metrics) and they are printed with sys_log's next flush
+
+5) Pass an alert_limiter object as 'limiter' to rate limit and 
+   deduplicate alerts per topic.  Suppressed alerts are not failures:
+   they are counted in results[arn]['suppressed'], not in 'issues', 
+   and the count is noted in the next alert sent to the topic.  An 
+   alert that fails to publish gives its token, deduplication claim and
+   suppressed count back to the limiter (see alert_limiter.release())
+
+6) digest=True groups every alert of one send_alerts() call by topic
+   and publishes each group with PublishBatch, 10 entries per call.  
+   With summarize=True too, each topic's alerts are merged into a 
+   single summary message instead (one page to on-call, not many)
+
+7) Importing send_alerts does not import boto3; the SNS client is built
+   by the first publish.  Call aws_clients.prewarm() to pay that cost
+   up front instead (e.g., during Lambda initialization)
+
 Dependencies:
-  boto3
+  time
+  aws_clients    (imports boto3 on first use)
+  concurrent.futures  (imported by concurrent=True)
 """
 class send_alerts():
   """
@@ -55,10 +79,277 @@ class send_alerts():
     a_sm = send_alerts(param)
     if(a_sm.issues): 
       #issue(s) occured during initialization or sending message(s)
+    a_sm = send_alerts(param, concurrent=True, publish_timeout=5)
+    for arn, counts in a_sm.results.items():
+      #counts['sent'], counts['failed'] for each topic arn
+    a_sm = await send_alerts.create_async(param)   #from async code
+    a_sm = send_alerts(param, metrics=sl.metrics)  #publish latencies
+    a_sm = send_alerts(param, limiter=limiter)     #see alert_limiter
+    a_sm = send_alerts(params, digest=True)        #PublishBatch per topic
   """
-  import boto3
+  import time
+  import aws_clients
   
   
+  def _publish(self, sns_access, arn, message):
+    """
+    Publish one message to one AWS SNS topic.  Safe to run from a 
+    worker thread; nothing on self is touched apart from the (thread 
+    safe) metrics object.
+    
+    Returns:
+      None if the publish succeeded, otherwise a description of the issue
+    """
+    issue = None
+    if(self.metrics is not None):
+      started = self.time.perf_counter()
+    try:
+      resp = sns_access.publish(TargetArn=arn, Message=message)
+      if(resp['ResponseMetadata']['HTTPStatusCode'] != 200):
+        issue = ('Response from publish to sns topic indicates failure. ' +
+                 'HTTPStatusCode: ' + 
+                 str(resp['ResponseMetadata']['HTTPStatusCode']))
+    except Exception as e:
+      issue = ('Exception while publishing to sns topic. Exception ' +
+               'involving: ' + str(e))
+    if(self.metrics is not None):
+      self._record_latency(arn, started, issue)
+    return(issue)
+    
+    
+  def _record_latency(self, arn, started, issue):
+    """
+    Record one publish's latency (and failure, if any) in self.metrics
+    """
+    self.metrics.observe('sns_publish_latency', 
+                         (self.time.perf_counter() - started) * 1000,
+                         'Milliseconds', {'TopicArn': arn})
+    if(issue):
+      self.metrics.increment('sns_publish_failed', 1, 'Count', 
+                             {'TopicArn': arn})
+    
+    
+  def _counts(self, arn):
+    return(self.results.setdefault(arn, {'sent': 0, 'failed': 0, 
+                                         'suppressed': 0}))
+    
+    
+  def _limit(self, message, arn):
+    """
+    Run one (message, topic arn) pair past the limiter, if there is one.
+    
+    Returns:
+      (the message to publish, or None if the limiter suppressed it,
+       limiter ticket to pass to _release() if the publish fails)
+    """
+    if(self.limiter is None):
+      return((message, None))
+    message, ticket = self.limiter.acquire(arn, message)
+    if(message is None):
+      self._counts(arn)['suppressed'] += 1
+      print('Alert suppressed by rate limiting / deduplication. Topic: ' + 
+            arn)
+    return((message, ticket))
+    
+    
+  def _release(self, ticket):
+    """
+    Hand the limiter back what an alert that failed to publish took
+    """
+    if((ticket is not None) and (self.limiter is not None)):
+      self.limiter.release(ticket)
+    
+    
+  def _record_result(self, arn, issue, ticket=None):
+    counts = self._counts(arn)
+    if(issue):
+      self._release(ticket)
+      counts['failed'] += 1
+      self.issues.append(issue + ' Topic: ' + arn)
+      print(issue + ' Topic: ' + arn)
+    else:
+      counts['sent'] += 1
+      print('Successfully published message to topic: ' + arn)
+      
+      
+  def _digest_batches(self, entries):
+    """
+    Group (message, topic arn, params index) entries by topic, in order,
+    into PublishBatch requests of at most BATCH_ENTRIES entries and 
+    MAX_MESSAGE_BYTES bytes.  With summarize, each topic's messages are
+    first merged into as few summary messages as fit MAX_MESSAGE_BYTES.
+    
+    Returns:
+      [(topic arn, [(message, [params index])])] one item per request
+    """
+    by_topic = {}
+    for message, arn, origin in entries:
+      by_topic.setdefault(arn, []).append((message, [origin]))
+    batches = []
+    for arn, group in by_topic.items():
+      if(self.summarize and (len(group) > 1)):
+        merged = []
+        for message, origins in group:
+          if(merged and 
+             (len((merged[-1][0] + message).encode('utf-8')) + 64 <=
+              self.MAX_MESSAGE_BYTES)):
+            merged[-1][0] += '\n\n' + message
+            merged[-1][1].extend(origins)
+          else:
+            merged.append([message, list(origins)])
+        group = []
+        for message, origins in merged:
+          if(len(origins) > 1):
+            message = str(len(origins)) + ' alerts:\n\n' + message
+          group.append((message, origins))
+      batch, size = [], 0
+      for message, origins in group:
+        length = len(message.encode('utf-8'))
+        if(batch and ((len(batch) >= self.BATCH_ENTRIES) or 
+                      (size + length > self.MAX_MESSAGE_BYTES))):
+          batches.append((arn, batch))
+          batch, size = [], 0
+        batch.append((message, origins))
+        size += length
+      if(batch):
+        batches.append((arn, batch))
+    return(batches)
+    
+    
+  def _digest_issue(self, arn, origins, issue):
+    """
+    Record a failed digest entry against every params entry it carried
+    """
+    counts = self._counts(arn)
+    for origin in origins:
+      tickets = self._digest_tickets.get((origin, arn))
+      if(tickets):
+        self._release(tickets.pop())
+      counts['failed'] += 1
+      text = (issue + ' params[' + str(origin) + '] Topic: ' + arn)
+      self.issues.append(text)
+      print(text)
+      
+      
+  def _send_digest(self, entries):
+    """
+    Publish (message, topic arn, params index) entries in digest mode
+    (see _digest_batches()).  A request carrying a single message uses
+    publish(); larger ones use publish_batch().  Per entry failures 
+    reported by PublishBatch, and failed requests, are mapped back to 
+    the params entries they came from.
+    """
+    try:
+      sns_access = self.aws_clients.get_client('sns')
+    except Exception as e:
+      for message, arn, origin in entries:
+        self._digest_issue(arn, [origin], 'Exception while creating sns ' +
+                           'client. Exception involving: ' + str(e))
+      return
+    
+    for arn, batch in self._digest_batches(entries):
+      if(len(batch) == 1):
+        message, origins = batch[0]
+        issue = self._publish(sns_access, arn, message)
+        if(issue):
+          self._digest_issue(arn, origins, issue)
+        else:
+          self._counts(arn)['sent'] += len(origins)
+          print('Successfully published message to topic: ' + arn)
+        continue
+        
+      if(self.metrics is not None):
+        started = self.time.perf_counter()
+      ids = {'a' + str(index): origins 
+             for index, (message, origins) in enumerate(batch)}
+      try:
+        resp = sns_access.publish_batch(
+          TopicArn=arn, 
+          PublishBatchRequestEntries=[{'Id': 'a' + str(index), 
+                                       'Message': message}
+                                      for index, (message, origins) 
+                                      in enumerate(batch)])
+        failed = resp.get('Failed', [])
+        for entry in resp.get('Successful', []):
+          self._counts(arn)['sent'] += len(ids.get(entry['Id'], ()))
+        for entry in failed:
+          self._digest_issue(arn, ids.get(entry['Id'], []), 
+                             'PublishBatch entry failed. Code: ' + 
+                             str(entry.get('Code')) + ' ' + 
+                             str(entry.get('Message', '')) + '.')
+        print('Published batch of ' + str(len(batch) - len(failed)) + 
+              ' messages to topic: ' + arn)
+      except Exception as e:
+        failed = batch
+        for message, origins in batch:
+          self._digest_issue(arn, origins, 'Exception while publishing ' + 
+                             'batch to sns topic. Exception involving: ' +
+                             str(e) + '.')
+      if(self.metrics is not None):
+        self._record_latency(arn, started, failed)
+        
+        
+  def _send_sns_concurrently(self, pairs, tickets=None):
+    """
+    Publish every (message, topic arn) pair through a bounded pool of 
+    worker threads.  A publish that runs longer than publish_timeout 
+    seconds is recorded as failed without waiting for it; a slow or 
+    failing topic never blocks or cancels the others.
+    
+    Args:
+      pairs [(str, str)]: message and topic arn pairs
+      tickets [ticket]:   opt; limiter ticket of each pair
+    """
+    import concurrent.futures
+    if(tickets is None):
+      tickets = [None] * len(pairs)
+    try:
+      sns_access = self.aws_clients.get_client('sns')
+    except Exception as e:
+      for (message, arn), ticket in zip(pairs, tickets):
+        self._record_result(arn, 'Exception while creating sns client. ' + 
+                            'Exception involving: ' + str(e), ticket)
+      return
+    
+    started = {}
+    def publish(index, message, arn):
+      started[index] = self.time.monotonic()
+      return(self._publish(sns_access, arn, message))
+      
+    executor = concurrent.futures.ThreadPoolExecutor(
+                 max_workers=min(self.max_workers, len(pairs)))
+    futures  = {executor.submit(publish, index, message, arn): index
+                for index, (message, arn) in enumerate(pairs)}
+    waves    = -(-len(pairs) // self.max_workers)
+    deadline = self.time.monotonic() + self.publish_timeout * waves
+    outcome  = {}
+    pending  = set(futures)
+    while(pending):
+      now = self.time.monotonic()
+      for future in list(pending):
+        index = futures[future]
+        if(future.done()):
+          outcome[index] = future.result()
+          pending.discard(future)
+        elif((now >= deadline) or 
+             ((index in started) and 
+              (now - started[index] >= self.publish_timeout))):
+          future.cancel()
+          outcome[index] = ('Publish to sns topic timed out after ' +
+                            str(self.publish_timeout) + ' seconds.')
+          pending.discard(future)
+      if(pending):
+        expiries = [started[futures[f]] + self.publish_timeout 
+                    for f in pending if futures[f] in started]
+        wait_for = min(expiries + [deadline]) - now
+        concurrent.futures.wait(pending, timeout=max(wait_for, 0.001),
+          return_when=concurrent.futures.FIRST_COMPLETED)
+    executor.shutdown(wait=False)
+    
+    for index, (message, arn) in enumerate(pairs):
+      self._record_result(arn, outcome[index], tickets[index])
+      
+      
   def _send_sns_messages(self, param):
     """
     Send a single message to one or more AWS SNS topics.  The message
@@ -73,21 +364,35 @@ class send_alerts():
           'message':'an alert message', 
           'topic_arns':['arn:aws:sns:us-east-1:12345678901:MyAlert']}]
     """  
+    ticket = None
     try:
-      sns_access = self.boto3.client('sns')
+      sns_access = self.aws_clients.get_client('sns')
       for arn in param['topic_arns']:
-        print('Sending to: ' + arn + ' a message of: ' + param['message'])        
-        resp = sns_access.publish(TargetArn=arn,
-                                  Message=param['message'])
-        if(resp['ResponseMetadata']['HTTPStatusCode'] != 200):
+        message, ticket = self._limit(param['message'], arn)
+        if(message is None):
+          continue
+        print('Sending to: ' + arn + ' a message of: ' + message)        
+        if(self.metrics is not None):
+          started = self.time.perf_counter()
+        resp = sns_access.publish(TargetArn=arn, Message=message)
+        counts = self._counts(arn)
+        failed = resp['ResponseMetadata']['HTTPStatusCode'] != 200
+        if(self.metrics is not None):
+          self._record_latency(arn, started, failed)
+        if(failed):
+          self._release(ticket)
+          counts['failed'] += 1
           error_code = str(resp['ResponseMetadata']['HTTPStatusCode'])
           self.issues.append('Response from publish to sns topic indicates ' +
                              'failure. HTTPStatusCode: ' + error_code)
           print('Response from publish to sns topic indicates ' + 
                 'failure. HTTPStatusCode: ' + error_code)
         else:
+          counts['sent'] += 1
           print('Successfully published message to topic: ' + arn)
+        ticket = None
     except Exception as e:
+      self._release(ticket)
       self.issues.append('Exception while publishing to sns topic. ' +
                          'Exception involving: ' + str(e))
       print('Exception while publishing to sns topic. Exception ' +
@@ -134,29 +439,76 @@ class send_alerts():
     return(results)
   
   
-  def  __init__(self, params):
+  BATCH_ENTRIES     = 10          #PublishBatch limit
+  MAX_MESSAGE_BYTES = 262144      #SNS limit, message or whole batch
+  
+  
+  def  __init__(self, params, concurrent=False, max_workers=8, 
+                publish_timeout=10, send=True, metrics=None, limiter=None,
+                digest=False, summarize=False):
     """ 
     Initialize object and process all messages.  Process all messages
     even if an invalid message is encountered.  After successful 
     creation of a send_alerts object, the object will provide a list 
     named 'issues' that can be checked to determine if an issues 
-    occured with either initialization or message transmission.
+    occured with either initialization or message transmission, and a
+    dict named 'results' holding sent / failed / suppressed counts per
+    topic arn.
     
     Args:
       param  [{})]: required.  example parameter:
         [{'channel':'sns', 'message':'an alert message', 
          'topic_arns':['arn:aws:sns:us-east-1:12345678901:MyAlert']}]
+      concurrent      (bool):  publish all messages / topics at once
+      max_workers     (int):   upper bound on worker threads (concurrent)
+      publish_timeout (float): seconds allowed per publish (concurrent)
+      send            (bool):  False only validates params; the (message,
+                               topic arn) pairs are left in 'pending'
+                               for send_async()
+      metrics (log_metrics):   opt; receives publish latency per topic
+      limiter (alert_limiter): opt; rate limits / deduplicates alerts
+      digest    (bool):        group alerts by topic; send with 
+                               PublishBatch (see _send_digest())
+      summarize (bool):        with digest, merge each topic's alerts 
+                               into one summary message
     """
     self.supported_channels = ['sns']
     self.issues             = []
+    self.results            = {}
+    self.max_workers        = max_workers if(max_workers) else 1
+    self.publish_timeout    = publish_timeout
+    self.pending            = []
+    self.metrics            = metrics
+    self.limiter            = limiter
+    self.digest             = digest
+    self.summarize          = summarize
+    self._digest            = []     #(message, topic arn, params index)
+    self._digest_tickets    = {}     #(params index, topic arn) -> [ticket]
+    self._pending_tickets   = []
+    pairs                   = []
+    tickets                 = []
     
     try:
       if(params):
-        for param in params:
+        for origin, param in enumerate(params):
           if(param['channel'] in self.supported_channels):
             if(param['channel'] == 'sns'):
               if(self._validate_sns_message(param)):
-                self._send_sns_messages(param)
+                if(digest):
+                  for arn in param['topic_arns']:
+                    message, ticket = self._limit(param['message'], arn)
+                    if(message is not None):
+                      self._digest.append((message, arn, origin))
+                      self._digest_tickets.setdefault((origin, arn), 
+                                                      []).append(ticket)
+                elif(concurrent or (not send)):
+                  for arn in param['topic_arns']:
+                    message, ticket = self._limit(param['message'], arn)
+                    if(message is not None):
+                      pairs.append((message, arn))
+                      tickets.append(ticket)
+                else:
+                  self._send_sns_messages(param)
               
             #future: add additional distribution channels here
           else:
@@ -169,6 +521,77 @@ class send_alerts():
                            'empty input parameter')
         print('Attempt to create send_alerts object with an empty input ' + 
               'parameter')
+      if(not send):
+        self.pending          = pairs
+        self._pending_tickets = tickets
+      elif(pairs):
+        self._send_sns_concurrently(pairs, tickets)
+      elif(self._digest):
+        entries, self._digest = self._digest, []
+        self._send_digest(entries)
     except Exception as e:
       self.issues.append('Exception thrown involving: ' + str(e))
-      print('Exception thrown involving: ' + str(e))
\ No newline at end of file
+      print('Exception thrown involving: ' + str(e))
+      
+      
+  async def send_async(self):
+    """
+    Publish every pair in 'pending' concurrently on the aws_clients 
+    async layer, at most max_workers at a time and each limited to 
+    publish_timeout seconds.  Results land in 'results' and 'issues'
+    exactly as they do for the blocking modes.
+    """
+    import asyncio              #already loaded by the caller's event loop
+    if(self._digest):
+      entries, self._digest = self._digest, []
+      await self.aws_clients.call_async(self._send_digest, entries)
+    pairs, tickets = self.pending, self._pending_tickets
+    self.pending, self._pending_tickets = [], []
+    if(not pairs):
+      return
+    if(len(tickets) != len(pairs)):           #'pending' set by the caller
+      tickets = [None] * len(pairs)
+    try:
+      sns_access = self.aws_clients.get_client('sns')
+    except Exception as e:
+      for (message, arn), ticket in zip(pairs, tickets):
+        self._record_result(arn, 'Exception while creating sns client. ' + 
+                            'Exception involving: ' + str(e), ticket)
+      return
+    
+    limit = asyncio.Semaphore(self.max_workers)
+    async def publish(message, arn):
+      async with limit:
+        try:
+          return(await asyncio.wait_for(
+                   self.aws_clients.call_async(self._publish, sns_access, 
+                                               arn, message),
+                   self.publish_timeout))
+        except asyncio.TimeoutError:
+          return('Publish to sns topic timed out after ' +
+                 str(self.publish_timeout) + ' seconds.')
+          
+    outcome = await asyncio.gather(*[publish(message, arn) 
+                                     for message, arn in pairs])
+    for (message, arn), issue, ticket in zip(pairs, outcome, tickets):
+      self._record_result(arn, issue, ticket)
+      
+      
+  @classmethod
+  async def create_async(cls, params, max_workers=8, publish_timeout=10,
+                         metrics=None, limiter=None, digest=False, 
+                         summarize=False):
+    """
+    asyncio counterpart of send_alerts(params).  
+    
+    Usage:
+      a_sm = await send_alerts.create_async(param)
+      if(a_sm.issues):
+        #issue(s) occured during initialization or sending message(s)
+    """
+    alert = cls(params, max_workers=max_workers, 
+                publish_timeout=publish_timeout, send=False, 
+                metrics=metrics, limiter=limiter, digest=digest, 
+                summarize=summarize)
+    await alert.send_async()
+    return(alert)
\ No newline at end of file
@@ -21,10 +21,9 @@ Python code run by the AWS Lambda service vs. a long-running Python
 application executing in an environment with reliable access to a 
 file system that is suitable for system log files. It was not 
 designed to support an application that generates a high volume of 
-closely-timed system logging calls.  If you have such an application 
-and want to use sys_log() you will need to rework some things.  I 
-suggest you start by reworking the timestamp to use milliseconds vs. 
-whole seconds.
+closely-timed system logging calls.  Sort keys no longer depend on a
+1 second delay to stay unique (see sys_log.make_stamp_mod()), but each
+message is still its own DynamoDB write.
 
 sys_log categorizes messages into multiple levels of condition 
 severity. While the default levels of INFO, WARN, ALARM, and ERROR can
@@ -63,18 +62,121 @@ Be aware:
      are in place as they will show in CloudWatch Logs, given correct 
      configuration
      
-  2) sys_log() was not designed to support a high volume of closely-
-     timed system logging.  Note the 1 second delay introduced in 
-     sys_log.log_message()
+  2) The sort key 'stamp_mod' has the form 
+       <epoch seconds>+<module>+<microseconds>.<sequence>.<container>
+     Existing consumers that split on '+' still find epoch seconds and 
+     the module name in the first two fields.  The remaining field keeps
+     keys unique, and in time order, without sleeping between messages
 
   3) After creating a sys_log() object, sys_log.init_issues should 
      be empty. If this list is not empty, the sys_log object will most 
      likely not work
+     
+  4) By default nothing reaches DynamoDB until save_messages_to_db() is
+     called.  sys_log.start_background_flush() starts a daemon thread 
+     that drains the buffers whenever a count, size or age threshold is
+     passed; sys_log.stop_background_flush(context) performs the final
+     drain within the time the Lambda context has left
+     
+  5) min_level, sample_rates and locator_sample_rates discard messages
+     before they are validated or buffered.  How many were discarded, 
+     per level, is written to the info table at the next flush as a
+     single INFO message with locator 'sys_log'
+     
+  6) coalesce_window collapses identical (level, locator, message) 
+     records logged within that many seconds into one item carrying 
+     'count', 'first_seen' and 'last_seen' attributes.  With a spool,
+     every repeat re-spools the record, so replayed records keep their
+     count
+     
+  7) max_buffered_records / max_buffered_bytes cap the buffers.  INFO /
+     WARN records are always evicted (oldest first) before an ALARM / 
+     ERROR record is given up; see sys_log._make_room()
+     
+  8) spool_dir (e.g., '/tmp') turns on a write-ahead spool.  Messages
+     are spooled as they are logged and acknowledged once written to 
+     DynamoDB; whatever a timed out or crashed invocation left behind 
+     is replayed by the next sys_log object or sys_log.reset()
+     
+  9) sys_log only writes.  Use log_reader.log_reader to query the 
+     tables by date range, module, level and locator
+     
+  10) With shards set, the 'date' partition key carries a shard suffix
+      (e.g., '2026-10-17#07') so a busy day's writes are spread over
+      several DynamoDB partitions.  Give log_reader the same value
+     
+  11) async handlers can await sys_log.log_message_async() and 
+      sys_log.save_messages_to_db_async() instead of wrapping the 
+      blocking methods in an executor.  Importing sys_log does not 
+      import boto3 or asyncio; see aws_clients.prewarm()
+     
+  12) metrics=True records log_message() latency, buffer depth, flush
+      duration, items written / failed, retries and throttles (see 
+      log_metrics).  They are printed as CloudWatch EMF lines at every
+      flush; sys_log.metrics.snapshot() reads them in process.  Off by
+      default, when it costs one attribute test per call
+     
+  13) alert_routes escalates matching records to SNS without the caller
+      waiting on it.  Matching records are queued when logged and the 
+      queue is handed to send_alerts (concurrent=True) by the next 
+      flush, in parallel with the DynamoDB write, or by the background
+      flusher, which is woken as soon as an alert is queued.  Issues 
+      sending alerts are added to sys_log.run_issues
+     
+  14) compress_threshold turns on message compression: a message larger
+      than that many bytes is stored compressed in a Binary attribute
+      (see log_codec; log_reader decodes it transparently).  Messages
+      that would push an item past DynamoDB's 400 KB limit are always
+      truncated, and marked, instead of failing their whole batch
+     
+  15) A handler that imports several modules can share one buffer:
+      sys_log.shared(...) returns the process-wide sys_log object and 
+      its handle(module) method a lightweight per-module logger.  All 
+      modules' records then go out in one flush, in the fewest 
+      BatchWriteItem requests; wrap the handler with flush_after() to
+      reset before and flush after every invocation
+     
+  16) sinks adds destinations (e.g., CloudWatch Logs, a local NDJSON 
+      file; see log_sinks), each taking the levels it was given, and
+      dynamodb_levels narrows the levels written to DynamoDB.  Every 
+      flush writes to all of them in parallel; per sink counts are left
+      in sys_log.sink_reports.  A spooled record that does not go to 
+      DynamoDB is acknowledged once every sink taking it has written it
+     
+  17) Items also carry 'level', 'module', 'locator' and, when an 
+      exception was logged, 'exception_type' attributes; structured=False
+      leaves them out.  Items in the tables named by indexed_tables 
+      (default the errors table) also get 'module_level' 
+      ('<module>#<LEVEL>'), the partition key of the optional index 
+      log_index.provision_index() adds.  log_reader.query_index() then 
+      finds, e.g., a module's ERRORs for a week with targeted Queries
+     
+  18) traceback_frames turns on traceback capture.  log_message() only
+      records the code locations of the innermost traceback_frames 
+      frames; source lines are looked up, and the traceback rendered,
+      at flush time.  Records get a 'fingerprint' (a hash of the 
+      exception type and those locations) and the traceback itself is
+      written once per fingerprint per day, as the item 
+      'traceback#<fingerprint>' in the plain 'YYYY-MM-DD' partition of
+      traceback_table (see log_reader.traceback()).  Chained exceptions
+      are not followed
 
 Dependencies:
+  os
   time
-  boto3
-  from boto3.dynamodb.conditions import Key
+  zlib
+  random
+  itertools
+  collections
+  threading
+  aws_clients    (imports boto3 on first use)
+  log_spool
+  log_metrics
+  send_alerts
+  log_codec
+  hashlib
+  traceback
+  log_sinks      (only to create sinks)
   from datetime import datetime, timedelta
 """
 class sys_log():
@@ -106,9 +208,20 @@ class sys_log():
     if(not sl.run_issues):
       #another way to check on the success of write to Dynamo
   """
+  import os
   import time
-  import boto3
-  from   boto3.dynamodb.conditions import Key
+  import zlib
+  import random
+  import itertools
+  import collections
+  import threading
+  import aws_clients
+  import log_spool
+  import log_metrics
+  import send_alerts
+  import log_codec
+  import hashlib
+  import traceback
   from   datetime                  import datetime, timedelta
  
  
@@ -121,8 +234,17 @@ class sys_log():
     if(message_core.issues): 
       #issues encountered when creating this message_core object
     """
-    
+    __slots__ = ('issues', 'message', 'locator', 'message_level',
+                 'exception_type')
  
+ 
+    def _issue(self, issue):
+      if(not self.issues):
+        self.issues = []       #only allocated when something is wrong
+      self.issues.append(issue)
+      print(issue)
+      
+      
     def __init__(self, locator, message_level, message, exception, 
                  message_types):
       """
@@ -133,37 +255,34 @@ class sys_log():
         exception (Exception): Python exception object or '' or None
         message_types[(str)]:  supported messages levels
       """
-      self.issues = []
+      self.issues = ()
       self.message = ''
+      self.exception_type = None
           
       if((type(locator) != str) or (locator == '')):
-        self.issues.append('Invalid locator parameter')
-        print('Invalid locator parameter')
+        self._issue('Invalid locator parameter')
       else:
         self.locator = locator
         
       if((type(message_level) != str) or (message_level == '')):
-        self.issues.append('Invalid message_level parameter')
-        print('Invalid message_level parameter')
+        self._issue('Invalid message_level parameter')
       elif(not (message_level.upper() in message_types)):
-        self.issues.append('Invalid message level specified')
-        print('Invalid message level specified')
+        self._issue('Invalid message level specified')
       else:
         self.message_level = message_level.upper()
       
       if((type(message) != str) and (message != None)):
-        self.issues.append('Invalid message parameter')
-        print('Invalid message parameter')
+        self._issue('Invalid message parameter')
       else:
         if(message):
           self.message += message
               
       if((not isinstance(exception, Exception)) and 
          (exception != '') and (exception != None)):
-        self.issues.append('Invalid exception parameter')
-        print('Invalid exception parameter')
+        self._issue('Invalid exception parameter')
       else:
         if(exception):
+          self.exception_type = type(exception).__name__
           try:
             if(exception.response['Error']['Message']):
               self.message += ' ' + exception.response['Error']['Message']
@@ -172,9 +291,189 @@ class sys_log():
           except:
             self.message   += ' ' + str(exception)
         
+
+  class log_record():
+    """
+    Compact, slotted form of one buffered system log message.  The
+    DynamoDB item, including the 'LEVEL: (locator) text' message, is 
+    only rendered at flush time (see sys_log._build_requests()).
+    """
+    __slots__ = ('date', 'level', 'locator', 'text', 'seconds', 'count',
+                 'last_seen', 'exception_type', 'stack')
+    
+    
+    def __init__(self, date, level, locator, text, seconds, 
+                 exception_type=None, stack=None):
+      """
+      Args:
+        date    (str): local calendar day, DynamoDB partition key
+        level   (str): system logging level (e.g., "INFO")
+        locator (str): location within source code
+        text    (str): message text and exception text
+        seconds (int): epoch seconds the message was (first) logged at
+        exception_type (str): opt; class name of the logged exception
+        stack   (()):  opt; ((file, line number, function), ...) of the
+                       captured frames, innermost last, the number of 
+                       outer frames left out and str(exception) (see 
+                       _capture_stack())
+      """
+      self.date      = date
+      self.level     = level
+      self.locator   = locator
+      self.text      = text
+      self.seconds   = seconds
+      self.count     = 1          #> 1 when duplicates were coalesced
+      self.last_seen = seconds
+      self.exception_type = exception_type
+      self.stack     = stack
+      
+      
+    @property
+    def message(self):
+      return(self.level + ': (' + self.locator + ') ' + self.text)
+      
+      
+  class log_handle():
+    """
+    Per-module logger writing into a shared sys_log object's buffer.  
+    Records are tagged with the handle's module name (see 
+    sys_log.handle()).
+    
+    if(log_handle.init_issues):
+      #invalid module name, or the shared sys_log object is inoperable
+    """
+    __slots__ = ('owner', 'module', 'init_issues')
+    
+    
+    def __init__(self, owner, module):
+      """
+      Args:
+        owner  (sys_log): object holding the shared buffer
+        module (str):     meaningful name for code in source code file
+      """
+      self.owner       = owner
+      self.module      = module
+      self.init_issues = list(owner.init_issues)
+      if((type(module) != str) or (module == '') or ('+' in module)):
+        self.init_issues.append('Invalid module parameter')
+        print('Invalid module parameter')
+        
+        
+    @property
+    def run_issues(self):
+      return(self.owner.run_issues)
+      
+      
+    def log_message(self, locator, message_level, message, exception):
+      """
+      Same as sys_log.log_message(), tagged with this handle's module
+      """
+      if(self.init_issues):
+        self.owner.run_issues.append('log_handle() object invalid / ' +
+                                     'inoperable')
+        print('log_handle() object invalid / inoperable')
+        return(False)
+      return(self.owner.log_message(locator, message_level, message, 
+                                    exception, self.module))
+                                    
+                                    
+    async def log_message_async(self, locator, message_level, message, 
+                                exception):
+      return(self.log_message(locator, message_level, message, exception))
+      
+      
+  CONTAINER_ID = os.urandom(4).hex()   #distinguishes concurrent containers
+  _sequence    = itertools.count(1)    #per process, shared by all objects
+  _stamp_lock  = threading.Lock()
+  _last_ns     = 0
+  _shared      = None                  #process-wide object, see shared()
+  _shared_lock = threading.Lock()
+  
+  
+  @classmethod
+  def make_stamp_mod(cls, module):
+    """
+    Build a unique, sortable sort key for a system log message without
+    introducing a delay.  The wall clock is read with nanosecond 
+    precision and never allowed to run backwards within a process. A
+    per-process sequence number and a per-container id break any ties.
+    All numeric fields are zero padded so that string order matches
+    time order.
+    
+    Args:
+      module (str): module name embedded in the key
+      
+    Returns:
+      (int, str) epoch time in nanoseconds and the stamp_mod key
+    """
+    with cls._stamp_lock:
+      now_ns = cls.time.time_ns()
+      if(now_ns <= cls._last_ns):
+        now_ns = cls._last_ns + 1
+      cls._last_ns = now_ns
+      sequence = next(cls._sequence)
+    seconds, remainder = divmod(now_ns, 1000000000)
+    stamp_mod = (str(seconds) + '+' + module + '+' + 
+                 str(remainder // 1000).zfill(6) + '.' + 
+                 str(sequence).zfill(10) + '.' + cls.CONTAINER_ID)
+    return(now_ns, stamp_mod)
+  
   
+  def _local_date(self, seconds):
+    """
+    Local calendar day ('YYYY-MM-DD') for an epoch time.  The string is
+    built once per day and reused until the next local midnight.
+    
+    Args:
+      seconds (int): epoch seconds
+    """
+    start, end, date, shard_keys = self._date_cache
+    if(start <= seconds < end):
+      return(date)
+    now = self.datetime.fromtimestamp(seconds)
+    if(self.TZ_OFFSET >= 0):
+      local = now - self.timedelta(hours=self.TZ_OFFSET)    #UTC -> local
+    else:
+      local = now + self.timedelta(hours=self.TZ_OFFSET)    #UTC -> local
+    date = (str(local.year) + '-' + str(local.month).zfill(2) + '-' + 
+            str(local.day).zfill(2))
+    start = seconds - (local.hour * 3600 + local.minute * 60 + local.second)
+    shard_keys = ()
+    if(self.shards):
+      shard_keys = tuple(date + '#' + str(shard).zfill(2) 
+                         for shard in range(self.shards))
+    self._date_cache = (start, start + 86400, date, shard_keys)
+    return(date)
+    
+    
+  def _partition_key(self, seconds, stamp_mod):
+    """
+    'date' partition key for a message.  Unsharded this is the local 
+    calendar day.  Sharded it is 'YYYY-MM-DD#NN', NN picked by a hash of
+    stamp_mod (module plus sequence number), which spreads one module's
+    messages evenly across the day's shards.
+    """
+    date = self._local_date(seconds)
+    if(self.shards):
+      return(self._date_cache[3][self.zlib.crc32(stamp_mod.encode('utf-8'))
+                                 % self.shards])
+    return(date)
+    
+    
   def  __init__(self, module, info_table, errors_table, 
-                tz_offset, ttl, strict=False):
+                tz_offset, ttl, strict=False, min_level=None, 
+                sample_rates=None, locator_sample_rates=None,
+                coalesce_window=None, coalesce_max_keys=1024,
+                max_buffered_records=None, max_buffered_bytes=None,
+                overflow_policy='drop_oldest_info', 
+                overflow_block_timeout=5.0, spool_dir=None, 
+                spool_max_bytes=8388608, shards=None, metrics=None,
+                alert_routes=None, alert_options=None, 
+                compress_threshold=None, compression='zlib',
+                max_item_bytes=409600, sinks=None, dynamodb_levels=None,
+                structured=True, indexed_tables=('errors',),
+                traceback_frames=None, traceback_table=None, 
+                dynamo_db_access=None):
     """ 
     Initialize a sys_log() object.  Pass 'True' as value for the
     keyword parameter 'strict' if you do not want auto recovery
@@ -189,15 +488,89 @@ class sys_log():
       ttl          (int):  time to live for information messages
       strict       (bool): auto recover from invalid tz_offset and ttl
                            parameter values being passed in
+      min_level    (str):  opt; messages below this level are dropped
+      sample_rates {str: float}: opt; fraction (0.0 - 1.0) of messages 
+                           kept per level, e.g., {'INFO': 0.01}
+      locator_sample_rates {str: float}: opt; fraction of messages kept
+                           per locator; overrides the level's rate
+      coalesce_window (int): opt; seconds within which identical (level,
+                           locator, message) records collapse into one
+      coalesce_max_keys (int): cap on distinct records tracked for 
+                           coalescing; the oldest are forgotten first
+      max_buffered_records (int): opt; cap on buffered records
+      max_buffered_bytes   (int): opt; cap on (approximate) buffered bytes
+      overflow_policy (str): what to do when a cap would be exceeded; 
+                           'drop_oldest_info', 'drop_newest', 'flush' or
+                           'block' (see _make_room())
+      overflow_block_timeout (float): seconds the 'block' policy waits
+      spool_dir (str):     opt; directory (e.g., '/tmp') for a crash-safe
+                           spool of buffered messages (see log_spool)
+      spool_max_bytes (int): cap on the spool file; once compacting 
+                           cannot get under it the oldest entries are 
+                           dropped (see log_spool)
+      shards       (int):  opt; 1 - 100; spread each day's messages over
+                           this many 'date' partitions (see 
+                           _partition_key())
+      metrics (bool):      opt; True to record performance metrics, or a
+                           log_metrics object to record them into (e.g.,
+                           one shared with send_alerts)
+      alert_routes [{}]:   opt; records to escalate to SNS, e.g.,
+                           [{'levels': ['ERROR'], 'locators': ['3'],
+                             'topic_arns': ['arn:aws:sns:...:MyAlerts']}]
+                           'levels' defaults to ALARM and ERROR; 
+                           'modules' / 'locators' default to any
+      alert_options {}:    opt; extra send_alerts() keyword arguments
+                           (e.g., {'limiter': a_limiter, 'digest': True})
+      compress_threshold (int): opt; compress messages over this many 
+                           bytes (see log_codec)
+      compression  (str):  'zlib' or 'zstd' (needs zstandard installed)
+      max_item_bytes (int): item size above which messages are truncated
+      sinks        [sink]: opt; extra destinations (see log_sinks)
+      dynamodb_levels [str]: opt; levels written to DynamoDB (default 
+                           all)
+      structured   (bool): write level / module / locator / 
+                           exception_type attributes
+      indexed_tables (str): 'errors' and / or 'info'; tables whose items
+                           get the 'module_level' index key
+      traceback_frames (int): opt; capture up to this many (innermost)
+                           frames of logged exceptions' tracebacks
+      traceback_table (str): opt; table for rendered tracebacks (default
+                           the errors table)
+      dynamo_db_access:    opt; DynamoDB service resource (e.g., a stub)
+                           for flushes not handed one, such as the early
+                           drains of the 'flush' / 'block' overflow 
+                           policies
     """
     self.NUM_SECONDS_IN = {'1 month'  : 2592200, 
                            '2 months' : 5184000, 
                            '6 months' : 155520000}
     self.MESSAGE_TYPES  = {'INFO': 1, 'WARN': 2, 'ALARM': 6, 'ERROR': 7}
+    self.BATCH_SIZE        = 25     #BatchWriteItem limit
+    self.MAX_BATCH_RETRIES = 8
+    self.BACKOFF_BASE      = 0.05   #seconds
+    self.BACKOFF_CAP       = 2.0    #seconds
+    self.ITEM_OVERHEAD     = 40     #approx. bytes of attribute names per item
+    self.OVERFLOW_POLICIES = ('drop_oldest_info', 'drop_newest', 'flush', 
+                              'block')
+    self.flush_report   = {}
+    self.lock           = self.threading.Lock()
+    self._buffered_bytes = 0
+    self._oldest         = None      #monotonic time of oldest buffered msg
+    self._flusher        = None
+    self._flush_resource = dynamo_db_access
+    self._drain_failed   = False     #a drain failed since last reported
+    self._early_report   = {}        #counts of overflow drains, see save
+    self._date_cache     = (0, 0, '', ())
+    self._flush_needed   = self.threading.Event()
+    self._flush_stop     = self.threading.Event()
     self.error_messages = {}
     self.info_messages  = {}
     self.init_issues    = []
     self.run_issues     = []
+    self.counters       = self._new_counters()
+    self.min_rank       = 0
+    self.sample_rates         = {}
+    self.locator_sample_rates = {}
     
     tz_default  = 6             #US Central (5 or 6 hours behind UTC)
     ttl_default = self.NUM_SECONDS_IN['2 months']
@@ -260,6 +633,263 @@ class sys_log():
           self.init_issues.append('Invalid time to live specified. ' + str(e))
         print('Invalid time to live parameter specified. ' + str(e))       
         self.TTL = ttl_default
+        
+    if(min_level):
+      if((type(min_level) != str) or 
+         (min_level.upper() not in self.MESSAGE_TYPES)):
+        self.init_issues.append('Invalid min_level parameter')
+        print('Invalid min_level parameter')
+      else:
+        self.min_rank = self.MESSAGE_TYPES[min_level.upper()]
+    for name, rates, keys in (
+          ('sample_rates', sample_rates, self.MESSAGE_TYPES),
+          ('locator_sample_rates', locator_sample_rates, None)):
+      if(rates):
+        try:
+          for key, rate in rates.items():
+            if((type(key) != str) or ((keys is not None) and 
+                                      (key.upper() not in keys)) or
+               (not (0.0 <= float(rate) <= 1.0))):
+              raise ValueError(str(key) + ': ' + str(rate))
+          if(keys is not None):
+            self.sample_rates = {key.upper(): float(rate) 
+                                 for key, rate in rates.items()}
+          else:
+            self.locator_sample_rates = {key: float(rate) 
+                                         for key, rate in rates.items()}
+        except Exception as e:
+          self.init_issues.append('Invalid ' + name + ' parameter. ' + str(e))
+          print('Invalid ' + name + ' parameter. ' + str(e))
+    self._coalesce_index = None
+    if(coalesce_window):
+      if((type(coalesce_window) not in (int, float)) or 
+         (coalesce_window <= 0) or (type(coalesce_max_keys) != int) or
+         (coalesce_max_keys < 1)):
+        self.init_issues.append('Invalid coalesce_window / ' +
+                                'coalesce_max_keys parameter')
+        print('Invalid coalesce_window / coalesce_max_keys parameter')
+      else:
+        self.coalesce_window   = coalesce_window
+        self.coalesce_max_keys = coalesce_max_keys
+        self._coalesce_index   = self.collections.OrderedDict()
+    self._bounded     = False
+    self._overflowing = False
+    self._info_order  = self.collections.deque()  #info keys, oldest first
+    self._space       = self.threading.Condition(self.lock)
+    if(max_buffered_records or max_buffered_bytes):
+      if(((max_buffered_records is not None) and 
+          ((type(max_buffered_records) != int) or 
+           (max_buffered_records < 1))) or
+         ((max_buffered_bytes is not None) and 
+          ((type(max_buffered_bytes) != int) or 
+           (max_buffered_bytes < 1))) or
+         (overflow_policy not in self.OVERFLOW_POLICIES)):
+        self.init_issues.append('Invalid max_buffered_records / ' +
+          'max_buffered_bytes / overflow_policy parameter')
+        print('Invalid max_buffered_records / max_buffered_bytes / ' +
+              'overflow_policy parameter')
+      else:
+        self._bounded               = True
+        self.max_buffered_records   = max_buffered_records
+        self.max_buffered_bytes     = max_buffered_bytes
+        self.overflow_policy        = overflow_policy
+        self.overflow_block_timeout = overflow_block_timeout
+    self.shards = None
+    if(shards):
+      if((type(shards) != int) or (not (1 <= shards <= 100))):
+        self.init_issues.append('Invalid shards parameter')
+        print('Invalid shards parameter')
+      else:
+        self.shards = shards
+    self.spool = None
+    if(spool_dir and (not self.init_issues)):
+      try:
+        self.spool = self.log_spool.log_spool(
+          self.os.path.join(spool_dir, 'sys_log_' + self.module + '.spool'),
+          max_bytes=spool_max_bytes)
+        self._replay_spool()
+      except Exception as e:
+        self.spool = None
+        self.run_issues.append('Could not open spool; continuing without ' +
+                               'one. Exception: ' + str(e))
+        print('Could not open spool; continuing without one. Exception: ' + 
+              str(e))
+    self._filtering = bool(self.min_rank or self.sample_rates or 
+                           self.locator_sample_rates)
+    self.metrics = None
+    if(metrics is True):
+      self.metrics = self.log_metrics.log_metrics(
+        'sys_log', {'Module': getattr(self, 'module', '')})
+    elif(metrics):
+      self.metrics = metrics
+    self.compress_threshold = None
+    self.compression        = 'zlib'
+    self.max_item_bytes     = max_item_bytes
+    if(compress_threshold is not None):
+      if((type(compress_threshold) != int) or (compress_threshold < 0) or
+         (compression not in self.log_codec.CODECS)):
+        self.init_issues.append('Invalid compress_threshold / compression ' +
+                                'parameter')
+        print('Invalid compress_threshold / compression parameter')
+      else:
+        self.compress_threshold = compress_threshold
+        self.compression        = compression
+        if(not self.log_codec.available(compression)):
+          print(compression + ' is not available; using zlib')
+          self.compression = 'zlib'
+    self.sinks            = []
+    self.sink_reports     = {}
+    self._dynamodb_levels = None
+    if((sinks is not None) or (dynamodb_levels is not None)):
+      try:
+        if((sinks is not None) and 
+           ((type(sinks) != list) or 
+            any((not hasattr(sink, 'write')) or 
+                (not hasattr(sink, 'accepts')) for sink in sinks))):
+          raise ValueError('sinks must be a list of log_sinks sinks')
+        if(dynamodb_levels is not None):
+          levels = frozenset(level.upper() for level in dynamodb_levels)
+          if(any(level not in self.MESSAGE_TYPES for level in levels)):
+            raise ValueError('invalid dynamodb_levels')
+          self._dynamodb_levels = levels
+        self.sinks = list(sinks) if(sinks) else []
+      except Exception as e:
+        self.init_issues.append('Invalid sinks / dynamodb_levels ' +
+                                'parameter. ' + str(e))
+        print('Invalid sinks / dynamodb_levels parameter. ' + str(e))
+    self.structured     = bool(structured)
+    self._indexed       = (False, False)     #(errors table, info table)
+    if(indexed_tables):
+      if(any(name not in ('errors', 'info') for name in indexed_tables)):
+        self.init_issues.append('Invalid indexed_tables parameter')
+        print('Invalid indexed_tables parameter')
+      else:
+        self._indexed = ('errors' in indexed_tables, 'info' in indexed_tables)
+    self.traceback_frames = None
+    self._tracebacks      = set()         #(day, fingerprint) written
+    if(traceback_frames is not None):
+      if((type(traceback_frames) != int) or (traceback_frames < 1) or
+         ((traceback_table is not None) and 
+          ((type(traceback_table) != str) or (traceback_table == '')))):
+        self.init_issues.append('Invalid traceback_frames / ' +
+                                'traceback_table parameter')
+        print('Invalid traceback_frames / traceback_table parameter')
+      else:
+        self.traceback_frames = traceback_frames
+        self.traceback_table  = (traceback_table if(traceback_table) else
+                                 getattr(self, 'errors_table', None))
+    self._routes        = None
+    self._alerts        = []         #([arn], module, log_record) to send
+    self._handles       = {}
+    self.alert_options  = {}
+    self.alert_results  = {}
+    if(alert_routes):
+      try:
+        routes = []
+        for route in alert_routes:
+          arns = route['topic_arns']
+          if((type(arns) != list) or (not arns) or 
+             any((type(arn) != str) or (arn == '') for arn in arns)):
+            raise ValueError('invalid topic_arns')
+          levels = [level.upper() for level 
+                    in route.get('levels', ['ALARM', 'ERROR'])]
+          if(any(level not in self.MESSAGE_TYPES for level in levels)):
+            raise ValueError('invalid levels')
+          routes.append((frozenset(levels), 
+                         frozenset(route['modules']) 
+                         if(route.get('modules')) else None,
+                         frozenset(route['locators']) 
+                         if(route.get('locators')) else None,
+                         tuple(arns)))
+        if((alert_options is not None) and (type(alert_options) != dict)):
+          raise ValueError('alert_options must be a dict')
+        self._routes       = routes
+        self._alert_levels = frozenset().union(*[route[0] 
+                                                 for route in routes])
+        self.alert_options = dict(alert_options) if(alert_options) else {}
+      except Exception as e:
+        self.init_issues.append('Invalid alert_routes parameter. ' + str(e))
+        print('Invalid alert_routes parameter. ' + str(e))
+    
+    
+  @classmethod
+  def shared(cls, info_table=None, errors_table=None, tz_offset=None, 
+             ttl=None, module='shared', **kwargs):
+    """
+    Return the process-wide sys_log object, creating it on the first 
+    call.  Later calls (e.g., from other modules) may omit every 
+    argument; arguments given once the object exists are ignored.
+    
+    Usage:
+      #handler module
+      sl = sys_log.sys_log.shared('info_table', 'errors_table', -6, 
+                                  155520000)
+      #any other module
+      log = sys_log.sys_log.shared().handle('module_b')
+      log.log_message('1', 'INFO', 'hello', '')
+      
+    Args:
+      same as sys_log(); module names records logged on the shared 
+      object itself rather than through a handle
+      
+    Returns:
+      sys_log object; if it could not be created, a sys_log object
+      whose init_issues says why (it is not kept)
+    """
+    with cls._shared_lock:
+      if(cls._shared is None):
+        shared = cls(module, info_table, errors_table, tz_offset, ttl, 
+                     **kwargs)
+        if(shared.init_issues):
+          return(shared)
+        cls._shared = shared
+      return(cls._shared)
+      
+      
+  def handle(self, module):
+    """
+    Args:
+      module (str): meaningful name for code in source code file
+      
+    Returns:
+      log_handle writing into this object's buffer, tagged with module;
+      the same handle is returned for the same module
+    """
+    handle = self._handles.get(module)
+    if(handle is None):
+      handle = self.log_handle(self, module)
+      if(not handle.init_issues):
+        with self.lock:
+          handle = self._handles.setdefault(module, handle)
+    return(handle)
+    
+    
+  def flush_after(self, handler):
+    """
+    Decorator for an AWS Lambda handler: reset() before every invocation
+    and, however the handler exits, flush everything logged through 
+    this object and its handles.  When the background flusher is 
+    running, the buffers are drained instead (the flusher keeps running
+    and reset() is skipped), within the time the Lambda context allows.
+    
+    Usage:
+      @sl.flush_after
+      def lambda_handler(event, context):
+        ...
+    """
+    def wrapper(event, context=None, *args, **kwargs):
+      if(self._flusher is None):
+        self.reset()
+      try:
+        return(handler(event, context, *args, **kwargs))
+      finally:
+        if(self._flusher is not None):
+          self._drain(self._deadline(context, 0.5))
+        else:
+          self.save_messages_to_db()
+    wrapper.__name__ = getattr(handler, '__name__', 'handler')
+    wrapper.__doc__  = getattr(handler, '__doc__', None)
+    return(wrapper)
     
     
   def reset(self):
@@ -276,114 +906,1292 @@ class sys_log():
     employ a sys_log() object in a long running Python application.
     You would want to call this method after you have saved all 
     system log messages generated, so far, to Dyanmo.
+    
+    When a spool is in use, messages that were spooled but never 
+    written to DynamoDB are put back into the buffers instead of lost.
     """
-    self.error_messages = {}
-    self.info_messages  = {}
-    self.run_issues     = []
+    with self.lock:
+      self._clear_buffers()
+      self.run_issues = []
+      self.counters   = self._new_counters()
+      self._alerts    = []
+    if(self.spool is not None):
+      self._replay_spool()
+      
+      
+  def _clear_buffers(self):
+    """
+    Empty the buffers and everything tracking them, including a pending
+    wake-up of the flusher.  Callers must hold self.lock.
+    """
+    self.error_messages  = {}
+    self.info_messages   = {}
+    self._buffered_bytes = 0
+    self._oldest         = None
+    self._overflowing    = False
+    self._flush_needed.clear()
+    self._info_order.clear()
+    if(self._coalesce_index is not None):
+      self._coalesce_index.clear()
+    self._space.notify_all()
+    
+    
+  def _new_counters(self):
+    return({'dropped': {}, 'sampled': {}, 'overflow': {}})
+    
+    
+  def _record_size(self, key, record):
+    """
+    Approximate DynamoDB item size of a buffered record
+    """
+    return(len(key) + len(record.date) + len(record.level) + 
+           len(record.locator) + len(record.text) + self.ITEM_OVERHEAD)
+    
+    
+  def _over_limit(self, size):
+    """
+    True if buffering one more record of 'size' bytes would exceed a 
+    cap.  Callers must hold self.lock.
+    """
+    return(((self.max_buffered_records is not None) and 
+            (len(self.info_messages) + len(self.error_messages) >= 
+             self.max_buffered_records)) or
+           ((self.max_buffered_bytes is not None) and 
+            (self._buffered_bytes + size > self.max_buffered_bytes)))
+            
+            
+  def _wait_for_room(self, size):
+    """
+    'flush' and 'block' overflow policies; called without self.lock 
+    held.  Without a background flusher both drain the buffers here,
+    in the caller's thread, through the object's DynamoDB resource (see
+    dynamo_db_access); records that fail are put back (see _requeue())
+    and the counts are added to the next save_messages_to_db() report.
+    With one, 'flush' wakes the flusher and 
+    'block' also waits (up to overflow_block_timeout seconds) for it
+    to make room.  Whatever room is still missing afterwards is made by
+    _make_room().
+    """
+    with self.lock:
+      full = self._over_limit(size)
+    if(full):
+      if(self._flusher is None):
+        self._drain(totals=self._early_report)
+      else:
+        with self._space:
+          self._flush_needed.set()
+          if(self.overflow_policy == 'block'):
+            self._space.wait_for(lambda: not self._over_limit(size),
+                                 timeout=self.overflow_block_timeout)
+                                 
+                                 
+  def _make_room(self, level, size):
+    """
+    Make room for one more record by evicting the oldest INFO / WARN 
+    records.  ALARM / ERROR records are never evicted; when only they
+    remain the new record is dropped instead.  Under 'drop_newest' a 
+    new INFO / WARN record is dropped rather than evicting older ones.
+    Every eviction / drop is counted in counters['overflow'] and the
+    first one since the buffers were last emptied is added to 
+    run_issues.  Callers must hold self.lock.
+    
+    Returns:
+      True  if the new record can be buffered
+      False if the new record was dropped
+    """
+    counter = self.counters['overflow']
+    info    = self.MESSAGE_TYPES[level] < self.MESSAGE_TYPES['ALARM']
+    results = True
+    while(results and self._over_limit(size)):
+      if(not self._overflowing):
+        self._overflowing = True
+        self.run_issues.append('Buffer limit reached; messages dropped ' +
+                               '(see counters)')
+        print('Buffer limit reached; messages dropped (see counters)')
+      if(self._info_order and 
+         ((self.overflow_policy != 'drop_newest') or (not info))):
+        key    = self._info_order.popleft()
+        record = self.info_messages.pop(key, None)
+        if(record is not None):
+          if(self.spool is not None):
+            self.spool.ack([key])
+          self._buffered_bytes -= self._record_size(key, record)
+          counter[record.level] = counter.get(record.level, 0) + 1
+          if(self._coalesce_index is not None):
+            index_key = (key.split('+')[1], record.level, record.locator,
+                         record.text)
+            indexed   = self._coalesce_index.get(index_key)
+            if((indexed is not None) and (indexed[1] is record)):
+              del self._coalesce_index[index_key]
+      else:
+        counter[level] = counter.get(level, 0) + 1
+        results = False
+    return(results)
+    
+    
+  def _coalesce(self, a_message_core, module):
+    """
+    When coalescing is on and an identical (module, level, locator, 
+    message) record was buffered less than coalesce_window seconds ago, 
+    count this message against that record instead of buffering a new 
+    one.
+    The index is an OrderedDict capped at coalesce_max_keys entries, so
+    lookups are O(1) and memory stays bounded; it maps the message to 
+    its (stamp_mod, log_record).  With a spool, the record is spooled 
+    again with its new count, so a replay restores the count.
+    
+    Returns:
+      True  if the message was folded into a buffered record
+      False if the message should be buffered as a new record
+    """
+    now = int(self.time.time())
+    key = (module, a_message_core.message_level, a_message_core.locator, 
+           a_message_core.message)
+    with self.lock:
+      stamp_mod, record = self._coalesce_index.get(key, (None, None))
+      if((record is not None) and 
+         (now - record.seconds <= self.coalesce_window)):
+        record.count    += 1
+        record.last_seen = now
+        if(self.spool is not None):
+          self.spool.append(self._spool_entry(stamp_mod, record))
+        return(True)
+    return(False)
+    
+    
+  def _filtered(self, locator, message_level):
+    """
+    Apply min_level and sampling before any validation or formatting
+    work is done.  Messages with an unrecognized level are never 
+    filtered; log_message() reports them as usual.
+    
+    Returns:
+      True  if the message should be discarded (and was counted)
+      False if the message should be logged
+    """
+    if(type(message_level) != str):
+      return(False)
+    level = message_level.upper()
+    rank  = self.MESSAGE_TYPES.get(level)
+    if(rank is None):
+      return(False)
+    if(rank < self.min_rank):
+      counter = self.counters['dropped']
+    else:
+      rate = self.locator_sample_rates.get(locator)
+      if(rate is None):
+        rate = self.sample_rates.get(level)
+      if((rate is None) or (self.random.random() < rate)):
+        return(False)
+      counter = self.counters['sampled']
+    with self.lock:
+      counter[level] = counter.get(level, 0) + 1
+    return(True)
     
     
-  def log_message(self, locator, message_level, message, exception):
+  def _counter_record(self):
+    """
+    Take (and zero) the dropped / sampled / overflow counters.  When 
+    anything was discarded since the last flush a summary INFO record
+    is built so the counts are visible in the info table, and they are
+    printed.
+    
+    Returns:
+      (stamp_mod, log_record) or None (always None for an inoperable 
+      object)
+    """
+    if(self.init_issues):
+      return(None)
+    with self.lock:
+      counters = self.counters
+      self.counters = self._new_counters()
+    text = ''
+    for kind in ('dropped', 'sampled', 'overflow'):
+      for level, count in sorted(counters[kind].items()):
+        text += kind + ' ' + level + ': ' + str(count) + '; '
+    if(not text):
+      return(None)
+    text = 'messages discarded, not written. ' + text.rstrip('; ')
+    print('sys_log ' + text)
+    now_ns, stamp_mod = self.make_stamp_mod(self.module)
+    seconds = now_ns // 1000000000
+    partition = self._partition_key(seconds, stamp_mod)
+    return(stamp_mod, self.log_record(partition, 'INFO', 'sys_log', text, 
+                                      seconds))
+    
+    
+  def log_message(self, locator, message_level, message, exception,
+                  module=None):
     """
-    The granularity of time stamp used is seconds vs. milliseconds.
     Inbound messages are time stamped and this stamp is used as a
     component of a key (i.e., dictionary, DynamoDB table sort key). 
-    As the sort key must be unique, a 1 second time delay is 
-    introduced to avoid conflicts.  Revisit this if you have an
-    application that will generate a high volume of closely-timed
-    systme log messages (i.e., the delay will be a performance
-    so switch to milliseconds and remove the delay)
+    The sort key must be unique; see make_stamp_mod() for how that is
+    achieved without delaying the caller.
 
     Args:
       locator (str):        req; location inside module (source code)
       message_level (str):  req; 'INFO', 'WARN', 'ALARM', or 'ERROR' 
       message (str):        opt; free form error message or empty str
       exception(Exception): opt; Exception object or empty string
+      module (str):         opt; tags the record with another module name
+                            than the object's (see log_handle)
       
+    Safe to call from several threads.  When background flushing is on
+    this method only buffers the message and, if a threshold has been
+    passed, signals the flusher thread; it never waits on DynamoDB.
+    
+    Messages below min_level, or not chosen by sampling, are counted 
+    and discarded before any other work is done (True is returned); an
+    inoperable object (see init_issues) rejects them like any other.
+    When max_buffered_records / max_buffered_bytes is set, the 
+    overflow_policy decides what happens once a cap is reached; a 
+    message dropped for lack of room returns False.
+
     Returns:
       True  successfully processed system log message
       False error occured processing system log message
     """
     results = False
-    if(not self.init_issues):
+    if(self.metrics is not None):
+      started = self.time.perf_counter()
+    if(self.init_issues):
+      self.run_issues.append('sys_log() object invalid / inoperable')
+      print('sys_log() object invalid / inoperable')
+    elif(self._filtering and self._filtered(locator, message_level)):
+      results = True
+    else:
+      if(module is None):
+        module = self.module
       a_message_core = self.message_core(locator, message_level, message, 
                                        exception, self.MESSAGE_TYPES)
-      if(not a_message_core.issues):   
-        self.time.sleep(1)
-        now = self.datetime.now()
-        timestamp = int(now.timestamp()) #converts millisecons to seconds
-        if(self.TZ_OFFSET >= 0):
-          local = now - self.timedelta(hours=self.TZ_OFFSET)    #UTC -> local
-        else:
-          local = now + self.timedelta(hours=self.TZ_OFFSET)    #UTC -> local
-        date = str(local.year) + '-' + str(local.month).zfill(2)
-        date += '-' + str(local.day).zfill(2)
-        stamp_mod = str(timestamp) + '+' + self.module
-        
-        #all pieces valid; assemble message, store in dict holding all messages
-        message = (a_message_core.message_level + ': (' + 
-                   a_message_core.locator + ') ' + 
-                   a_message_core.message)
-        if(self.MESSAGE_TYPES[a_message_core.message_level] < 
-           self.MESSAGE_TYPES['ALARM']):
-          expiration = timestamp + self.TTL
-          self.info_messages[stamp_mod] = {'date' : date,
-                                           'message' : message,
-                                           'expiry' : expiration}
-        else:
-          self.error_messages[stamp_mod] = {'date' : date,
-                                            'message' : message}
+      if((not a_message_core.issues) and 
+         (self._coalesce_index is not None) and
+         self._coalesce(a_message_core, module)):
         results = True
+      elif(not a_message_core.issues):   
+        now_ns, stamp_mod = self.make_stamp_mod(module)
+        timestamp = now_ns // 1000000000
+        level = a_message_core.message_level
+        
+        #all pieces valid; buffer a compact record, rendered at flush time
+        partition = self._partition_key(timestamp, stamp_mod)
+        stack = None
+        if((self.traceback_frames is not None) and 
+           (a_message_core.exception_type is not None)):
+          stack = self._capture_stack(exception)
+        record = self.log_record(partition, level, a_message_core.locator, 
+                                 a_message_core.message, timestamp,
+                                 a_message_core.exception_type, stack)
+        size = self._record_size(stamp_mod, record)
+        if(self._bounded and (self.overflow_policy in ('flush', 'block'))):
+          self._wait_for_room(size)
+        with self.lock:
+          if((not self._bounded) or self._make_room(level, size)):
+            if(self.MESSAGE_TYPES[level] < self.MESSAGE_TYPES['ALARM']):
+              self.info_messages[stamp_mod] = record
+              if(self._bounded):
+                self._info_order.append(stamp_mod)
+            else:
+              self.error_messages[stamp_mod] = record
+            if(self.spool is not None):
+              self.spool.append(self._spool_entry(stamp_mod, record))
+            self._buffered_bytes += size
+            if(self._coalesce_index is not None):
+              index = self._coalesce_index
+              key   = (module, level, record.locator, record.text)
+              index[key] = (stamp_mod, record)
+              index.move_to_end(key)
+              if(len(index) > self.coalesce_max_keys):
+                index.popitem(last=False)
+            if(self._oldest is None):
+              self._oldest = self.time.monotonic()
+            if((self._routes is not None) and (level in self._alert_levels)):
+              self._queue_alert(record, module)
+            if((self._flusher is not None) and 
+               ((len(self.info_messages) + len(self.error_messages) >= 
+                 self.flush_max_records) or 
+                (self._buffered_bytes >= self.flush_max_bytes))):
+              self._flush_needed.set()
+            results = True
       else:
         self.run_issues.append('One or more message_core() elements invalid')
         print('One or more message_core() elements invalid')      
-    else:
-      self.run_issues.append('sys_log() object invalid / inoperable')
-      print('sys_log() object invalid / inoperable')
       
+    if(self.metrics is not None):
+      self.metrics.observe('log_message_latency', 
+                           (self.time.perf_counter() - started) * 1000000,
+                           'Microseconds')
     return(results)
     
        
-  def save_messages_to_db(self):
+  def _capture_stack(self, exception):
+    """
+    Record the code locations of the innermost traceback_frames frames
+    of an exception's traceback.  No source is read and no frame is 
+    kept alive; see _render_traceback().
+    
+    Returns:
+      (((file, line number, function), ...), frames left out, 
+       str(exception)) or None
+    """
+    if(exception.__traceback__ is None):
+      return(None)
+    frames = [(frame.f_code.co_filename, line, frame.f_code.co_name)
+              for frame, line in self.traceback.walk_tb(
+                                   exception.__traceback__)]
+    omitted = max(0, len(frames) - self.traceback_frames)
+    return((tuple(frames[omitted:]), omitted, str(exception)))
+    
+    
+  def _fingerprint(self, record):
+    """
+    Returns:
+      hash of a record's exception type and captured code locations
+    """
+    frames = record.stack[0]
+    text = record.exception_type + '|' + '|'.join(
+             file + ':' + function + ':' + str(line) 
+             for file, line, function in frames)
+    return(self.hashlib.sha256(text.encode('utf-8')).hexdigest()[:24])
+    
+    
+  def _render_traceback(self, record):
+    """
+    Format a captured stack the way the traceback module does, looking
+    up source lines now
+    """
+    frames, omitted, exception_text = record.stack
+    text = 'Traceback (most recent call last):\n'
+    if(omitted):
+      text += '  ... ' + str(omitted) + ' outer frames not captured\n'
+    text += ''.join(self.traceback.StackSummary.from_list(
+                      [self.traceback.FrameSummary(file, line, function)
+                       for file, line, function in frames]).format())
+    return(text + record.exception_type + ': ' + exception_text)
+    
+    
+  def _traceback_items(self, records):
+    """
+    Returns:
+      [(table name, DynamoDB item)] a traceback item for every 
+      fingerprint among the (stamp_mod, log_record) pairs not yet 
+      written today by this process
+    """
+    requests = []
+    with self.lock:
+      for key, record in records:
+        if(record.stack is None):
+          continue
+        day         = record.date.split('#')[0]
+        fingerprint = self._fingerprint(record)
+        if((day, fingerprint) in self._tracebacks):
+          continue
+        if(len(self._tracebacks) >= 4096):
+          self._tracebacks.clear()
+        self._tracebacks.add((day, fingerprint))
+        item = {'date': day, 'stamp_mod': 'traceback#' + fingerprint,
+                'message': self._render_traceback(record),
+                'fingerprint': fingerprint, 
+                'exception_type': record.exception_type,
+                'module': key.split('+')[1], 'first_seen': record.seconds}
+        if(self.traceback_table == getattr(self, 'info_table', None)):
+          item['expiry'] = record.seconds + self.TTL
+        if(self._oversized(item['message'])):
+          self.log_codec.encode_message(item, 'TRACEBACK: ', 
+                                        self.compress_threshold,
+                                        self.compression, 
+                                        self.max_item_bytes)
+        requests.append((self.traceback_table, item))
+    return(requests)
+    
+    
+  def _traceback_failures(self, failed):
+    """
+    Forget fingerprints whose traceback item failed to be written, so
+    the next flush writes it again
+    """
+    fingerprints = set(key[len('traceback#'):] for key in failed 
+                       if(key.startswith('traceback#')))
+    if(fingerprints):
+      with self.lock:
+        self._tracebacks = set(written for written in self._tracebacks
+                               if(written[1] not in fingerprints))
+          
+          
+  def _queue_alert(self, record, module):
+    """
+    Queue a just buffered record for every topic its alert routes name.
+    Callers must hold self.lock.
+    """
+    arns = []
+    for levels, modules, locators, topic_arns in self._routes:
+      if((record.level in levels) and 
+         ((modules is None) or (module in modules)) and
+         ((locators is None) or (record.locator in locators))):
+        arns += [arn for arn in topic_arns if(arn not in arns)]
+    if(arns):
+      self._alerts.append((arns, module, record))
+      if(self._flusher is not None):
+        self._flush_needed.set()
+        
+        
+  def _take_alerts(self):
+    """
+    Returns:
+      [{}] send_alerts params for every queued alert; the queue is emptied
+    """
+    with self.lock:
+      alerts, self._alerts = self._alerts, []
+    return([{'channel': 'sns', 'message': '[' + module + '] ' + 
+             record.message, 'topic_arns': arns} 
+            for arns, module, record in alerts])
+            
+            
+  def _send_alerts(self, params):
+    """
+    Send queued alerts (see _take_alerts()) with send_alerts, all at 
+    once.  Issues are added to run_issues.
+    """
+    try:
+      options = dict(self.alert_options)
+      options.setdefault('concurrent', True)
+      options.setdefault('metrics', self.metrics)
+      alert = self.send_alerts.send_alerts(params, **options)
+      self.alert_results = alert.results
+      for issue in alert.issues:
+        self.run_issues.append('Alert escalation issue. ' + issue)
+    except Exception as e:
+      self.run_issues.append('Exception thrown sending alerts. ' +
+                             'Exception: ' + str(e))
+      print('Exception thrown sending alerts. Exception: ' + str(e))
+      
+      
+  def _start_alerts(self):
+    """
+    Start sending every queued alert on a separate thread, so it runs 
+    alongside the DynamoDB write.
+    
+    Returns:
+      the thread to join, or None if nothing was queued
+    """
+    if(self._routes is None):
+      return(None)
+    params = self._take_alerts()
+    if(not params):
+      return(None)
+    thread = self.threading.Thread(target=self._send_alerts, args=(params,),
+                                   name='sys_log-alerts', daemon=True)
+    thread.start()
+    return(thread)
+    
+    
+  def _sink_entry(self, key, record):
+    """
+    Render one buffered record as a sink entry (see log_sinks)
+    """
+    entry = {'date': record.date, 'stamp_mod': key, 
+             'module': key.split('+')[1], 'level': record.level,
+             'locator': record.locator, 'message': record.text,
+             'timestamp': record.seconds}
+    if(record.exception_type):
+      entry['exception_type'] = record.exception_type
+    if(record.stack is not None):
+      entry['fingerprint'] = self._fingerprint(record)
+    if(record.count > 1):
+      entry['count']      = record.count
+      entry['first_seen'] = record.seconds
+      entry['last_seen']  = record.last_seen
+    return(entry)
+    
+    
+  def _write_sink(self, sink, entries, failed):
+    """
+    Body of a sink thread.  Counts are added to sys_log.sink_reports.
+    """
+    try:
+      report = sink.write(entries, failed)
+    except Exception as e:
+      report = {'written': 0, 'failed': len(entries)}
+      failed.extend(entry['stamp_mod'] for entry in entries)
+      print('Exception thrown writing to ' + str(sink.name) + 
+            ' sink. Exception: ' + str(e))
+    if(report['failed']):
+      self.run_issues.append('Failed to write ' + str(report['failed']) +
+                             ' messages to ' + str(sink.name) + ' sink')
+      print('Failed to write ' + str(report['failed']) + ' messages to ' +
+            str(sink.name) + ' sink')
+    with self.lock:
+      totals = self.sink_reports.setdefault(sink.name, 
+                                            {'written': 0, 'failed': 0})
+      totals['written'] += report['written']
+      totals['failed']  += report['failed']
+    if(self.metrics is not None):
+      self.metrics.increment('sink_items_written', report['written'],
+                             dimensions={'Sink': sink.name})
+      self.metrics.increment('sink_items_failed', report['failed'],
+                             dimensions={'Sink': sink.name})
+                             
+                             
+  def _start_sinks(self, error_messages, info_messages):
+    """
+    Start writing the supplied buffers to every sink, each on its own
+    thread, so they run alongside the DynamoDB write.  When 
+    dynamodb_levels is set, records at other levels are removed from 
+    the buffers (copies are made) before they are returned.
+    
+    Returns:
+      (error_messages, info_messages, started) where started is passed
+      on to _finish_sinks()
+    """
+    threads, skipped = [], []
+    records = list(error_messages.items()) + list(info_messages.items())
+    for sink in self.sinks:
+      entries = [self._sink_entry(key, record) for key, record in records
+                 if(sink.accepts(record.level))]
+      if(entries):
+        failed = []
+        thread = self.threading.Thread(target=self._write_sink, 
+                                       args=(sink, entries, failed),
+                                       name='sys_log-sink', daemon=True)
+        thread.start()
+        threads.append((thread, failed))
+    levels = self._dynamodb_levels
+    if(levels is not None):
+      skipped = [key for key, record in records 
+                 if(record.level not in levels)]
+      error_messages = {key: record for key, record in error_messages.items()
+                        if(record.level in levels)}
+      info_messages  = {key: record for key, record in info_messages.items()
+                        if(record.level in levels)}
+    return(error_messages, info_messages, (threads, skipped))
+    
+    
+  def _finish_sinks(self, started, deadline=None):
+    """
+    Wait for the sink threads started by _start_sinks(), then 
+    acknowledge, in the spool, the records DynamoDB was not given that 
+    every sink taking them wrote.
+    
+    Returns:
+      True  if no sink writes failed
+      False otherwise
+    """
+    threads, skipped = started
+    failed = set()
+    for thread, keys in threads:
+      thread.join(None if(deadline is None) else 
+                  max(0, deadline - self.time.monotonic()))
+      if(thread.is_alive()):
+        return(False)
+      failed.update(keys)
+    if((self.spool is not None) and skipped):
+      self.spool.ack([key for key in skipped if(key not in failed)])
+    return(not failed)
+    
+    
+  def _plan_batches(self, requests):
+    """
+    Group (table name, item) pairs into BatchWriteItem RequestItems of
+    up to 25 items each; a request may span both tables.
+    
+    Returns:
+      ({table name: {'written': 0, 'failed': 0}}, [RequestItems])
+    """
+    report  = {}
+    batches = []
+    for table, item in requests:
+      report.setdefault(table, {'written': 0, 'failed': 0})
+    for start in range(0, len(requests), self.BATCH_SIZE):
+      pending = {}
+      for table, item in requests[start:start + self.BATCH_SIZE]:
+        pending.setdefault(table, []).append({'PutRequest': {'Item': item}})
+      batches.append(pending)
+    return(report, batches)
+    
+    
+  def _give_up(self, pending, report, failed):
+    """
+    Count every put request still in pending as failed and, when a 
+    'failed' list is supplied, add the stamp_mod of each to it.
+    """
+    for table, puts in pending.items():
+      report[table]['failed'] += len(puts)
+      if(failed is not None):
+        failed.extend(put['PutRequest']['Item']['stamp_mod'] for put in puts)
+        
+        
+  def _batch_steps(self, pending, report, deadline=None, failed=None):
+    """
+    Retry logic for one BatchWriteItem request, written as a generator
+    so the blocking and the asyncio drivers share it.  The generator 
+    yields ('write', RequestItems) and expects (response, exception) 
+    back, or yields ('sleep', seconds) and expects None back.
+    
+    Items that DynamoDB hands back as UnprocessedItems, and requests 
+    that raise an exception (e.g., throttling), are retried with 
+    jittered exponential backoff until MAX_BATCH_RETRIES is spent. Once
+    the deadline (if any) has passed, nothing more is sent and the 
+    remaining items are counted as failed in report (and their keys
+    added to the 'failed' list, if one is supplied).
+    """
+    attempt = 0
+    while(pending):
+      if((deadline is not None) and (self.time.monotonic() >= deadline)):
+        self._give_up(pending, report, failed)
+        break
+      sent = {table: len(puts) for table, puts in pending.items()}
+      resp, e = yield('write', pending)
+      if(e is None):
+        unprocessed = resp.get('UnprocessedItems', {}) or {}
+        if(unprocessed and (self.metrics is not None)):
+          self.metrics.increment('throttles')
+      else:
+        if((self.metrics is not None) and 
+           (('Throttl' in str(e)) or ('ProvisionedThroughput' in str(e)))):
+          self.metrics.increment('throttles')
+        unprocessed = pending
+        self.run_issues.append('Exception thrown writing batch to ' +
+                               'DynamoDB.  Exception: ' + str(e))
+        print('Exception thrown writing batch to DynamoDB.  Exception: ' +
+              str(e))
+      for table, count in sent.items():
+        report[table]['written'] += count - len(unprocessed.get(table, []))
+      pending = {table: puts for table, puts in unprocessed.items() if puts}
+      if(pending):
+        if(attempt >= self.MAX_BATCH_RETRIES):
+          self._give_up(pending, report, failed)
+          break
+        backoff = min(self.BACKOFF_CAP, self.BACKOFF_BASE * (2 ** attempt))
+        backoff = self.random.uniform(0, backoff)
+        if(deadline is not None):
+          backoff = min(backoff, max(0, deadline - self.time.monotonic()))
+        if(self.metrics is not None):
+          self.metrics.increment('batch_retries')
+        yield('sleep', backoff)
+        attempt += 1
+        
+        
+  def _batch_write(self, dynamo_db_access, requests, deadline=None,
+                   failed=None):
+    """
+    Write (table name, item) pairs to DynamoDB using BatchWriteItem, one
+    request after another.  See _plan_batches() and _batch_steps().
+    
+    Args:
+      dynamo_db_access: boto3 DynamoDB service resource (or stand-in)
+      requests [(str, {})]: table name and item pairs to write
+      deadline (float):     opt; time.monotonic() value to stop by
+      failed   [str]:       opt; receives the stamp_mod of failed items
+      
+    Returns:
+      {table name: {'written': int, 'failed': int}}
+    """
+    report, batches = self._plan_batches(requests)
+    for pending in batches:
+      steps = self._batch_steps(pending, report, deadline, failed)
+      reply = None
+      try:
+        while(True):
+          action, arg = steps.send(reply)
+          if(action == 'sleep'):
+            self.time.sleep(arg)
+            reply = None
+          else:
+            try:
+              reply = (dynamo_db_access.batch_write_item(RequestItems=arg), 
+                       None)
+            except Exception as e:
+              reply = (None, e)
+      except StopIteration:
+        pass
+    return(report)
+    
+    
+  async def _batch_write_async(self, dynamo_db_access, requests, 
+                               deadline=None, failed=None):
+    """
+    Same as _batch_write() except every BatchWriteItem request is in 
+    flight at the same time, each on the aws_clients async layer.
+    """
+    import asyncio              #already loaded by the caller's event loop
+    report, batches = self._plan_batches(requests)
+    
+    async def drive(pending):
+      steps = self._batch_steps(pending, report, deadline, failed)
+      reply = None
+      try:
+        while(True):
+          action, arg = steps.send(reply)
+          if(action == 'sleep'):
+            await asyncio.sleep(arg)
+            reply = None
+          else:
+            try:
+              reply = (await self.aws_clients.call_async(
+                         dynamo_db_access.batch_write_item, RequestItems=arg),
+                       None)
+            except Exception as e:
+              reply = (None, e)
+      except StopIteration:
+        pass
+        
+    await asyncio.gather(*[drive(pending) for pending in batches])
+    return(report)
+    
+       
+  def _build_requests(self, error_messages, info_messages, extra=None):
+    """
+    Args:
+      error_messages, info_messages: buffers to render
+      extra: opt; additional (stamp_mod, log_record) for the info table
+      
+    Returns:
+      [(table name, DynamoDB item)] for the supplied buffers (same 
+      layout as sys_log.error_messages and sys_log.info_messages: 
+      stamp_mod -> log_record)
     """
-    Write all log messages stored in sys_log's buffers to DynamoDB
+    requests = []
+    for key, record in error_messages.items():
+      requests.append((self.errors_table, self._item(key, record, False)))
+    for key, record in info_messages.items():
+      requests.append((self.info_table, self._item(key, record, True)))
+    if(extra is not None):
+      requests.append((self.info_table, self._item(extra[0], extra[1], True)))
+    if(self.traceback_frames is not None):
+      requests += self._traceback_items(list(error_messages.items()) + 
+                                        list(info_messages.items()))
+    return(requests)
+    
+    
+  def _oversized(self, message):
+    """
+    True if a message is over compress_threshold, or half of 
+    max_item_bytes, in UTF-8 bytes and so must go through 
+    log_codec.encode_message().  It is only encoded to be measured when
+    its character count leaves room for doubt.
+    """
+    limit = self.max_item_bytes // 2
+    if(self.compress_threshold is not None):
+      limit = min(limit, self.compress_threshold)
+    return((len(message) * 4 > limit) and            #<= 4 bytes per char
+           (len(message.encode('utf-8')) > limit))
+           
+           
+  def _item(self, key, record, info):
+    """
+    Render one buffered record as a DynamoDB item.  Coalesced records 
+    also carry 'count', 'first_seen' and 'last_seen' (epoch seconds);
+    structured attributes are added unless structured is False.
+    Large messages are compressed / truncated (see log_codec).
+    
+    Args:
+      key    (str):        stamp_mod sort key
+      record (log_record): buffered record
+      info   (bool):       True for the info table (adds 'expiry')
+    """
+    item = {'date': record.date, 'stamp_mod': key, 'message': record.message}
+    if(info):
+      item['expiry'] = record.seconds + self.TTL
+    if(self.structured):
+      module = key.split('+')[1]
+      item['level']   = record.level
+      item['module']  = module
+      item['locator'] = record.locator
+      if(record.exception_type):
+        item['exception_type'] = record.exception_type
+      if(self._indexed[info]):
+        item['module_level'] = module + '#' + record.level
+    if(record.stack is not None):
+      item['fingerprint'] = self._fingerprint(record)
+    if(record.count > 1):
+      item['count']      = record.count
+      item['first_seen'] = record.seconds
+      item['last_seen']  = record.last_seen
+    if(self._oversized(item['message'])):
+      self.log_codec.encode_message(item, record.level + ': (' + 
+                                    record.locator + ') ', 
+                                    self.compress_threshold, 
+                                    self.compression, self.max_item_bytes)
+    return(item)
+    
+    
+  def _check_report(self, report):
+    """
+    Record an issue for every table with failed writes.
+    
+    Returns:
+      True  if no writes failed
+      False otherwise
+    """
+    results = True
+    for table, counts in report.items():
+      if(counts['failed']):
+        results = False
+        self.run_issues.append('Failed to write ' + str(counts['failed']) +
+                               ' messages to DynamoDB table ' + table)
+        print('Failed to write ' + str(counts['failed']) + 
+              ' messages to DynamoDB table ' + table)
+    return(results)
+    
+    
+  def _ack_spool(self, requests, failed):
+    """
+    Acknowledge, in the spool, every written item that did not fail
+    """
+    if(self.spool is not None):
+      failed = set(failed)
+      self.spool.ack([item['stamp_mod'] for table, item in requests 
+                      if(item['stamp_mod'] not in failed)])
+      
+      
+  def _spool_entry(self, key, record):
+    entry = {'k': key, 'd': record.date, 'l': record.level, 
+             'c': record.locator, 'x': record.text, 's': record.seconds}
+    if(record.count > 1):
+      entry['n'] = record.count
+      entry['z'] = record.last_seen
+    if(record.exception_type):
+      entry['t'] = record.exception_type
+    if(record.stack is not None):
+      entry['f'] = [list(frame) for frame in record.stack[0]]
+      entry['o'] = record.stack[1]
+      entry['e'] = record.stack[2]
+    return(entry)
+            
+            
+  def _replay_spool(self):
+    """
+    Put every spooled, never acknowledged message (e.g., left behind by
+    an invocation that timed out) back into the buffers so the next 
+    flush delivers it.  Caps set by max_buffered_records / 
+    max_buffered_bytes are not applied to replayed messages.
+    """
+    try:
+      entries = self.spool.pending()
+    except Exception as e:
+      entries = []
+      self.run_issues.append('Could not read spool. Exception: ' + str(e))
+      print('Could not read spool. Exception: ' + str(e))
+    with self.lock:
+      for entry in entries:
+        key    = entry['k']
+        stack  = None
+        if(('f' in entry) and entry.get('t')):
+          stack = (tuple(tuple(frame) for frame in entry['f']), entry['o'],
+                   entry.get('e', ''))
+        record = self.log_record(entry['d'], entry['l'], entry['c'], 
+                                 entry['x'], entry['s'], entry.get('t'),
+                                 stack)
+        if('n' in entry):
+          record.count     = entry['n']
+          record.last_seen = entry['z']
+        if(self.MESSAGE_TYPES.get(record.level, self.MESSAGE_TYPES['ERROR']) <
+           self.MESSAGE_TYPES['ALARM']):
+          self.info_messages[key] = record
+          if(self._bounded):
+            self._info_order.append(key)
+        else:
+          self.error_messages[key] = record
+        self._buffered_bytes += self._record_size(key, record)
+        if(self._oldest is None):
+          self._oldest = self.time.monotonic()
+    if(entries):
+      print('Replayed ' + str(len(entries)) + ' spooled messages')
+      
+      
+  def _connection_issue(self, e):
+    self.run_issues.append('Could not connect to DynamoDB service. ' +
+                           'Exception: ' + str(e))
+    print('Could not connect to DynamoDB.  Exception: ' + str(e))
+    
+    
+  def _record_flush(self, started, buffered, report):
+    """
+    Record the metrics of one flush and print every metric collected 
+    since the previous flush as CloudWatch EMF lines.
+    
+    Args:
+      started  (float): time.perf_counter() value when the flush began
+      buffered (int):   records taken from the buffers
+      report   ({}):    per table written / failed counts
+    """
+    metrics = self.metrics
+    metrics.observe('flush_duration', 
+                    (self.time.perf_counter() - started) * 1000)
+    metrics.gauge('buffer_depth', buffered)
+    metrics.increment('items_written', 
+                      sum(counts['written'] for counts in report.values()))
+    metrics.increment('items_failed', 
+                      sum(counts['failed'] for counts in report.values()))
+    metrics.emit()
+    
+    
+  def _write_messages(self, error_messages, info_messages, 
+                      dynamo_db_access=None, deadline=None, failed=None):
+    """
+    Write the supplied buffers (same layout as sys_log.error_messages
+    and sys_log.info_messages) to DynamoDB.
+    
+    Args:
+      failed [str]: opt; receives the stamp_mod of every item DynamoDB
+                    was given but did not accept
+    
+    Returns:
+      (bool, {}) success flag and per table written / failed counts
+    """
+    results = True
+    report = {}
+    if(self.metrics is not None):
+      started = self.time.perf_counter()
+    buffered = len(error_messages) + len(info_messages)
+    sinks    = None
+    if(self.sinks or (self._dynamodb_levels is not None)):
+      error_messages, info_messages, sinks = self._start_sinks(
+                                               error_messages, info_messages)
+    requests = self._build_requests(error_messages, info_messages,
+                                    self._counter_record())
+    if(failed is None):
+      failed = []
+    if(requests):
+      try:
+        if(dynamo_db_access is None):
+          dynamo_db_access = self.aws_clients.get_resource('dynamodb')
+        report = self._batch_write(dynamo_db_access, requests, deadline, 
+                                   failed)
+        results = self._check_report(report)
+        self._ack_spool(requests, failed)
+        if(self.traceback_frames is not None):
+          self._traceback_failures(failed)
+      except Exception as e:
+        results = False
+        self._connection_issue(e)
+        del failed[:]
+        failed.extend(item['stamp_mod'] for table, item in requests)
+        if(self.traceback_frames is not None):
+          self._traceback_failures(failed)
+    if((sinks is not None) and (not self._finish_sinks(sinks, deadline))):
+      results = False
+    if(self.metrics is not None):
+      self._record_flush(started, buffered, report)
+    return(results, report)
+    
+    
+  def save_messages_to_db(self, dynamo_db_access=None):
+    """
+    Write all log messages stored in sys_log's buffers to DynamoDB.
+    Messages destined for both tables are written together in batches
+    (see _batch_write()).  Per table counts of written and failed items 
+    are left in sys_log.flush_report.  The buffers are left as is; call
+    reset() to clear them.  Queued alerts (see alert_routes) are sent, 
+    and sinks written, at the same time; alerts are removed from the 
+    queue.  Counts and failures of overflow drains (see _wait_for_room())
+    since the previous call are included.
+    
+    Args:
+      dynamo_db_access: opt; DynamoDB service resource to use instead of
+                        the object's (see __init__()) or the shared one
+                        from aws_clients (e.g., a local stub); later 
+                        overflow drains use it too
+    
+    Returns:
+      True  if no errors were encountered
+      False if an error was encountered
+    """
+    if(dynamo_db_access is None):
+      dynamo_db_access = self._flush_resource
+    else:
+      self._flush_resource = dynamo_db_access
+    alerts = self._start_alerts()
+    with self.lock:
+      error_messages = dict(self.error_messages)
+      info_messages  = dict(self.info_messages)
+      self.sink_reports = {}
+    results, report = self._write_messages(error_messages, info_messages,
+                                           dynamo_db_access)
+    self.flush_report, self._early_report = self._early_report, {}
+    self._add_report(self.flush_report, report)
+    if(self._drain_failed and (self._flusher is None)):
+      results = False
+      self._drain_failed = False
+    if(alerts is not None):
+      alerts.join()
+    return(results)
+    
+    
+  async def log_message_async(self, locator, message_level, message, 
+                              exception):
+    """
+    asyncio counterpart of log_message().  Buffering never waits on the
+    network, so this simply calls log_message().
+    """
+    return(self.log_message(locator, message_level, message, exception))
+    
+    
+  async def save_messages_to_db_async(self, dynamo_db_access=None):
+    """
+    asyncio counterpart of save_messages_to_db().  All BatchWriteItem 
+    requests are sent concurrently instead of one after another.
     
     Returns:
       True  if no errors were encountered
       False if an error was encountered
     """
+    import asyncio              #already loaded by the caller's event loop
+    if(dynamo_db_access is None):
+      dynamo_db_access = self._flush_resource
+    else:
+      self._flush_resource = dynamo_db_access
     results = True
-    try:
-      dynamo_db_access = self.boto3.resource('dynamodb')     
-      if(self.error_messages):
+    self.flush_report, self._early_report = self._early_report, {}
+    if(self._drain_failed and (self._flusher is None)):
+      results = False
+      self._drain_failed = False
+    if(self.metrics is not None):
+      started = self.time.perf_counter()
+    with self.lock:
+      error_messages = dict(self.error_messages)
+      info_messages  = dict(self.info_messages)
+      self.sink_reports = {}
+    buffered = len(error_messages) + len(info_messages)
+    sinks    = None
+    if(self.sinks or (self._dynamodb_levels is not None)):
+      error_messages, info_messages, sinks = self._start_sinks(
+                                               error_messages, info_messages)
+    requests = self._build_requests(error_messages, info_messages,
+                                    self._counter_record())
+    params   = self._take_alerts() if(self._routes is not None) else None
+    alerts   = None
+    if(params):
+      alerts = asyncio.ensure_future(self.aws_clients.call_async(
+                                       self._send_alerts, params))
+    if(requests):
+      try:
+        if(dynamo_db_access is None):
+          dynamo_db_access = self.aws_clients.get_resource('dynamodb')
+        failed = []
+        report = await self._batch_write_async(dynamo_db_access, requests,
+                                               None, failed)
+        self._add_report(self.flush_report, report)
+        results = self._check_report(report) and results
+        self._ack_spool(requests, failed)
+        if(self.traceback_frames is not None):
+          self._traceback_failures(failed)
+      except Exception as e:
+        results = False
+        self._connection_issue(e)
+        if(self.traceback_frames is not None):
+          self._traceback_failures([item['stamp_mod'] 
+                                    for table, item in requests])
+    if(alerts is not None):
+      await alerts
+    if((sinks is not None) and 
+       (not await self.aws_clients.call_async(self._finish_sinks, sinks))):
+      results = False
+    if(self.metrics is not None):
+      self._record_flush(started, buffered, self.flush_report)
+    return(results)
+    
+    
+  def _requeue(self, error_messages, info_messages, failed):
+    """
+    Put the records a drain could not write back into the buffers so 
+    the next flush retries them.  ALARM / ERROR records go back first 
+    and always; INFO / WARN records only while max_buffered_records / 
+    max_buffered_bytes leave room, the rest are counted in 
+    counters['overflow'].  Requeued records are already spooled, and 
+    they are the first INFO / WARN records evicted.
+    
+    Args:
+      error_messages, info_messages: buffers handed to the drain
+      failed [str]: stamp_mod of the records that were not written
+    """
+    failed  = set(failed)
+    counter = self.counters['overflow']
+    evicted = []
+    with self.lock:
+      requeued = [key for key in error_messages if(key in failed)]
+      for key in requeued:
+        record = error_messages[key]
+        self.error_messages[key] = record
+        self._buffered_bytes    += self._record_size(key, record)
+      info_keys = []
+      for key, record in info_messages.items():
+        if(key not in failed):
+          continue
+        size = self._record_size(key, record)
+        if(self._bounded and self._over_limit(size)):
+          counter[record.level] = counter.get(record.level, 0) + 1
+          evicted.append(key)
+          continue
+        self.info_messages[key] = record
+        self._buffered_bytes   += size
+        info_keys.append(key)
+      if(self._bounded):
+        self._info_order.extendleft(reversed(info_keys))
+      if((requeued or info_keys) and (self._oldest is None)):
+        self._oldest = self.time.monotonic()   #retry after flush_max_age
+      if(evicted and (self.spool is not None)):
+        self.spool.ack(evicted)
+    if(evicted):
+      self.run_issues.append('Buffer limit reached; ' + str(len(evicted)) +
+                             ' unwritten messages dropped (see counters)')
+      print('Buffer limit reached; ' + str(len(evicted)) + 
+            ' unwritten messages dropped (see counters)')
+            
+            
+  def _add_report(self, totals, report):
+    """
+    Add per table written / failed counts in report to those in totals
+    """
+    for table, counts in report.items():
+      total = totals.setdefault(table, {'written': 0, 'failed': 0})
+      total['written'] += counts['written']
+      total['failed']  += counts['failed']
+      
+      
+  def _drain(self, deadline=None, totals=None):
+    """
+    Remove everything from the buffers and write it to DynamoDB, and 
+    send queued alerts.  Counts are added to totals (default 
+    sys_log.flush_report).
+    Records that could not be written are put back into the buffers 
+    (see _requeue()) and the failure is remembered for 
+    stop_background_flush().
+    
+    Returns:
+      True  if no errors were encountered
+      False if an error was encountered
+    """
+    alerts = self._start_alerts()
+    with self.lock:
+      error_messages = self.error_messages
+      info_messages  = self.info_messages
+      self._clear_buffers()
+    failed = []
+    results, report = self._write_messages(error_messages, info_messages,
+                        self._flush_resource, deadline, failed)
+    if(failed):
+      self._requeue(error_messages, info_messages, failed)
+    if(not results):
+      self._drain_failed = True
+    if(alerts is not None):
+      alerts.join(None if(deadline is None) else 
+                  max(0, deadline - self.time.monotonic()))
+    self._add_report(self.flush_report if(totals is None) else totals, 
+                     report)
+    return(results)
+    
+    
+  def _background_flush(self):
+    """
+    Body of the flusher thread.  Wakes when log_message() signals that
+    a count / size threshold was passed, or when the oldest buffered
+    message reaches flush_max_age seconds.
+    """
+    while(not self._flush_stop.is_set()):
+      with self.lock:
+        oldest = self._oldest
+      if(oldest is None):
+        wait_for = self.flush_max_age
+      else:
+        wait_for = oldest + self.flush_max_age - self.time.monotonic()
+      if(wait_for > 0):
+        self._flush_needed.wait(wait_for)
+      if(self._flush_stop.is_set()):
+        break
+      with self.lock:
+        due = ((self._oldest is not None) and
+               (self._flush_needed.is_set() or 
+                (self.time.monotonic() - self._oldest >= self.flush_max_age)))
+        if(self._oldest is None):
+          self._flush_needed.clear()          #nothing to drain; sleep again
+      if(due):
         try:
-          table = dynamo_db_access.Table(self.errors_table)
-          for key, value in self.error_messages.items():
-            table.put_item(Item={'date' : value['date'], 
-                                 'stamp_mod' : key,
-                                 'message': value['message']})
+          self._drain()
         except Exception as e:
-          results = False
-          self.run_issues.append('Exception thrown connecting / writing to ' +
-            'error messages DynamoDB table.  Exception: ' + str(e))
-          print('Exception thrown connecting / writing to error messages ' + 
-                'DynamoDB table.  Exception: ' + str(e))
-      if(self.info_messages):
-        try:
-          table = dynamo_db_access.Table(self.info_table)
-          for key, value in self.info_messages.items():
-            table.put_item(Item={'date': value['date'],
-                                 'stamp_mod' : key, 
-                                 'message': value['message'], 
-                                 'expiry' : value['expiry']})
-        except:
-          results = False
-          self.run_issues.append('Exception thrown connecting / writing to ' +
-            'info messages DynamoDB table.  Exception: ' + str(e))
-          print('Exception thrown connecting / writing to info messages ' + 
-                'DynamoDB table.  Exception: ' + str(e))
-    except:
-      results = False
-      self.run_issues.append('Could not connect to DynamoDB service')
-      print('Could not connect to DynamoDB')
+          self.run_issues.append('Exception thrown by background flush. ' +
+                                 'Exception: ' + str(e))
+          print('Exception thrown by background flush. Exception: ' + str(e))
+          
+          
+  def start_background_flush(self, max_records=100, max_bytes=262144, 
+                             max_age=5.0, dynamo_db_access=None):
+    """
+    Start a daemon thread that drains the buffers to DynamoDB once they
+    hold max_records messages, max_bytes (approximate) bytes, or their 
+    oldest message is max_age seconds old.  Messages written by the 
+    flusher are removed from the buffers.
+    
+    Args:
+      max_records (int):   message count threshold
+      max_bytes   (int):   approximate size threshold
+      max_age     (float): age threshold in seconds
+      dynamo_db_access:    opt; DynamoDB service resource (e.g., a stub)
+      
+    Returns:
+      True  if the flusher is running
+      False if the sys_log object is inoperable
+    """
+    if(self.init_issues):
+      self.run_issues.append('sys_log() object invalid / inoperable')
+      print('sys_log() object invalid / inoperable')
+      return(False)
+    if(self._flusher is None):
+      self.flush_max_records = max_records
+      self.flush_max_bytes   = max_bytes
+      self.flush_max_age     = max_age
+      if(dynamo_db_access is not None):
+        self._flush_resource = dynamo_db_access
+      self.flush_report      = {}
+      self._drain_failed     = False
+      self._flush_stop.clear()
+      self._flusher = self.threading.Thread(target=self._background_flush,
+                                            name='sys_log-flush', daemon=True)
+      self._flusher.start()
+    return(True)
+    
+    
+  def _deadline(self, context, safety_margin):
+    """
+    Returns:
+      time.monotonic() value safety_margin seconds before the AWS Lambda
+      function times out, or None without a (usable) context
+    """
+    deadline = None
+    if(context is not None):
+      try:
+        deadline = (self.time.monotonic() + 
+                    context.get_remaining_time_in_millis() / 1000 - 
+                    safety_margin)
+      except Exception as e:
+        print('Could not read remaining time from context. ' + str(e))
+    return(deadline)
+    
+    
+  def stop_background_flush(self, context=None, safety_margin=0.5):
+    """
+    Stop the flusher thread and synchronously drain whatever is left. 
+    When an AWS Lambda context object is supplied, the final drain is 
+    given until safety_margin seconds before the function times out; 
+    messages that cannot be written by then are counted as failed and
+    left in the buffers.
+    
+    Args:
+      context:               opt; AWS Lambda context object
+      safety_margin (float): seconds to leave for the rest of the handler
       
+    Returns:
+      True  if no errors were encountered, by this or any earlier drain
+            since start_background_flush()
+      False if an error was encountered
+    """
+    deadline = self._deadline(context, safety_margin)
+    if(self._flusher is not None):
+      self._flush_stop.set()
+      self._flush_needed.set()
+      self._flusher.join(None if(deadline is None) else 
+                         max(0, deadline - self.time.monotonic()))
+      self._flusher = None
+    results = self._drain(deadline) and (not self._drain_failed)
+    self._drain_failed = False
     return(results)
\ No newline at end of file